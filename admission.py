@@ -0,0 +1,69 @@
+"""
+分析処理の前段に置くアドミッション制御（同時実行数の制限と上限付き待ち行列）
+
+過負荷時は全リクエストを遅くするのではなく、待ち行列が満杯になった時点で即座に拒否する。
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+class OverloadedError(Exception):
+    """待ち行列が満杯、または待ち時間が上限を超えた"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server is overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """同時実行数 max_concurrency、待ち行列 max_queue のアドミッション制御"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+        # 処理時間の指数移動平均（Retry-Afterの見積もり用）
+        self._average_service_time = 0.1
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def retry_after(self) -> int:
+        """現在の待ち行列が捌けるまでの見積もり秒数（最低1秒）"""
+        pending = self.waiting + self.active
+        return max(1, math.ceil(pending * self._average_service_time / self.max_concurrency))
+
+    @asynccontextmanager
+    async def admit(self):
+        """実行枠を確保する。確保できない場合はOverloadedErrorを送出"""
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise OverloadedError(self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise OverloadedError(self.retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._average_service_time = 0.8 * self._average_service_time + 0.2 * elapsed
+            self.active -= 1
+            semaphore.release()
@@ -0,0 +1,77 @@
+"""
+リクエスト本文のサイズ制限（ASGIミドルウェア）
+
+項目ごとの上限（進行数・1進行の文字数）だけでは投入全体の大きさは抑えられないため、
+本文をJSONとして解析する前にバイト数で打ち切る。
+"""
+
+import json
+
+
+class BodySizeLimitMiddleware:
+    """パスの接頭辞ごとにPOST本文のバイト数を制限し、超えたら413を返すASGIミドルウェア
+
+    Content-Length が上限を超えるリクエストは本文を読まずに拒否する。Content-Length の無い（chunked）本文は
+    読みながら数え、上限を超えた時点で読み込みを打ち切る（アプリ側の応答は破棄して413を返す）。
+    """
+
+    def __init__(self, app, limits: dict, enabled: bool = True):
+        self.app = app
+        self.limits = dict(limits)  # パスの接頭辞 -> 最大バイト数
+        self.enabled = enabled
+
+    def limit_for(self, method: str, path: str):
+        if method != "POST":
+            return None
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def reject(self, send, limit: int):
+        body = json.dumps({"detail": f"Request body is too large (max {limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope.get("method"), scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await self.reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            await self.reject(send, limit)
@@ -0,0 +1,484 @@
+"""
+ChordPro・MusicXML（<harmony>）・iReal形式のコード譜の取り込み
+
+各形式から内部のコードトークン列（extract_chordsと同じ "C", "Am7", "G7(b9)" などの記法）を直接取り出す。
+[C][Am] 形式の文字列を経由しないため、再解析のコストがかからない。
+
+- ChordPro: 行単位で読み、歌詞行の [コード] とグリッド（{start_of_grid}）のコードを取り出す
+- MusicXML: iterparseで逐次解析し（DOMを作らない）、小節ごとに解放する。圧縮形式（.mxl）にも対応
+- iReal: irealbook:// のURLまたはチャート文字列（難読化された irealb:// 形式は未対応）
+
+ファイルやフォルダを複数指定するとプロセス並列で取り込み・分析する（結果はJSON Lines、コーパス分析ツールの入力形式）
+
+使い方:
+    python chord_importers.py songs/ --workers 4 > results.jsonl
+    python chord_importers.py song.musicxml --chords-only
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+import zipfile
+from functools import partial
+from typing import Iterable, Iterator
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+from parallel import parallel_map
+
+# 拡張子 → 入力形式
+FORMAT_EXTENSIONS = {
+    ".cho": "chordpro",
+    ".crd": "chordpro",
+    ".chopro": "chordpro",
+    ".chordpro": "chordpro",
+    ".pro": "chordpro",
+    ".musicxml": "musicxml",
+    ".xml": "musicxml",
+    ".mxl": "musicxml",
+    ".ireal": "ireal",
+}
+
+
+class ChordImportError(ValueError):
+    """コード譜として解析できない入力"""
+
+
+# ChordPro
+
+CHORDPRO_CHORD_PATTERN = re.compile(r'\[([^\]]*)\]')
+CHORDPRO_DIRECTIVE_PATTERN = re.compile(r'^\s*\{\s*([A-Za-z_]+)')
+CHORDPRO_GRID_START = {"start_of_grid", "sog"}
+CHORDPRO_GRID_END = {"end_of_grid", "eog"}
+CHORDPRO_TAB_START = {"start_of_tab", "sot"}
+CHORDPRO_TAB_END = {"end_of_tab", "eot"}
+CHORDPRO_GRID_SYMBOLS = {"|", "||", "|.", "|:", ":|", ":|:", "%", "%%", ".", "/", "~", "x"}
+
+
+def iter_chordpro_chords(lines: Iterable[str]) -> Iterator[str]:
+    """ChordProの行からコードを順に返す
+
+    ディレクティブ（{title: ...} など）・コメント行（#）・タブ譜の中身は読み飛ばす。
+    [*Riff] のような注記（先頭が*）は返さない。グリッドの中は空白区切りのトークンをコードとして扱う。
+    """
+    in_grid = in_tab = False
+    for line in lines:
+        directive = CHORDPRO_DIRECTIVE_PATTERN.match(line)
+        if directive:
+            name = directive.group(1).lower()
+            in_grid = (in_grid or name in CHORDPRO_GRID_START) and name not in CHORDPRO_GRID_END
+            in_tab = (in_tab or name in CHORDPRO_TAB_START) and name not in CHORDPRO_TAB_END
+            continue
+        if in_tab or line.lstrip().startswith("#"):
+            continue
+        if in_grid:
+            for token in line.split():
+                token = token.strip("|:")
+                if token and token not in CHORDPRO_GRID_SYMBOLS:
+                    yield token
+            continue
+        for chord in CHORDPRO_CHORD_PATTERN.findall(line):
+            chord = chord.strip()
+            if chord and not chord.startswith("*"):
+                yield chord
+
+
+# MusicXML
+
+# <kind> の値 → コード記法（Noneはコードとして扱わない）
+MUSICXML_KINDS = {
+    "major": "",
+    "minor": "m",
+    "augmented": "aug",
+    "diminished": "dim",
+    "dominant": "7",
+    "major-seventh": "M7",
+    "minor-seventh": "m7",
+    "diminished-seventh": "dim7",
+    "augmented-seventh": "7+5",
+    "half-diminished": "m7b5",
+    "major-minor": "mM7",
+    "major-sixth": "6",
+    "minor-sixth": "m6",
+    "dominant-ninth": "9",
+    "major-ninth": "M9",
+    "minor-ninth": "m9",
+    "dominant-11th": "11",
+    "major-11th": "M7(9,11)",
+    "minor-11th": "m11",
+    "dominant-13th": "13",
+    "major-13th": "M13",
+    "minor-13th": "m7(9,13)",
+    "suspended-second": "sus2",
+    "suspended-fourth": "sus4",
+    "power": "5",
+    "Neapolitan": "",
+    "Italian": "7",
+    "German": "7",
+    "French": "7b5",
+    "Tristan": "m7b5",
+    "pedal": None,
+    "other": None,
+    "none": None,  # N.C.
+}
+MUSICXML_ALTERS = {-2: "bb", -1: "b", 0: "", 1: "#", 2: "##"}
+MUSICXML_TENSION_DEGREES = {"9", "11", "13"}
+
+
+def _local_name(tag: str) -> str:
+    """名前空間付きのタグ名（{uri}harmony）からローカル名を取り出す"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(element, name: str):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def _child_text(element, name: str, default: str = "") -> str:
+    child = _child(element, name) if element is not None else None
+    return child.text.strip() if child is not None and child.text else default
+
+
+def _pitch_name(element, step_name: str, alter_name: str) -> str:
+    step = _child_text(element, step_name)
+    if not step:
+        return ""
+    try:
+        alter = round(float(_child_text(element, alter_name, "0")))
+    except ValueError:
+        alter = 0
+    return step.upper() + MUSICXML_ALTERS.get(alter, "")
+
+
+def harmony_symbol(harmony) -> str:
+    """<harmony>要素からコード記法を作る（ルートが無い・N.C.などはNone）"""
+    root = _pitch_name(_child(harmony, "root"), "root-step", "root-alter")
+    kind = _child(harmony, "kind")
+    quality = MUSICXML_KINDS.get(kind.text.strip() if kind is not None and kind.text else "major", "")
+    if not root or quality is None:
+        return None
+    tensions = []
+    for degree in harmony:
+        if _local_name(degree.tag) != "degree" or _child_text(degree, "degree-type") == "subtract":
+            continue
+        value = _child_text(degree, "degree-value")
+        if value in MUSICXML_TENSION_DEGREES:
+            try:
+                alter = round(float(_child_text(degree, "degree-alter", "0")))
+            except ValueError:
+                alter = 0
+            tensions.append(MUSICXML_ALTERS.get(alter, "") + value)
+    symbol = root + quality
+    if tensions:
+        symbol += f"({','.join(tensions)})"
+    bass = _child(harmony, "bass")
+    if bass is not None:
+        bass_name = _pitch_name(bass, "bass-step", "bass-alter")
+        if bass_name:
+            symbol += "/" + bass_name
+    return symbol
+
+
+def _open_mxl_score(archive: zipfile.ZipFile):
+    """圧縮MusicXML（.mxl）から楽譜本体を開く（META-INF/container.xml の最初のrootfile）"""
+    try:
+        with archive.open("META-INF/container.xml") as container:
+            for _, element in ElementTree.iterparse(container):
+                if _local_name(element.tag) == "rootfile" and element.get("full-path"):
+                    return archive.open(element.get("full-path"))
+    except KeyError:
+        pass
+    for name in archive.namelist():
+        if not name.startswith("META-INF/") and name.lower().endswith((".xml", ".musicxml")):
+            return archive.open(name)
+    raise ChordImportError("No score found in compressed MusicXML")
+
+
+def iter_musicxml_chords(source) -> Iterator[str]:
+    """MusicXMLの<harmony>からコードを順に返す（sourceはパスまたはバイナリのファイルオブジェクト）
+
+    最初にコードが現れたパートだけを使う（複数パートに同じコード記号が書かれた楽譜で重複させない）。
+    圧縮形式（.mxl）はzipかどうかで判定するため、パスでもファイルオブジェクトでも受け付ける。
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive, _open_mxl_score(archive) as score:
+            yield from iter_musicxml_chords(score)
+        return
+    if hasattr(source, "seek"):
+        source.seek(0)  # is_zipfileで読んだ位置を戻す
+    part = chord_part = None
+    try:
+        for event, element in ElementTree.iterparse(source, events=("start", "end")):
+            name = _local_name(element.tag)
+            if event == "start":
+                if name == "part":
+                    part = element.get("id")
+                continue
+            if name == "harmony":
+                if chord_part is None:
+                    chord_part = part
+                if part == chord_part:
+                    symbol = harmony_symbol(element)
+                    if symbol:
+                        yield symbol
+            elif name == "measure":
+                element.clear()  # 処理済みの小節を解放する
+    except ElementTree.ParseError as e:
+        raise ChordImportError(f"Invalid MusicXML: {e}") from e
+
+
+# iReal
+
+IREAL_URL_PREFIX = "irealbook://"
+IREAL_OBFUSCATED_PREFIX = "irealb://"
+IREAL_FIELDS_PER_SONG = 6  # タイトル=作曲者=スタイル=キー=n=チャート
+# 展開済みチャートに残る区切り記号（XyQは空白セル、LZは小節線、Kclは前小節の繰り返し）
+IREAL_REPLACEMENTS = (("XyQ", "   "), ("LZ", " |"), ("Kcl", "| x"))
+IREAL_TOKEN_PATTERN = re.compile(
+    r'<[^>]*>'  # コメント
+    r'|\([^)]*\)'  # 代替コード（小さく書かれたコードは取り込まない）
+    r'|T\d\d'  # 拍子
+    r'|\*\w'  # リハーサルマーク
+    r'|N\d'  # カッコ（1番・2番）
+    r'|[A-GW][b#]?[^\s,|\[\]{}()<>*A-Z]*(?:/[A-G][b#]?)?'  # コード（Wは表示されないルート）
+    r'|.', re.S
+)
+IREAL_BARLINES = {"|", "[", "]", "{", "}", "Z"}
+IREAL_CHORD_PATTERN = re.compile(r'^([A-GW][b#]?)([^/]*)(?:/([A-G][b#]?))?$')
+# iRealの品質 → コード記法（長い接頭辞から順に照合し、残りはテンション・変化音として扱う）
+IREAL_QUALITIES = (
+    ("-^9", "mM7", ("9",)),
+    ("-^7", "mM7", ()),
+    ("-7b5", "m7b5", ()),
+    ("-69", "m6", ("9",)),
+    ("-11", "m11", ()),
+    ("-9", "m9", ()),
+    ("-7", "m7", ()),
+    ("-6", "m6", ()),
+    ("-", "m", ()),
+    ("^13", "M13", ()),
+    ("^9", "M9", ()),
+    ("^7", "M7", ()),
+    ("^", "M7", ()),
+    ("h9", "m7b5", ("9",)),
+    ("h7", "m7b5", ()),
+    ("h", "m7b5", ()),
+    ("o7", "dim7", ()),
+    ("o", "dim", ()),
+    ("69", "6", ("9",)),
+    ("6", "6", ()),
+    ("13", "13", ()),
+    ("11", "11", ()),
+    ("9", "9", ()),
+    ("7", "7", ()),
+    ("+", "aug", ()),
+    ("add9", "add9", ()),
+    ("sus", "sus4", ()),
+    ("2", "add9", ()),
+    ("5", "5", ()),
+)
+IREAL_ALTERATION_PATTERN = re.compile(r'([b#])(5|9|11|13)|(alt)|(sus)|(add)(\d+)')
+IREAL_ALTERED_TENSIONS = ("b9", "#9", "b13")
+IREAL_SUS_QUALITIES = {"7": "7sus4", "9": "9sus4", "13": "13sus4"}
+# 括弧記法テンション（BRACKET_TENSION_PATTERN）のコア部分に書けない品質 → (書けるコア, 含まれるテンション)
+# テンションの "7" は短7度。5度の変化は異名同音のテンション（b5 → #11、#5 → b13）で表す
+IREAL_BRACKET_CORES = {
+    "9": ("7", ("9",)),
+    "11": ("7", ("9", "11")),
+    "13": ("7", ("9", "13")),
+    "M9": ("M7", ("9",)),
+    "M13": ("M7", ("9", "13")),
+    "m9": ("m7", ("9",)),
+    "m11": ("m7", ("9", "11")),
+    "m7b5": ("dim", ("7",)),
+    "7sus4": ("sus4", ("7",)),
+    "9sus4": ("sus4", ("7", "9")),
+    "13sus4": ("sus4", ("7", "9", "13")),
+    "7+5": ("aug", ("7",)),
+    "7b5": ("7", ("#11",)),
+    "M7+5": ("M7", ("b13",)),
+    "M7b5": ("M7", ("#11",)),
+}
+# pychordが解析できないため、テンションが無くても括弧記法で書く品質
+IREAL_BRACKET_ONLY = {"13sus4", "M7b5"}
+
+
+def ireal_symbol(token: str) -> str:
+    """iRealのコード（例: C-7, F^7#11, Bb7b9sus, E7alt, D/F#）をコード記法に変換する（Wルートなどは None）"""
+    match = IREAL_CHORD_PATTERN.match(token)
+    if not match or match.group(1) == "W":
+        return None
+    root, quality, bass = match.groups()
+    core, tensions, suspended = "", [], False
+    for prefix, mapped, implied in IREAL_QUALITIES:
+        if quality.startswith(prefix):
+            core, tensions, quality = mapped, list(implied), quality[len(prefix):]
+            break
+    for accidental, degree, alt, sus, add, added in IREAL_ALTERATION_PATTERN.findall(quality):
+        if alt:
+            core = core or "7"
+            tensions.extend(IREAL_ALTERED_TENSIONS)
+        elif sus:
+            suspended = True
+        elif add:
+            if added in {"9", "11", "13"}:
+                tensions.append(added)
+        elif degree == "5":
+            if core in {"7", "M7"}:
+                core += "+5" if accidental == "#" else "b5"
+            elif core == "" and accidental == "#":
+                core = "aug"
+            else:
+                tensions.append("#11" if accidental == "b" else "b13")
+        else:
+            tensions.append(accidental + degree)
+    if suspended:
+        core = IREAL_SUS_QUALITIES.get(core, "sus4")
+    if tensions or core in IREAL_BRACKET_ONLY:
+        # テンションを落とさないよう、括弧記法で解析できるコアに書き換える
+        core, implied = IREAL_BRACKET_CORES.get(core, (core, ()))
+        tensions = list(implied) + tensions
+    symbol = root + core
+    if tensions:
+        symbol += f"({','.join(dict.fromkeys(tensions))})"
+    if bass:
+        symbol += "/" + bass
+    return symbol
+
+
+def iter_ireal_charts(source: str) -> Iterator[str]:
+    """irealbook:// のURL（複数曲可）またはチャート文字列から、曲ごとのチャートを返す"""
+    source = source.strip()
+    if source.startswith(IREAL_OBFUSCATED_PREFIX):
+        raise ChordImportError("Obfuscated irealb:// charts are not supported; export as irealbook://")
+    if not source.startswith(IREAL_URL_PREFIX):
+        yield source
+        return
+    fields = unquote(source[len(IREAL_URL_PREFIX):]).split("=")
+    if len(fields) < IREAL_FIELDS_PER_SONG:
+        raise ChordImportError("Invalid irealbook:// URL")
+    yield from fields[IREAL_FIELDS_PER_SONG - 1::IREAL_FIELDS_PER_SONG]
+
+
+def iter_ireal_chords(source: str) -> Iterator[str]:
+    """iRealのチャートからコードを順に返す
+
+    x（前の小節の繰り返し）・r（前の2小節の繰り返し）は該当小節のコードを繰り返す。
+    p（スラッシュ）・n（N.C.）・拍子・リハーサルマーク・コメント・代替コードはコードとして扱わない。
+    繰り返し記号（{ }・N1/N2）は展開しない（チャートに書かれたコードを1回ずつ返す）。
+    """
+    for chart in iter_ireal_charts(source):
+        for old, new in IREAL_REPLACEMENTS:
+            chart = chart.replace(old, new)
+        measures = [[]]
+        for token in IREAL_TOKEN_PATTERN.findall(chart):
+            if token in IREAL_BARLINES:
+                if measures[-1]:
+                    measures.append([])
+            elif token == "x":
+                repeated = next((m for m in reversed(measures[:-1]) if m), [])
+                measures[-1].extend(repeated)
+                yield from repeated
+            elif token == "r":
+                previous = [m for m in measures[:-1] if m][-2:]
+                for measure in previous:
+                    measures[-1].extend(measure)
+                    for symbol in measure:
+                        yield symbol
+            elif token[0] in "ABCDEFGW":
+                symbol = ireal_symbol(token)
+                if symbol:
+                    measures[-1].append(symbol)
+                    yield symbol
+            if len(measures) > 3:
+                del measures[0]  # 繰り返しに使うのは直前の2小節まで
+
+
+# 文字列（APIのchord_input）からの取り込み
+
+def iter_text_chords(text: str, input_format: str) -> Iterator[str]:
+    """文字列のコード譜を入力形式に応じて取り込む（未知の形式はChordImportError）"""
+    if input_format == "chordpro":
+        return iter_chordpro_chords(io.StringIO(text))
+    if input_format == "musicxml":
+        return iter_musicxml_chords(io.BytesIO(text.encode("utf-8")))
+    if input_format == "ireal":
+        return iter_ireal_chords(text)
+    raise ChordImportError(f"Unknown input_format: {input_format}")
+
+
+# ファイルからの取り込み
+
+def format_for_path(path: str) -> str:
+    return FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def iter_file_chords(path: str, input_format: str = None) -> Iterator[str]:
+    """ファイルを拡張子（またはinput_format）に応じて逐次取り込む"""
+    input_format = input_format or format_for_path(path)
+    if input_format == "musicxml":
+        yield from iter_musicxml_chords(path)
+        return
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        if input_format == "chordpro":
+            yield from iter_chordpro_chords(f)
+        elif input_format == "ireal":
+            yield from iter_ireal_chords(f.read())
+        else:
+            raise ChordImportError(f"Unknown input format for {path}")
+
+
+def iter_chord_paths(paths, input_format: str = None):
+    """ファイルはそのまま、フォルダは配下の対応形式のファイルを（名前順に）返す"""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(files):
+                    if input_format or format_for_path(name):
+                        yield os.path.join(directory, name)
+        else:
+            yield path
+
+
+def import_chord_file(path: str, input_format: str = None, request=None, chords_only: bool = False) -> bytes:
+    """1ファイルを取り込んで分析し、JSON Lines の1行（{"id", "chords", "result"} または {"id", "error"}）を返す"""
+    from main import ChordAnalysisRequest, encode_json, is_valid_chord, run_analysis, select_fields
+    try:
+        chords = [chord for chord in iter_file_chords(path, input_format) if is_valid_chord(chord)]
+    except (OSError, zipfile.BadZipFile, ChordImportError) as e:
+        return encode_json({"id": path, "error": str(e)})
+    if chords_only:
+        return encode_json({"id": path, "chords": chords})
+    request = request or ChordAnalysisRequest(chord_input="")
+    return encode_json({"id": path, "chords": chords, "result": select_fields(run_analysis(request, chords), request.fields)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChordPro・MusicXML・iRealのコード譜の取り込みと分析")
+    parser.add_argument("paths", nargs="+", help="コード譜のファイルまたはフォルダ")
+    parser.add_argument("--format", choices=sorted(set(FORMAT_EXTENSIONS.values())), default=None,
+                        help="入力形式（既定は拡張子から判定）")
+    parser.add_argument("--chords-only", action="store_true", help="分析せずコード列だけを出力する")
+    parser.add_argument("--algorithm", default="hybrid")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数（既定はCPU数）")
+    args = parser.parse_args(argv)
+
+    request = None
+    if not args.chords_only:
+        from main import ChordAnalysisRequest
+        request = ChordAnalysisRequest(chord_input="", algorithm=args.algorithm)
+    convert = partial(import_chord_file, input_format=args.format, request=request, chords_only=args.chords_only)
+    output = sys.stdout.buffer
+    for line in parallel_map(convert, iter_chord_paths(args.paths, args.format), args.workers):
+        output.write(line + b"\n")
+    output.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+分析結果の列指向エクスポート（コーパス分析用）
+
+分析結果（/analyzeのレスポンス、ジョブ結果、AnalysisRecord）を1件ずつ取り込み、列ごとの .npy ファイルに書き出す。
+読み込み側は np.load(mmap_mode="r") でメモリマップし、JSONを解析せずに必要な列・行だけをスライスできる。
+
+ディレクトリ構成（N: 曲数、C: キー候補の総数、B: 借用和音の総数、D: 非ダイアトニック音の総数、S: 借用元候補の総数）:
+    manifest.json                    行数・列の型と形状・辞書（コード値 → 文字列）
+    doc_id_offsets.npy   int64 N+1   曲IDのUTF-8バイト列（doc_id_bytes.npy uint8）の範囲
+    pitch_class_vector.npy float32 N×12
+    main_key.npy         int32 N     辞書 "key" のコード値
+    confidence.npy       float32 N
+    algorithm_used.npy   int32 N     辞書 "algorithm"
+    key_candidate_offsets.npy int64 N+1  曲iのキー候補は [offsets[i], offsets[i+1])
+    key_candidate_algorithm / _key / _confidence / _borrowed_count.npy   長さC
+    borrowed_offsets.npy int64 N+1   曲iの借用和音は [offsets[i], offsets[i+1])
+    borrowed_chord.npy   int32 B     辞書 "chord"
+    non_diatonic_offsets.npy int64 B+1, non_diatonic_note.npy int32 D   辞書 "note"
+    source_offsets.npy   int64 B+1, source_key / source_relationship / source_confidence.npy  長さS
+
+欠損（fieldsで除外された項目など）はコード値 -1、浮動小数点は NaN、可変長の列は空になる。
+書き込みは一定件数ごとに列ファイルへ追記するため、メモリはコーパスの曲数に依存しない（辞書の種類数で上限が決まる）。
+manifest.json は最後に書くので、それが無いディレクトリは書き込み途中とみなす。
+
+使い方:
+    python columnar_export.py OUT_DIR results.jsonl ...
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from collections import Counter
+
+import numpy as np
+
+from corpus_stats import iter_documents, result_field
+
+FORMAT_NAME = "chord-analyzer-columnar"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+MISSING_CODE = -1
+DEFAULT_CHUNK_ROWS = 65536
+
+# 列名 → (dtype, 1行あたりの形状, 辞書名)
+COLUMNS = {
+    "doc_id_offsets": (np.int64, (), None),
+    "doc_id_bytes": (np.uint8, (), None),
+    "pitch_class_vector": (np.float32, (12,), None),
+    "main_key": (np.int32, (), "key"),
+    "confidence": (np.float32, (), None),
+    "algorithm_used": (np.int32, (), "algorithm"),
+    "key_candidate_offsets": (np.int64, (), None),
+    "key_candidate_algorithm": (np.int32, (), "algorithm"),
+    "key_candidate_key": (np.int32, (), "key"),
+    "key_candidate_confidence": (np.float32, (), None),
+    "key_candidate_borrowed_count": (np.int32, (), None),
+    "borrowed_offsets": (np.int64, (), None),
+    "borrowed_chord": (np.int32, (), "chord"),
+    "non_diatonic_offsets": (np.int64, (), None),
+    "non_diatonic_note": (np.int32, (), "note"),
+    "source_offsets": (np.int64, (), None),
+    "source_key": (np.int32, (), "key"),
+    "source_relationship": (np.int32, (), "relationship"),
+    "source_confidence": (np.float32, (), None),
+}
+OFFSET_COLUMNS = ("doc_id_offsets", "key_candidate_offsets", "borrowed_offsets", "non_diatonic_offsets", "source_offsets")
+DICTIONARIES = ("key", "algorithm", "chord", "note", "relationship")
+
+
+def _float(value) -> float:
+    return np.nan if value is None else value
+
+
+class ColumnarWriter:
+    """分析結果を列ごとの一時ファイルに追記し、close()で .npy と manifest.json を書き出す"""
+
+    def __init__(self, directory: str, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        os.makedirs(directory, exist_ok=True)
+        if os.listdir(directory):
+            raise FileExistsError(f"Output directory is not empty: {directory}")
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.manifest = None
+        self.dictionaries = {name: {} for name in DICTIONARIES}
+        self._buffers = {name: [] for name in COLUMNS}
+        self._counts = dict.fromkeys(COLUMNS, 0)
+        self._ends = dict.fromkeys(OFFSET_COLUMNS, 0)
+        self._files = {name: open(self._raw_path(name), "wb") for name in COLUMNS}
+        for name in OFFSET_COLUMNS:
+            self._buffers[name].append(0)  # 可変長の列の先頭の0
+        self._buffered_rows = 0
+
+    def _raw_path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".raw")
+
+    def _code(self, dictionary: str, value) -> int:
+        if value is None:
+            return MISSING_CODE
+        codes = self.dictionaries[dictionary]
+        return codes.setdefault(value, len(codes))
+
+    def _append_offset(self, name: str, length: int):
+        self._ends[name] += length
+        self._buffers[name].append(self._ends[name])
+
+    def add(self, result, doc_id: str = None):
+        """分析結果1件を追加する"""
+        buffers = self._buffers
+        doc_id_bytes = (doc_id or "").encode("utf-8")
+        buffers["doc_id_bytes"].extend(doc_id_bytes)
+        self._append_offset("doc_id_offsets", len(doc_id_bytes))
+
+        vector = result_field(result, "pitch_class_vector")
+        buffers["pitch_class_vector"].append(vector if vector is not None and len(vector) == 12 else [np.nan] * 12)
+        buffers["main_key"].append(self._code("key", result_field(result, "main_key")))
+        buffers["confidence"].append(_float(result_field(result, "confidence")))
+        buffers["algorithm_used"].append(self._code("algorithm", result_field(result, "algorithm_used")))
+
+        candidates = result_field(result, "key_candidates") or []
+        for candidate in candidates:
+            buffers["key_candidate_algorithm"].append(self._code("algorithm", result_field(candidate, "algorithm")))
+            buffers["key_candidate_key"].append(self._code("key", result_field(candidate, "key")))
+            buffers["key_candidate_confidence"].append(_float(result_field(candidate, "confidence")))
+            count = result_field(candidate, "borrowed_chord_count")
+            buffers["key_candidate_borrowed_count"].append(MISSING_CODE if count is None else count)
+        self._append_offset("key_candidate_offsets", len(candidates))
+
+        borrowed_chords = result_field(result, "borrowed_chords") or []
+        for borrowed in borrowed_chords:
+            buffers["borrowed_chord"].append(self._code("chord", result_field(borrowed, "chord")))
+            notes = result_field(borrowed, "non_diatonic_notes") or []
+            buffers["non_diatonic_note"].extend(self._code("note", note) for note in notes)
+            self._append_offset("non_diatonic_offsets", len(notes))
+            sources = result_field(borrowed, "source_candidates") or []
+            for source in sources:
+                buffers["source_key"].append(self._code("key", result_field(source, "key")))
+                buffers["source_relationship"].append(self._code("relationship", result_field(source, "relationship")))
+                buffers["source_confidence"].append(_float(result_field(source, "confidence")))
+            self._append_offset("source_offsets", len(sources))
+        self._append_offset("borrowed_offsets", len(borrowed_chords))
+
+        self.rows += 1
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.chunk_rows:
+            self.flush()
+
+    def add_all(self, documents) -> "ColumnarWriter":
+        """(曲ID, 分析結果) の列を追加する"""
+        for doc_id, result in documents:
+            self.add(result, doc_id)
+        return self
+
+    def flush(self):
+        """バッファを列ごとの一時ファイルに追記する"""
+        for name, values in self._buffers.items():
+            if values:
+                dtype, shape, _ = COLUMNS[name]
+                array = np.asarray(values, dtype=dtype).reshape((-1,) + shape)
+                array.tofile(self._files[name])
+                self._counts[name] += len(array)
+                values.clear()
+        self._buffered_rows = 0
+
+    def close(self) -> dict:
+        """各列を .npy に書き出し、最後に manifest.json を書く（manifestを返す）"""
+        self.flush()
+        columns = {}
+        for name, raw in self._files.items():
+            raw.close()
+            dtype, shape, dictionary = COLUMNS[name]
+            full_shape = (self._counts[name],) + shape
+            with open(self._raw_path(name), "rb") as source, open(os.path.join(self.directory, name + ".npy"), "wb") as target:
+                np.lib.format.write_array_header_1_0(target, {
+                    "descr": np.dtype(dtype).str, "fortran_order": False, "shape": full_shape,
+                })
+                shutil.copyfileobj(source, target)
+            os.remove(self._raw_path(name))
+            columns[name] = {"dtype": np.dtype(dtype).name, "shape": list(full_shape), "dictionary": dictionary}
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "rows": self.rows,
+            "columns": columns,
+            "dictionaries": {name: list(codes) for name, codes in self.dictionaries.items()},
+        }
+        temporary = os.path.join(self.directory, MANIFEST_NAME + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temporary, os.path.join(self.directory, MANIFEST_NAME))
+        self.manifest = manifest
+        return manifest
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for raw in self._files.values():
+                raw.close()
+
+
+def export_results(documents, directory: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> dict:
+    """(曲ID, 分析結果) の列を列指向形式で書き出し、manifestを返す"""
+    with ColumnarWriter(directory, chunk_rows) as writer:
+        writer.add_all(documents)
+    return writer.manifest
+
+
+def _read_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {MANIFEST_NAME} in {directory} (incomplete export?)")
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME or manifest.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported columnar export: {manifest.get('format')} v{manifest.get('version')}")
+    return manifest
+
+
+class ColumnarResults:
+    """列指向エクスポートの読み込み（既定ではメモリマップし、アクセスした部分だけを読む）"""
+
+    def __init__(self, directory: str, mmap: bool = True):
+        self.directory = directory
+        self.manifest = _read_manifest(directory)
+        self.dictionaries = self.manifest["dictionaries"]
+        self._mmap_mode = "r" if mmap else None
+        self._columns = {}
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """列の配列（メモリマップ）"""
+        if name not in self._columns:
+            if name not in self.manifest["columns"]:
+                raise KeyError(name)
+            self._columns[name] = np.load(os.path.join(self.directory, name + ".npy"), mmap_mode=self._mmap_mode)
+        return self._columns[name]
+
+    def code(self, dictionary: str, value: str) -> int:
+        """文字列のコード値（辞書に無ければ -1。例: results["main_key"] == results.code("key", "C Major")）"""
+        try:
+            return self.dictionaries[dictionary].index(value)
+        except ValueError:
+            return MISSING_CODE
+
+    def decode(self, dictionary: str, codes) -> list:
+        values = self.dictionaries[dictionary]
+        return [values[code] if code >= 0 else None for code in np.asarray(codes).tolist()]
+
+    def span(self, offsets: str, row: int) -> slice:
+        """可変長の列で row 番目の要素の範囲"""
+        offsets = self[offsets]
+        return slice(int(offsets[row]), int(offsets[row + 1]))
+
+    def doc_id(self, row: int) -> str:
+        return bytes(self["doc_id_bytes"][self.span("doc_id_offsets", row)]).decode("utf-8")
+
+    def record(self, row: int) -> dict:
+        """row 番目の分析結果をレスポンスと同じ形の辞書に戻す（progression_detailsは含まない）"""
+        decode = self.decode
+        candidates = self.span("key_candidate_offsets", row)
+        borrowed = self.span("borrowed_offsets", row)
+        borrowed_chords = []
+        for index, chord in zip(range(borrowed.start, borrowed.stop), decode("chord", self["borrowed_chord"][borrowed])):
+            notes = self.span("non_diatonic_offsets", index)
+            sources = self.span("source_offsets", index)
+            borrowed_chords.append({
+                "chord": chord,
+                "non_diatonic_notes": decode("note", self["non_diatonic_note"][notes]),
+                "source_candidates": [
+                    {"key": key, "relationship": relationship, "confidence": confidence}
+                    for key, relationship, confidence in zip(
+                        decode("key", self["source_key"][sources]),
+                        decode("relationship", self["source_relationship"][sources]),
+                        self["source_confidence"][sources].tolist(),
+                    )
+                ],
+            })
+        return {
+            "main_key": decode("key", self["main_key"][row:row + 1])[0],
+            "confidence": float(self["confidence"][row]),
+            "borrowed_chords": borrowed_chords,
+            "pitch_class_vector": self["pitch_class_vector"][row].tolist(),
+            "key_candidates": [
+                {"key": key, "confidence": confidence, "borrowed_chord_count": count, "algorithm": algorithm}
+                for key, confidence, count, algorithm in zip(
+                    decode("key", self["key_candidate_key"][candidates]),
+                    self["key_candidate_confidence"][candidates].tolist(),
+                    self["key_candidate_borrowed_count"][candidates].tolist(),
+                    decode("algorithm", self["key_candidate_algorithm"][candidates]),
+                )
+            ],
+            "algorithm_used": decode("algorithm", self["algorithm_used"][row:row + 1])[0],
+        }
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="分析結果の列指向エクスポート")
+    parser.add_argument("directory", help="出力ディレクトリ（空であること）")
+    parser.add_argument("paths", nargs="*", help="入力ファイル（分析結果のJSON Lines。省略時は標準入力）")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="列ファイルへ追記する単位（件数）")
+    args = parser.parse_args(argv)
+
+    skipped = Counter()
+    streams = [open(path, encoding="utf-8") for path in args.paths] or [sys.stdin]
+    with ColumnarWriter(args.directory, args.chunk_rows) as writer:
+        for stream in streams:
+            with stream:
+                writer.add_all(iter_documents(stream, skipped))
+    print(f"{writer.rows} rows ({sum(skipped.values())} lines without a result skipped)")
+
+
+if __name__ == "__main__":
+    main()
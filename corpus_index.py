@@ -0,0 +1,364 @@
+"""
+分析結果のコーパスインデックス（ブール検索）
+
+分析結果から検索語（term）を取り出し、語ごとに曲番号の昇順配列（uint32のポスティングリスト）を持つ。
+再スキャンなしで「短調で同主長調からの借用和音を含む曲」「traditionalとtriad_ratioが不一致の曲」
+のような条件を AND / OR / NOT で検索できる。
+
+検索語（フィールド:値）:
+    key:"A Minor"              メインキー
+    mode:Minor                 メインキーの調性（Major / Minor）
+    algorithm:hybrid           algorithm_used
+    traditional:"C Major"      各アルゴリズムの推定キー（borrowed_chord_minimal, triad_ratio, manual も同様）
+    agree:traditional+triad_ratio  2つのアルゴリズムの推定キーが一致
+    borrowed:Fm                借用和音のコード記号
+    relationship:"Parallel Minor/Major"  借用和音の最有力の借用元とメインキーの関係
+    source:"C Minor"           借用和音の最有力の借用元キー
+    chord:G7                   進行に含まれるコード記号
+
+追記はセグメント単位（commit()ごとに1ファイル）で、既存セグメントは書き換えない。
+compact()で全セグメントを1つにまとめられる。
+
+使い方:
+    python corpus_index.py add INDEX_DIR results.jsonl ...
+    python corpus_index.py query INDEX_DIR 'mode:Minor AND relationship:"Parallel Minor/Major"'
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+
+from corpus_stats import iter_documents, result_field
+
+SEGMENT_PATTERN = "segment-*.npz"
+EMPTY = np.zeros(0, dtype=np.uint32)
+
+
+def extract_terms(result) -> set:
+    """分析結果1件の検索語（"フィールド:値"）の集合"""
+    terms = set()
+    main_key = result_field(result, "main_key")
+    if main_key:
+        terms.add(f"key:{main_key}")
+        terms.add(f"mode:{main_key.split()[-1]}")
+    algorithm = result_field(result, "algorithm_used")
+    if algorithm:
+        terms.add(f"algorithm:{algorithm}")
+    estimates = {}
+    for candidate in result_field(result, "key_candidates") or []:
+        estimates[result_field(candidate, "algorithm")] = result_field(candidate, "key")
+    for name, key in estimates.items():
+        terms.add(f"{name}:{key}")
+    for first, second in combinations(sorted(estimates), 2):
+        if estimates[first] == estimates[second]:
+            terms.add(f"agree:{first}+{second}")
+    for borrowed in result_field(result, "borrowed_chords") or []:
+        terms.add(f"borrowed:{result_field(borrowed, 'chord')}")
+        candidates = result_field(borrowed, "source_candidates") or []
+        if candidates:
+            # 候補は信頼度順なので先頭を借用元とみなす（corpus_statsと同じ基準）
+            terms.add(f"relationship:{result_field(candidates[0], 'relationship')}")
+            terms.add(f"source:{result_field(candidates[0], 'key')}")
+    for detail in result_field(result, "progression_details") or []:
+        terms.add(f"chord:{result_field(detail, 'chord_symbol')}")
+    return terms
+
+
+def normalize_term(term: str) -> str:
+    field, _, value = term.partition(":")
+    if field == "agree":
+        value = "+".join(sorted(value.split("+")))
+    return f"{field}:{value}"
+
+
+class Segment:
+    """追記単位の読み取り専用セグメント（曲番号はインデックス全体の通し番号）"""
+
+    def __init__(self, base: int, doc_ids, postings: dict):
+        self.base = base
+        self.doc_ids = list(doc_ids)
+        self.postings = postings
+
+    @classmethod
+    def build(cls, base: int, documents) -> "Segment":
+        doc_ids = []
+        lists = {}
+        for number, (doc_id, terms) in enumerate(documents, start=base):
+            doc_ids.append(doc_id)
+            for term in terms:
+                lists.setdefault(term, []).append(number)
+        return cls(base, doc_ids, {term: np.array(numbers, dtype=np.uint32) for term, numbers in lists.items()})
+
+    def save(self, path: str):
+        terms = sorted(self.postings)
+        lengths = [len(self.postings[term]) for term in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        postings = np.concatenate([self.postings[term] for term in terms]) if terms else EMPTY
+        temporary = path + ".tmp"  # SEGMENT_PATTERNに一致しない名前で書き、完成後に置き換える
+        with open(temporary, "wb") as f:
+            np.savez(
+                f,
+                base=np.array([self.base], dtype=np.int64),
+                doc_ids=np.array(self.doc_ids, dtype=str),
+                terms=np.array(terms, dtype=str),
+                offsets=offsets,
+                postings=postings.astype(np.uint32),
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Segment":
+        with np.load(path, allow_pickle=False) as data:
+            offsets = data["offsets"]
+            postings = data["postings"]
+            terms = data["terms"].tolist()
+            return cls(
+                int(data["base"][0]),
+                data["doc_ids"].tolist(),
+                {term: postings[offsets[i]:offsets[i + 1]] for i, term in enumerate(terms)},
+            )
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|([A-Za-z_+]+:(?:"[^"]*"|[^\s()"]+))|(\S+))')
+
+
+def tokenize(query: str):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(query):
+        open_paren, close_paren, term, word = match.groups()
+        if open_paren or close_paren:
+            tokens.append(open_paren or close_paren)
+        elif term:
+            field, _, value = term.partition(":")
+            tokens.append(("term", normalize_term(f"{field}:{value.strip(chr(34))}")))
+        elif word:
+            if word.upper() not in ("AND", "OR", "NOT"):
+                raise QuerySyntaxError(f"Unexpected token: {word}")
+            tokens.append(word.upper())
+    return tokens
+
+
+class CorpusIndex:
+    """セグメントの集合としてのインデックス（path=Noneならメモリ上のみ）"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.segments = []
+        self._pending = []
+        self._cache = {}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            for segment_path in sorted(glob.glob(os.path.join(path, SEGMENT_PATTERN))):
+                segment = Segment.load(segment_path)
+                if segment.base < len(self):
+                    # compact()の途中で中断した場合の残り（統合済みセグメントに含まれる）
+                    os.remove(segment_path)
+                    continue
+                self.segments.append(segment)
+
+    def __len__(self) -> int:
+        return sum(len(segment.doc_ids) for segment in self.segments)
+
+    # --- 追記 ---
+
+    def add(self, result, doc_id: str = None):
+        """分析結果を1件追加する（commit()まで検索対象にならない）"""
+        number = len(self) + len(self._pending)
+        self._pending.append((str(number) if doc_id is None else str(doc_id), extract_terms(result)))
+
+    def add_all(self, results) -> "CorpusIndex":
+        for result in results:
+            self.add(result)
+        return self.commit()
+
+    def commit(self) -> "CorpusIndex":
+        """追加分を新しいセグメントとして確定する（既存セグメントは書き換えない）"""
+        if not self._pending:
+            return self
+        segment = Segment.build(len(self), self._pending)
+        if self.path is not None:
+            segment.save(os.path.join(self.path, f"segment-{segment.base:010d}.npz"))
+        self.segments.append(segment)
+        self._pending = []
+        self._cache.clear()
+        return self
+
+    def compact(self) -> "CorpusIndex":
+        """全セグメントを1つにまとめる"""
+        self.commit()
+        if len(self.segments) <= 1:
+            return self
+        terms = set().union(*(segment.postings for segment in self.segments))
+        merged = Segment(0, self.doc_ids(), {term: self.postings(term) for term in terms})
+        if self.path is not None:
+            # 統合したセグメントを先に置いてから古いセグメントを消す（途中で中断しても文書を失わない）
+            merged_path = os.path.join(self.path, f"segment-{0:010d}.npz")
+            old_paths = glob.glob(os.path.join(self.path, SEGMENT_PATTERN))
+            merged.save(merged_path)
+            for old_path in old_paths:
+                if os.path.abspath(old_path) != os.path.abspath(merged_path):
+                    os.remove(old_path)
+        self.segments = [merged]
+        self._cache.clear()
+        return self
+
+    # --- 検索 ---
+
+    def doc_ids(self) -> list:
+        return [doc_id for segment in self.segments for doc_id in segment.doc_ids]
+
+    def postings(self, term: str) -> np.ndarray:
+        """検索語のポスティングリスト（セグメント順に連結すると昇順になる）"""
+        term = normalize_term(term)
+        postings = self._cache.get(term)
+        if postings is None:
+            parts = [segment.postings[term] for segment in self.segments if term in segment.postings]
+            postings = np.concatenate(parts) if len(parts) > 1 else (parts[0] if parts else EMPTY)
+            self._cache[term] = postings
+        return postings
+
+    def terms(self, field: str = None) -> list:
+        """登録されている検索語（fieldで絞り込み可）"""
+        terms = set().union(*(segment.postings for segment in self.segments)) if self.segments else set()
+        return sorted(term for term in terms if field is None or term.startswith(f"{field}:"))
+
+    def query_numbers(self, query: str) -> np.ndarray:
+        """ブール検索して一致した曲番号（昇順のuint32配列）を返す"""
+        tokens = tokenize(query)
+        position, result = self._parse_or(tokens, 0)
+        if position != len(tokens):
+            raise QuerySyntaxError(f"Unexpected token: {tokens[position]}")
+        return result
+
+    def search(self, query: str) -> list:
+        """ブール検索して一致した曲のIDを返す"""
+        doc_ids = self.doc_ids()
+        return [doc_ids[number] for number in self.query_numbers(query).tolist()]
+
+    def count(self, query: str) -> int:
+        return len(self.query_numbers(query))
+
+    def _all(self) -> np.ndarray:
+        return np.arange(len(self), dtype=np.uint32)
+
+    # 集合演算：短いリスト同士はソートベース、長いリストは曲数分のビットマスクで線形時間に処理する
+    def _is_sparse(self, *lists) -> bool:
+        return sum(len(postings) for postings in lists) * 64 < len(self)
+
+    def _mask(self, postings: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        mask[postings] = True
+        return mask
+
+    def _intersect(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if self._is_sparse(a, b):
+            return np.intersect1d(a, b, assume_unique=True)
+        return a[self._mask(b)[a]]
+
+    def _union(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if self._is_sparse(a, b):
+            return np.union1d(a, b).astype(np.uint32)
+        mask = self._mask(a)
+        mask[b] = True
+        return np.flatnonzero(mask).astype(np.uint32)
+
+    def _difference(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if self._is_sparse(a, b):
+            return np.setdiff1d(a, b, assume_unique=True)
+        return a[~self._mask(b)[a]]
+
+    def _parse_or(self, tokens, position):
+        position, result = self._parse_and(tokens, position)
+        while position < len(tokens) and tokens[position] == "OR":
+            position, other = self._parse_and(tokens, position + 1)
+            result = self._union(result, other)
+        return position, result
+
+    def _parse_and(self, tokens, position):
+        """AND（省略可）で連結された項。肯定項は短い順に積集合を取り、否定項は最後に差し引く"""
+        positives, negatives = [], []
+        while position < len(tokens) and tokens[position] not in ("OR", ")"):
+            if tokens[position] == "AND":
+                position += 1
+                continue
+            negate = False
+            while position < len(tokens) and tokens[position] == "NOT":
+                negate = not negate
+                position += 1
+            position, operand = self._parse_atom(tokens, position)
+            (negatives if negate else positives).append(operand)
+        if not positives and not negatives:
+            raise QuerySyntaxError("Empty expression")
+        positives.sort(key=len)
+        result = positives[0] if positives else self._all()
+        for operand in positives[1:]:
+            if not len(result):
+                break
+            result = self._intersect(result, operand)
+        for operand in negatives:
+            result = self._difference(result, operand)
+        return position, result.astype(np.uint32)
+
+    def _parse_atom(self, tokens, position):
+        if position >= len(tokens):
+            raise QuerySyntaxError("Unexpected end of query")
+        token = tokens[position]
+        if token == "(":
+            position, result = self._parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise QuerySyntaxError("Missing closing parenthesis")
+            return position + 1, result
+        if isinstance(token, tuple):
+            return position + 1, self.postings(token[1])
+        raise QuerySyntaxError(f"Unexpected token: {token}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析結果のコーパスインデックス")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="分析結果（JSON Lines）を追記する")
+    add_parser.add_argument("index")
+    add_parser.add_argument("paths", nargs="*", help="入力ファイル（省略時は標準入力）")
+    query_parser = commands.add_parser("query", help="ブール検索")
+    query_parser.add_argument("index")
+    query_parser.add_argument("query")
+    query_parser.add_argument("--count", action="store_true", help="件数だけを出力する")
+    compact_parser = commands.add_parser("compact", help="セグメントを1つにまとめる")
+    compact_parser.add_argument("index")
+    args = parser.parse_args(argv)
+
+    index = CorpusIndex(args.index)
+    if args.command == "add":
+        skipped = Counter()
+        streams = [open(path, encoding="utf-8") for path in args.paths] or [sys.stdin]
+        for stream in streams:
+            with stream:
+                for doc_id, result in iter_documents(stream, skipped):
+                    index.add(result, doc_id)
+        index.commit()
+        print(f"{len(index)} documents ({sum(skipped.values())} lines without a result skipped)")
+    elif args.command == "query":
+        if args.count:
+            print(index.count(args.query))
+        else:
+            for doc_id in index.search(args.query):
+                print(doc_id)
+    elif args.command == "compact":
+        index.compact()
+        print(f"{len(index)} documents in {len(index.segments)} segment(s)")
+
+
+if __name__ == "__main__":
+    main()
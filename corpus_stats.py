@@ -0,0 +1,242 @@
+"""
+コーパス全体の統計集計（マージ可能な部分集計）
+
+分析結果（/analyzeのレスポンス、ジョブ結果、AnalysisRecord）をストリームで1件ずつ取り込み、
+カウンタと固定ビンのヒストグラムだけを保持する。
+
+- メモリはコーパスの曲数に依存しない（カウンタはキー・関係性・コード記号の種類数で上限が決まる）
+- 整数カウントのみを持つため、別プロセス・別マシンで作った部分集計を順序によらず厳密に合算できる
+- to_dict()/from_dict() でJSONとして受け渡しできる
+
+使い方:
+    python corpus_stats.py results.jsonl ...      # 分析結果（1行1件のJSON）を集計
+    python corpus_stats.py --merge part1.json ... # 部分集計を合算
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+
+def result_field(result, name, default=None):
+    """辞書・dataclassのどちらの分析結果からも項目を取り出す"""
+    if isinstance(result, dict):
+        return result.get(name, default)
+    return getattr(result, name, default)
+
+
+class FixedHistogram:
+    """[low, high) を等幅ビンに分けたヒストグラム（範囲外は underflow / overflow）"""
+
+    def __init__(self, low: float, high: float, bins: int):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.counts = [0] * bins
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, value: float):
+        if value < self.low:
+            self.underflow += 1
+        elif value >= self.high:
+            self.overflow += 1
+        else:
+            index = int((value - self.low) / (self.high - self.low) * self.bins)
+            self.counts[min(index, self.bins - 1)] += 1
+
+    def merge(self, other: "FixedHistogram"):
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError("Histogram bin edges do not match")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+    def edges(self):
+        width = (self.high - self.low) / self.bins
+        return [self.low + width * i for i in range(self.bins + 1)]
+
+    def to_dict(self) -> dict:
+        return {
+            "low": self.low,
+            "high": self.high,
+            "bins": self.bins,
+            "counts": list(self.counts),
+            "underflow": self.underflow,
+            "overflow": self.overflow,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FixedHistogram":
+        histogram = cls(data["low"], data["high"], data["bins"])
+        histogram.counts = list(data["counts"])
+        histogram.underflow = data["underflow"]
+        histogram.overflow = data["overflow"]
+        return histogram
+
+
+class CorpusStats:
+    """コーパス統計の部分集計"""
+
+    COUNTERS = ("main_keys", "algorithms", "borrowed_chords", "relationships", "source_keys")
+    HISTOGRAMS = {
+        "confidence": (0.0, 1.0, 20),
+        "chord_count": (0, 128, 32),
+        "borrowed_count": (0, 16, 16),
+    }
+
+    def __init__(self):
+        self.songs = 0
+        self.skipped = 0  # 分析結果を持たない入力行（取り込みの失敗など）
+        self.main_keys = Counter()        # 検出キー
+        self.algorithms = Counter()       # algorithm_used
+        self.borrowed_chords = Counter()  # 借用和音のコード記号
+        self.relationships = Counter()    # 最有力の借用元とメインキーの関係（Parallel Minor/Major など）
+        self.source_keys = Counter()      # 最有力の借用元キー
+        self.borrowed_relationships = {}  # コード記号 -> 関係ごとの回数
+        self.histograms = {name: FixedHistogram(*spec) for name, spec in self.HISTOGRAMS.items()}
+
+    def add(self, result):
+        """分析結果を1件取り込む（fields指定で欠けている項目は集計しない）"""
+        self.songs += 1
+        main_key = result_field(result, "main_key")
+        if main_key is not None:
+            self.main_keys[main_key] += 1
+        algorithm = result_field(result, "algorithm_used")
+        if algorithm is not None:
+            self.algorithms[algorithm] += 1
+        confidence = result_field(result, "confidence")
+        if confidence is not None:
+            self.histograms["confidence"].add(confidence)
+        details = result_field(result, "progression_details")
+        if details is not None:
+            self.histograms["chord_count"].add(len(details))
+        borrowed_chords = result_field(result, "borrowed_chords")
+        if borrowed_chords is None:
+            return
+        self.histograms["borrowed_count"].add(len(borrowed_chords))
+        for borrowed in borrowed_chords:
+            chord = result_field(borrowed, "chord")
+            self.borrowed_chords[chord] += 1
+            candidates = result_field(borrowed, "source_candidates") or []
+            if not candidates:
+                continue
+            # 候補は信頼度順なので先頭を借用元とみなす
+            relationship = result_field(candidates[0], "relationship")
+            self.relationships[relationship] += 1
+            self.source_keys[result_field(candidates[0], "key")] += 1
+            self.borrowed_relationships.setdefault(chord, Counter())[relationship] += 1
+
+    def add_all(self, results) -> "CorpusStats":
+        for result in results:
+            self.add(result)
+        return self
+
+    def merge(self, other: "CorpusStats") -> "CorpusStats":
+        """別の部分集計を合算する（結合・交換法則が成り立つ）"""
+        self.songs += other.songs
+        self.skipped += other.skipped
+        for name in self.COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        for chord, counts in other.borrowed_relationships.items():
+            self.borrowed_relationships.setdefault(chord, Counter()).update(counts)
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        return self
+
+    def summary(self, top: int = 10) -> dict:
+        """主要な集計結果（上位項目）"""
+        return {
+            "songs": self.songs,
+            "skipped": self.skipped,
+            "main_keys": self.main_keys.most_common(top),
+            "borrowed_chords": [
+                {
+                    "chord": chord,
+                    "count": count,
+                    "relationships": self.borrowed_relationships.get(chord, Counter()).most_common(3),
+                }
+                for chord, count in self.borrowed_chords.most_common(top)
+            ],
+            "relationships": self.relationships.most_common(top),
+        }
+
+    def to_dict(self) -> dict:
+        data = {"songs": self.songs, "skipped": self.skipped}
+        for name in self.COUNTERS:
+            data[name] = dict(getattr(self, name))
+        data["borrowed_relationships"] = {chord: dict(counts) for chord, counts in self.borrowed_relationships.items()}
+        data["histograms"] = {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CorpusStats":
+        stats = cls()
+        stats.songs = data["songs"]
+        stats.skipped = data.get("skipped", 0)
+        for name in cls.COUNTERS:
+            setattr(stats, name, Counter(data[name]))
+        stats.borrowed_relationships = {chord: Counter(counts) for chord, counts in data["borrowed_relationships"].items()}
+        stats.histograms = {name: FixedHistogram.from_dict(histogram) for name, histogram in data["histograms"].items()}
+        return stats
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CorpusStats) and self.to_dict() == other.to_dict()
+
+
+# 分析結果を持たない行（{"id", "error"} や --chords-only の {"id", "chords"}）を見分けるキー
+ENVELOPE_KEYS = ("id", "index", "error", "chords")
+
+
+def iter_documents(lines, skipped: Counter = None):
+    """JSON Lines（空行は無視）から (曲ID, 分析結果) を読む
+
+    {"id"または"index", "result"} 形式ならIDを使い、分析結果そのものの行はIDなしで返す。
+    分析結果を持たない行（取り込みの失敗やコード列だけの行）は返さず、skipped に "error" / "no_result" として数える。
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        data = json.loads(line)
+        if "result" in data and "main_key" not in data:
+            doc_id = data.get("id", data.get("index"))
+            yield (None if doc_id is None else str(doc_id)), data["result"]
+        elif any(name in data for name in ENVELOPE_KEYS):
+            if skipped is not None:
+                skipped["error" if "error" in data else "no_result"] += 1
+        else:
+            yield None, data
+
+
+def iter_results(lines, skipped: Counter = None):
+    """JSON Lines から分析結果を1件ずつ読む。ジョブ結果形式 {"index", "result"} も受け付ける"""
+    for _, result in iter_documents(lines, skipped):
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分析結果からコーパス統計を集計する")
+    parser.add_argument("paths", nargs="*", help="入力ファイル（省略時は標準入力）")
+    parser.add_argument("--merge", action="store_true", help="入力を部分集計のJSONとして合算する")
+    parser.add_argument("--summary", action="store_true", help="上位項目の要約だけを出力する")
+    args = parser.parse_args(argv)
+
+    stats = CorpusStats()
+    skipped = Counter()
+    streams = [open(path, encoding="utf-8") for path in args.paths] or [sys.stdin]
+    for stream in streams:
+        with stream:
+            if args.merge:
+                stats.merge(CorpusStats.from_dict(json.load(stream)))
+            else:
+                stats.add_all(iter_results(stream, skipped))
+    stats.skipped += sum(skipped.values())
+    output = stats.summary() if args.summary else stats.to_dict()
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
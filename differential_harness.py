@@ -0,0 +1,177 @@
+"""
+最適化した分析エンジン（main.py）と参照実装（reference_engine.py）の差分テスト
+
+キュレーションした進行とランダム生成した進行を両方のエンジンで分析し、推定キー・信頼度（許容誤差付き）・
+キー候補・借用和音と借用元候補・ピッチクラスベクトル・ボイシング（MIDIノート番号を含む）の食い違いを報告する。
+
+使い方:
+    python differential_harness.py --random 2000 --seed 0
+    python differential_harness.py --curated-only --show 50
+"""
+
+import argparse
+import random
+import sys
+from typing import Iterator, List, NamedTuple
+
+import reference_engine
+
+DEFAULT_TOLERANCE = 1e-9
+
+ALGORITHMS = ("hybrid", "traditional", "borrowed_chord_minimal", "triad_ratio")
+MANUAL_KEYS = ("C Major", "A Minor", "Eb Major", "F# Minor", "C Harmonic Minor")
+
+RANDOM_ROOTS = [
+    'C', 'C#', 'Db', 'D', 'D#', 'Eb', 'E', 'F', 'F#', 'Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B',
+    'Cb', 'E#', 'Fb', 'B#',  # NOTESに正規化できない綴り
+]
+RANDOM_QUALITIES = [
+    '', 'm', '7', 'M7', 'maj7', 'm7', 'mM7', '6', 'm6', 'dim', 'dim7', 'aug', 'sus2', 'sus4', '7sus4',
+    'm7b5', 'add9', '9', 'm9', 'M9', '11', '13', '7(9)', '7(b9)', '7(#9)', '7(13)', '7(b13)', '7(#11)',
+    'M7(9)', 'M7(#11)', 'M7(13)', 'm7(9)', 'm7(11)', '7(9,13)', '7(b9,b13)', 'm(add9)',
+]
+
+# 典型的な進行と、過去に問題になった入力（タイ・異名同音・繰り返す借用和音・テンション記法など）
+CURATED_PROGRESSIONS = [
+    "",
+    "[C]",
+    "[C][F][G][C]",
+    "[C][Am][F][G]",
+    "[Dm7][G7][CM7]",
+    "[Em7][A7][Dm7][G7][CM7]",
+    "[Am][Dm][E7][Am]",
+    "[C][Fm][C][Fm][G7][C]",
+    "[C][C7][F][Fm][C][G7][C]",
+    "[CM7][Am7][Fm][G7]",
+    "[Fm7][Bb7][EbM7]",
+    "[F#m7(11)][B7(b9)][EM7(9)]",
+    "[Cm][Ab][Eb][Bb]",
+    "[Db][Gb][Ab][Db]",
+    "[Cb][Fb][Gb][Cb]",
+    "[E#m][A#][B#]",
+    "[Bdim][E7][Am]",
+    "[CM7(9)][FM7(#11)][G7(13)][Em7(11)][A7(b9)]",
+    "[C][|][G][ ][Am][F]",
+    "[C][Bb][F][C]" * 4,
+    "[Am7][D7][Fm6][C]" * 25,
+    "[Dm7(9)][G7(b9,b13)][CM7(9)][A7(#9)]" * 10,
+]
+
+
+class Case(NamedTuple):
+    chord_input: str
+    params: dict
+
+
+class Divergence(NamedTuple):
+    case: Case
+    path: str
+    reference: object
+    optimized: object
+
+
+def case_variants(chord_input: str) -> Iterator[Case]:
+    """全アルゴリズム・手動キー指定・MIDIノート番号ありの組み合わせ"""
+    for algorithm in ALGORITHMS:
+        yield Case(chord_input, {"algorithm": algorithm})
+    for manual_key in MANUAL_KEYS:
+        yield Case(chord_input, {"algorithm": "manual", "manual_key": manual_key})
+    yield Case(chord_input, {"algorithm": "manual"})  # 手動キー無しはhybridとして扱われる
+    yield Case(chord_input, {"include_midi": True})
+
+
+def curated_corpus() -> List[Case]:
+    return [case for chord_input in CURATED_PROGRESSIONS for case in case_variants(chord_input)]
+
+
+def random_progression(rng: random.Random, max_length: int) -> str:
+    return "".join(f"[{rng.choice(RANDOM_ROOTS)}{rng.choice(RANDOM_QUALITIES)}]" for _ in range(rng.randint(1, max_length)))
+
+
+def random_corpus(count: int, seed: int = 0, max_length: int = 12) -> List[Case]:
+    """ランダムな進行（ループ・繰り返しを含む）とランダムな分析設定"""
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        chord_input = random_progression(rng, max_length)
+        if rng.random() < 0.2:
+            chord_input *= rng.randint(2, 4)  # ループする進行
+        algorithm = rng.choice(ALGORITHMS + ("manual",))
+        params = {"algorithm": algorithm, "include_midi": rng.random() < 0.5}
+        if algorithm == "manual":
+            params["manual_key"] = rng.choice(MANUAL_KEYS)
+        elif algorithm == "hybrid" and rng.random() < 0.5:
+            params.update(
+                traditional_weight=round(rng.random(), 2),
+                borrowed_chord_weight=round(rng.random(), 2),
+                triad_ratio_weight=round(rng.random(), 2),
+            )
+        cases.append(Case(chord_input, params))
+    return cases
+
+
+def optimized_analyze(chord_input: str, **params) -> dict:
+    """main.py のエンジンで分析し、レスポンスと同じ形の辞書を返す"""
+    from main import ChordAnalysisRequest, encode_json, json_loads, run_analysis, select_fields
+    request = ChordAnalysisRequest(chord_input=chord_input, **params)
+    return json_loads(encode_json(select_fields(run_analysis(request), request.fields)))
+
+
+def compare(reference, optimized, tolerance: float = DEFAULT_TOLERANCE, path: str = "") -> List[tuple]:
+    """2つのレスポンスを再帰的に比較し、(パス, 参照値, 最適化版の値) の一覧を返す（数値は許容誤差付き）"""
+    if isinstance(reference, dict) and isinstance(optimized, dict):
+        differences = []
+        for name in list(reference) + [name for name in optimized if name not in reference]:
+            if name not in optimized or name not in reference:
+                differences.append((f"{path}.{name}", reference.get(name), optimized.get(name)))
+            else:
+                differences.extend(compare(reference[name], optimized[name], tolerance, f"{path}.{name}"))
+        return differences
+    if isinstance(reference, list) and isinstance(optimized, list):
+        if len(reference) != len(optimized):
+            return [(f"{path}[len]", len(reference), len(optimized))]
+        differences = []
+        for index, (expected, actual) in enumerate(zip(reference, optimized)):
+            differences.extend(compare(expected, actual, tolerance, f"{path}[{index}]"))
+        return differences
+    numbers = (int, float)
+    if (isinstance(reference, numbers) and isinstance(optimized, numbers)
+            and not isinstance(reference, bool) and not isinstance(optimized, bool)):
+        return [] if abs(reference - optimized) <= tolerance else [(path, reference, optimized)]
+    return [] if reference == optimized else [(path, reference, optimized)]
+
+
+def run_cases(cases: List[Case], tolerance: float = DEFAULT_TOLERANCE) -> List[Divergence]:
+    divergences = []
+    for case in cases:
+        expected = reference_engine.reference_analyze(case.chord_input, **case.params)
+        actual = optimized_analyze(case.chord_input, **case.params)
+        for path, reference, optimized in compare(expected, actual, tolerance):
+            divergences.append(Divergence(case, path or "$", reference, optimized))
+    return divergences
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="最適化エンジンと参照実装の差分テスト")
+    parser.add_argument("--random", type=int, default=1000, help="ランダム生成する進行の数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-length", type=int, default=12, help="ランダム進行の最大コード数（ループ前）")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="数値の許容誤差")
+    parser.add_argument("--curated-only", action="store_true")
+    parser.add_argument("--show", type=int, default=20, help="表示する食い違いの最大件数")
+    args = parser.parse_args(argv)
+
+    cases = curated_corpus()
+    if not args.curated_only:
+        cases += random_corpus(args.random, args.seed, args.max_length)
+    divergences = run_cases(cases, args.tolerance)
+    for divergence in divergences[:args.show]:
+        print(f"{divergence.case.chord_input[:80]} {divergence.case.params}")
+        print(f"  {divergence.path}: reference={divergence.reference!r} optimized={divergence.optimized!r}")
+    diverged_cases = len({(d.case.chord_input, repr(d.case.params)) for d in divergences})
+    print(f"{len(cases)} cases, {diverged_cases} diverged, {len(divergences)} differences")
+    return 1 if divergences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,8 @@ export interface ChordAnalysisRequest {
   borrowed_chord_weight?: number;
   triad_ratio_weight?: number;
   manual_key?: string; // 手動指定キー
+  fields?: string[]; // 返却するレスポンス項目（未指定なら全項目）
+  include_midi?: boolean; // progression_detailsにMIDIノート番号を含める
 }
 
 export interface KeyCandidate {
@@ -30,6 +32,7 @@ export interface KeyEstimationResult {
 export interface ProgressionDetail {
   chord_symbol: string;
   components: string[];
+  midi_notes?: number[]; // include_midi指定時のみ
 }
 
 export interface ChordAnalysisResponse {
@@ -0,0 +1,33 @@
+# gunicorn設定 - 本番用プリフォーク・マルチワーカー構成
+#
+# preload_appにより main.py（コード語彙・キーテーブル・プロファイル）を親プロセスで一度だけ
+# 読み込んでからforkするため、ワーカーはそれらをcopy-on-writeで共有する。
+# 異常終了したワーカーはgunicornのマスタープロセスが自動的に再起動する。
+import gc
+import os
+
+def default_worker_count() -> int:
+    """利用可能なCPU数（コンテナのCPU割り当てを考慮）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", default_worker_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+# 長いコード進行の分析でもハートビート切れと判定されないように余裕を持たせる
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+def when_ready(server):
+    # fork前に構築済みオブジェクトをGC追跡対象から外し、ワーカー側のGCによる
+    # ページ書き込み（copy-on-writeの解除）を防ぐ
+    gc.freeze()
+    server.log.info("Theory tables loaded; forking %s workers", workers)
@@ -0,0 +1,306 @@
+"""
+SQLiteベースの非同期ジョブキュー（外部ブローカー不要）
+
+ジョブは複数の入力（アイテム）から成り、バックグラウンドのワーカースレッドが1件ずつ処理して
+結果をSQLiteに保存する。複数プロセス（gunicornワーカー）が同じDBファイルを共有でき、
+ジョブの取得は排他トランザクションで行う。
+
+- 進捗: 完了アイテム数 / 総アイテム数
+- キャンセル: アイテムの合間に状態を確認して中断
+- 再起動耐性: 処理中ジョブはリース期限付きで、期限切れ（プロセス停止）なら別ワーカーが
+  未完了アイテムから再開する。処理中はハートビートでリースを延長し続けるため、
+  1アイテムの処理がリース期間より長くかかっても別ワーカーに重複して処理されない
+- 保持期限: 終了したジョブは retention_seconds 経過後、または max_finished_jobs を超えた分から削除
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    input TEXT NOT NULL,
+    result BLOB,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class JobQueue:
+    """handler(input, params) -> bytes を各アイテムに適用するジョブキュー"""
+
+    def __init__(self, path: str, handler, workers: int = 1, lease_seconds: float = 300.0,
+                 retention_seconds: float = 24 * 3600, max_finished_jobs: int = 1000,
+                 poll_interval: float = 0.5, heartbeat_interval: float = None):
+        self.path = path
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    # --- 投入・照会 ---
+
+    def submit(self, inputs, params: dict) -> str:
+        """ジョブを投入してジョブIDを返す"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT INTO jobs (id, status, params, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(params), len(inputs), now, now),
+            )
+            connection.executemany(
+                "INSERT INTO job_items (job_id, idx, input) VALUES (?, ?, ?)",
+                ((job_id, idx, item) for idx, item in enumerate(inputs)),
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id: str):
+        """ジョブの状態（存在しなければNone）"""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT id, status, total, completed, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        job_id, status, total, completed, error, created_at, updated_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "completed": completed,
+            "progress": completed / total if total else 1.0,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100):
+        """完了済みアイテムの結果を (インデックス, 結果バイト列) のリストでページ単位に返す"""
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT idx, result FROM job_items WHERE job_id = ? AND result IS NOT NULL "
+                "AND idx >= ? ORDER BY idx LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def cancel(self, job_id: str) -> bool:
+        """未終了のジョブをキャンセルする（キャンセルできたらTrue）"""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                f"UPDATE jobs SET status = ?, updated_at = ?, lease_until = NULL "
+                f"WHERE id = ? AND status NOT IN ({','.join('?' * len(FINISHED_STATUSES))})",
+                (CANCELLED, time.time(), job_id, *FINISHED_STATUSES),
+            )
+            return cursor.rowcount > 0
+        finally:
+            connection.close()
+
+    def purge(self, now: float = None) -> int:
+        """保持期限切れ・保持数超過の終了済みジョブを削除する"""
+        now = time.time() if now is None else now
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            expired = [row[0] for row in connection.execute(
+                f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED_STATUSES, now - self.retention_seconds),
+            )]
+            expired += [row[0] for row in connection.execute(
+                f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND updated_at >= ? "
+                f"ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                (*FINISHED_STATUSES, now - self.retention_seconds, self.max_finished_jobs),
+            )]
+            for job_id in expired:
+                connection.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            connection.execute("COMMIT")
+            return len(expired)
+        finally:
+            connection.close()
+
+    # --- ワーカー ---
+
+    def start(self):
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self):
+        """待機中、またはリース切れの処理中ジョブを1件確保する"""
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT id, params FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, now + self.lease_seconds, now, row[0]),
+                )
+            connection.execute("COMMIT")
+            return row
+        finally:
+            connection.close()
+
+    def _renew_lease(self, job_id: str):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING),
+            )
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _lease_heartbeat(self, job_id: str):
+        """ブロック内の処理中、heartbeat_intervalごとにリースを延長する"""
+        finished = threading.Event()
+
+        def beat():
+            while not finished.wait(self.heartbeat_interval):
+                try:
+                    self._renew_lease(job_id)
+                except sqlite3.Error as e:
+                    print(f"Job lease renewal error: {e}")
+
+        thread = threading.Thread(target=beat, name=f"job-lease-{job_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            finished.set()
+            thread.join()
+
+    def run_once(self) -> bool:
+        """ジョブを1件処理する（処理するジョブが無ければFalse）"""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, params = claimed
+        params = json.loads(params)
+        connection = self._connect()
+        try:
+            pending = connection.execute(
+                "SELECT idx, input FROM job_items WHERE job_id = ? AND result IS NULL ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+            with self._lease_heartbeat(job_id):
+                for idx, item in pending:
+                    if self._stop.is_set():
+                        return True  # リース切れ後に別ワーカーが再開する
+                    try:
+                        result = self.handler(item, params)
+                    except Exception as e:
+                        connection.execute(
+                            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, lease_until = NULL "
+                            "WHERE id = ? AND status = ?",
+                            (FAILED, f"item {idx}: {e}", time.time(), job_id, RUNNING),
+                        )
+                        return True
+                    now = time.time()
+                    connection.execute("BEGIN IMMEDIATE")
+                    status = connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                    if status is None or status[0] != RUNNING:
+                        # キャンセルまたは削除された
+                        connection.execute("COMMIT")
+                        return True
+                    connection.execute(
+                        "UPDATE job_items SET result = ? WHERE job_id = ? AND idx = ?", (result, job_id, idx)
+                    )
+                    connection.execute(
+                        "UPDATE jobs SET completed = completed + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                        (now + self.lease_seconds, now, job_id),
+                    )
+                    connection.execute("COMMIT")
+            connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, lease_until = NULL WHERE id = ? AND status = ?",
+                (DONE, time.time(), job_id, RUNNING),
+            )
+            return True
+        finally:
+            connection.close()
+
+    def _worker_loop(self):
+        next_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() >= next_purge:
+                    self.purge()
+                    next_purge = time.time() + 60
+                if self.run_once():
+                    continue
+            except sqlite3.Error as e:
+                print(f"Job worker error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
@@ -1,13 +1,95 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple, FrozenSet
+from dataclasses import dataclass, asdict, is_dataclass
+from functools import lru_cache
+from operator import itemgetter
+from contextlib import asynccontextmanager
+import asyncio
+import gzip
+import hashlib
+import heapq
+import json
+import os
 import re
+import sqlite3
+import threading
+import time
+import traceback
+import zlib
 import numpy as np
 from pychord import Chord
 from sklearn.metrics.pairwise import cosine_similarity
+from admission import AdmissionController, OverloadedError
+from rate_limit import RateLimitMiddleware, TokenBucketLimiter
+from body_limit import BodySizeLimitMiddleware
+from single_flight import SingleFlight
+from job_queue import JobQueue
+from result_store import ResultStore
+from corpus_stats import CorpusStats
+from pipeline import Pipeline
+from profiling import RequestProfiler, StackSampler
+from chord_importers import ChordImportError, iter_text_chords
 
-app = FastAPI(title="Chord Progression Analyzer", version="1.0.0")
+try:
+    import orjson
+except ImportError:  # orjsonが無い環境では標準jsonで等価なJSONを生成する（浮動小数点の書式は異なる場合がある）
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpackが無い環境ではJSONのみ対応
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # brotliが無い環境ではgzipのみ対応
+    brotli = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にウォームアップをバックグラウンドで実行（完了まで/readyzは503）し、ジョブワーカーを起動"""
+    asyncio.get_running_loop().run_in_executor(None, warmup)
+    if job_queue is not None:
+        job_queue.start()
+    sampler = start_stack_sampler()
+    yield
+    if sampler is not None:
+        sampler.stop()
+    if job_queue is not None:
+        job_queue.stop()
+
+app = FastAPI(title="Chord Progression Analyzer", version="1.0.0", lifespan=lifespan)
+
+# ジョブ投入の本文全体の大きさの上限（JSONを解析する前に打ち切る）
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={"/jobs": int(os.environ.get("JOB_MAX_REQUEST_BYTES", str(64 * 1024 * 1024)))},
+)
+
+# クライアント（IPまたは登録済みのX-API-Key）ごとのレート制限
+# CORSより内側に置き、429レスポンスにもCORSヘッダが付くようにする
+app.add_middleware(
+    RateLimitMiddleware,
+    cheap=TokenBucketLimiter(
+        rate=float(os.environ.get("RATE_LIMIT_CHEAP_RATE", "10")),  # 毎秒の補充数
+        burst=int(os.environ.get("RATE_LIMIT_CHEAP_BURST", "60")),
+    ),
+    expensive=TokenBucketLimiter(
+        rate=float(os.environ.get("RATE_LIMIT_EXPENSIVE_RATE", "2")),
+        burst=int(os.environ.get("RATE_LIMIT_EXPENSIVE_BURST", "20")),
+    ),
+    expensive_paths=("/analyze", "/debug-voicing", "/jobs"),
+    exempt_paths=("/healthz", "/readyz"),
+    trust_forwarded_for=os.environ.get("RATE_LIMIT_TRUST_FORWARDED_FOR", "0") == "1",
+    api_keys=[key.strip() for key in os.environ.get("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()],
+    trusted_proxies=[ip.strip() for ip in os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if ip.strip()],
+    enabled=os.environ.get("RATE_LIMIT_ENABLED", "1") == "1",
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +107,9 @@ class ChordAnalysisRequest(BaseModel):
     borrowed_chord_weight: float = 0.3  # 借用和音最小化の重み
     triad_ratio_weight: float = 0.5  # トライアド比率分析の重み
     manual_key: str = None  # 手動指定キー（例: "C Major", "A Minor"）
+    fields: List[str] = None  # 返却するレスポンス項目（例: ["main_key"]）。未指定なら全項目
+    include_midi: bool = False  # progression_detailsにMIDIノート番号（midi_notes）を含める
+    input_format: str = "brackets"  # chord_inputの形式: "brackets"（[C][Am]）, "chordpro", "musicxml", "ireal"
 
 class KeyCandidate(BaseModel):
     key: str
@@ -45,6 +130,7 @@ class KeyEstimationResult(BaseModel):
 class ProgressionDetail(BaseModel):
     chord_symbol: str
     components: List[str]
+    midi_notes: List[int] = None  # include_midi指定時のみ（componentsと同順のMIDIノート番号）
 
 class AnalysisResponse(BaseModel):
     main_key: str
@@ -55,6 +141,232 @@ class AnalysisResponse(BaseModel):
     algorithm_used: str
     progression_details: List[ProgressionDetail]
 
+# 内部結果用の軽量構造体（slots付きdataclass）
+# レスポンスはpydanticを経由せずこれらから直接JSONバイト列へエンコードする。
+# フィールド順は上のpydanticモデル（=フロントエンドの型定義）と一致させること。
+@dataclass(slots=True)
+class KeyCandidateRecord:
+    key: str
+    relationship: str
+    confidence: float
+
+@dataclass(slots=True)
+class BorrowedChordRecord:
+    chord: str
+    non_diatonic_notes: List[str]
+    source_candidates: List[KeyCandidateRecord]
+
+@dataclass(slots=True)
+class KeyEstimationRecord:
+    key: str
+    confidence: float
+    borrowed_chord_count: int
+    algorithm: str
+
+@dataclass(slots=True)
+class ProgressionDetailRecord:
+    chord_symbol: str
+    components: List[str]
+
+@dataclass(slots=True)
+class ProgressionDetailMidiRecord:
+    chord_symbol: str
+    components: List[str]
+    midi_notes: List[int]
+
+@dataclass(slots=True)
+class AnalysisRecord:
+    main_key: str
+    confidence: float
+    borrowed_chords: List[BorrowedChordRecord]
+    pitch_class_vector: List[float]
+    key_candidates: List[KeyEstimationRecord]
+    algorithm_used: str
+    progression_details: List[ProgressionDetailRecord]
+
+def _json_default(obj):
+    """標準jsonエンコーダ用：dataclassを辞書に変換"""
+    if is_dataclass(obj):
+        return asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def encode_json(payload) -> bytes:
+    """レスポンスをJSONバイト列にエンコード（コンパクトなJSON）
+
+    orjsonでも標準jsonでも、キー・キーの順序・解析後の値はStarletteのJSONResponseと同じになる。
+    浮動小数点の表記（1e-05 と 1e-5 など）は実装により異なるため、バイト列の一致は保証しない。
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(
+        payload,
+        default=_json_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+def json_loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# レスポンス項目名（fieldsで選択可能な単位）
+RESPONSE_FIELDS = tuple(AnalysisResponse.model_fields.keys())
+
+def select_fields(record: AnalysisRecord, fields: List[str] = None):
+    """fields指定があれば、その項目だけを含む辞書に絞り込む"""
+    if not fields:
+        return record
+    return {name: getattr(record, name) for name in RESPONSE_FIELDS if name in fields}
+
+class FastJSONResponse(Response):
+    """内部構造体をpydanticの再検証なしで直接エンコードするレスポンス"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return encode_json(content)
+
+# MessagePackのメディアタイプ（先頭が正式名）
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+def _msgpack_default(obj):
+    """msgpack用：slots付きdataclassをフィールド順の辞書に変換"""
+    if is_dataclass(obj):
+        return {name: getattr(obj, name) for name in obj.__slots__}
+    raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+class MsgPackResponse(Response):
+    """JSONと同じスキーマをMessagePackでエンコードするレスポンス"""
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default)
+
+# レスポンス圧縮の設定（小さいレスポンスは圧縮しても遅延が増えるだけなので閾値未満は無圧縮）
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "4096"))  # バイト
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))  # 1-9（CPUコストを抑えた既定値）
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))  # 0-11（CPUコストを抑えた既定値）
+# 圧縮されたリクエストボディの展開後サイズ上限（圧縮爆弾対策）
+MAX_DECOMPRESSED_BODY_SIZE = int(os.environ.get("MAX_DECOMPRESSED_BODY_SIZE", str(32 * 1024 * 1024)))
+
+def _media_type(header_value: str) -> str:
+    return header_value.split(";", 1)[0].strip().lower()
+
+def _quality_values(header_value: str) -> dict:
+    """Accept系ヘッダを {値: q値} に変換"""
+    values = {}
+    for item in header_value.split(","):
+        name = _media_type(item)
+        if not name:
+            continue
+        q = 1.0
+        for param in item.split(";")[1:]:
+            param_name, _, param_value = param.partition("=")
+            if param_name.strip() == "q":
+                try:
+                    q = float(param_value)
+                except ValueError:
+                    q = 0.0
+        values[name] = max(values.get(name, 0.0), q)
+    return values
+
+def prefers_msgpack(accept: str) -> bool:
+    """AcceptヘッダでMessagePackがJSONより優先されているか（同順位ならJSON）"""
+    if not accept or msgpack is None:
+        return False
+    values = _quality_values(accept)
+    msgpack_q = max(values.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_q = max(values.get(media_type, 0.0) for media_type in ("application/json", "application/*", "*/*"))
+    return msgpack_q > json_q
+
+def choose_content_encoding(accept_encoding: str) -> str:
+    """Accept-Encodingから圧縮方式を選ぶ（brotli > gzip、非対応ならNone）"""
+    if not accept_encoding:
+        return None
+    values = _quality_values(accept_encoding)
+    wildcard_q = values.get("*", 0.0)
+    if brotli is not None and values.get("br", wildcard_q) > 0:
+        return "br"
+    if values.get("gzip", wildcard_q) > 0:
+        return "gzip"
+    return None
+
+def compress_response(response: Response, request: Request) -> Response:
+    """閾値以上のレスポンスをクライアントが対応する方式で圧縮する"""
+    response.headers["Vary"] = ", ".join(filter(None, [response.headers.get("Vary"), "Accept-Encoding"]))
+    if len(response.body) < COMPRESSION_MIN_SIZE:
+        return response
+    encoding = choose_content_encoding(request.headers.get("accept-encoding"))
+    if encoding == "br":
+        response.body = brotli.compress(response.body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        response.body = gzip.compress(response.body, compresslevel=GZIP_LEVEL, mtime=0)
+    else:
+        return response
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(response.body))
+    return response
+
+def decompress_request_body(body: bytes, content_encoding: str) -> bytes:
+    """gzip圧縮されたリクエストボディを上限付きで展開する"""
+    if content_encoding in ("", "identity"):
+        return body
+    if content_encoding not in ("gzip", "x-gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_DECOMPRESSED_BODY_SIZE)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Decompressed request body is too large")
+    return data
+
+def negotiate_response(content, request: Request) -> Response:
+    """Acceptヘッダに従ってJSON（既定）またはMessagePackでレスポンスを返す（大きい場合は圧縮）"""
+    if prefers_msgpack(request.headers.get("accept")):
+        response = MsgPackResponse(content)
+    else:
+        response = FastJSONResponse(content)
+    response.headers["Vary"] = "Accept"
+    return compress_response(response, request)
+
+class NegotiatedRoute(APIRoute):
+    """MessagePack・gzip圧縮のリクエストボディを受け付けるルート（JSONとしてバリデーションする）"""
+
+    def get_route_handler(self):
+        original_handler = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type")
+            content_encoding = request.headers.get("content-encoding", "").strip().lower()
+            is_msgpack = bool(content_type) and _media_type(content_type) in MSGPACK_MEDIA_TYPES
+            if is_msgpack or content_encoding:
+                body = decompress_request_body(await request.body(), content_encoding)
+                if is_msgpack:
+                    if msgpack is None:
+                        raise HTTPException(status_code=415, detail="MessagePack is not supported on this server")
+                    try:
+                        data = msgpack.unpackb(body)
+                    except Exception:
+                        raise HTTPException(status_code=400, detail="Invalid MessagePack body")
+                # 展開・デコード済みボディをJSONとしてFastAPIのバリデーションに渡す
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (name, b"application/json" if is_msgpack and name == b"content-type" else value)
+                    for name, value in request.scope["headers"]
+                    if name != b"content-encoding"
+                ]
+                request = Request(scope, request.receive)
+                request._body = body
+                if is_msgpack:
+                    request._json = data
+            return await original_handler(request)
+
+        return handler
+
+app.router.route_class = NegotiatedRoute
+
 # Constants
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
@@ -80,6 +392,14 @@ def extract_chords(chord_input: str) -> List[str]:
     valid_chords = [chord.strip() for chord in matches if is_valid_chord(chord.strip())]
     return valid_chords
 
+INPUT_FORMATS = ("brackets", "chordpro", "musicxml", "ireal")
+
+def extract_chords_for_format(chord_input: str, input_format: str = "brackets") -> List[str]:
+    """入力形式に応じてコードを抽出する（未知の形式・解析できない入力はChordImportError）"""
+    if input_format == "brackets":
+        return extract_chords(chord_input)
+    return [chord.strip() for chord in iter_text_chords(chord_input, input_format) if is_valid_chord(chord.strip())]
+
 def normalize_note(note: str) -> str:
     """音名を正規化（異名同音を統一）"""
     replacements = {
@@ -93,8 +413,68 @@ def note_to_pitch_class(note: str) -> int:
     normalized_note = normalize_note(note)
     return NOTES.index(normalized_note) if normalized_note in NOTES else 0
 
+# NOTESに正規化できない音名（Cb, E#, ダブルシャープなど）の番号。どのキーでもダイアトニックにならない
+UNRECOGNIZED_NOTE = 12
+
+# 音名の文字 → 同じオクターブ番号のCからの半音数
+LETTER_SEMITONES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+def note_semitone(note: str) -> int:
+    """音名の文字と変化記号から、同じオクターブ番号のCからの半音数を求める（B#は12、Cbは-1、F##は7）"""
+    return LETTER_SEMITONES[note[0]] + note.count('#') - note.count('b')
+
+def note_index(note: str) -> int:
+    """正規化した音名のNOTES上の位置（正規化できなければUNRECOGNIZED_NOTE）"""
+    normalized_note = normalize_note(note)
+    return NOTES.index(normalized_note) if normalized_note in NOTES else UNRECOGNIZED_NOTE
+
+# コード解析・ボイシングのメモ化サイズ（コードトークン単位）
+CHORD_CACHE_SIZE = 4096
+
+# 括弧記法テンションのコア部分を分離する正規表現: Bm7(13) -> "Bm7", "13"
+BRACKET_TENSION_PATTERN = re.compile(r'^([A-G][#b]?(?:maj|m|dim|aug|sus[24]?)?(?:7|maj7|mM7|M7|6|add\d+)?)\(([^)]+)\)$')
+
+@dataclass(slots=True, frozen=True)
+class ParsedChord:
+    """解析済みコード（構成音名・ピッチクラス・括弧記法テンション）"""
+    components: Tuple[str, ...]
+    pitch_classes: Tuple[int, ...]
+    bracket_tensions: FrozenSet[str]  # 括弧記法で追加されたテンション音（コア部分に無い音）
+    note_counts: Tuple[int, ...]  # ピッチクラスごとの構成音数（13要素目はNOTESに正規化できない音名の数）
+    note_mask: int  # 構成音のnote_indexのビットマスク
+
+@lru_cache(maxsize=CHORD_CACHE_SIZE)
+def parse_chord(chord_symbol: str) -> ParsedChord:
+    """コードトークンを一度だけ解析してキャッシュする"""
+    components = tuple(_compute_chord_components(chord_symbol))
+    
+    bracket_tensions = frozenset()
+    tension_match = BRACKET_TENSION_PATTERN.match(chord_symbol)
+    if tension_match:
+        try:
+            core_components = Chord(tension_match.group(1)).components()
+            bracket_tensions = frozenset(note for note in components if note not in core_components)
+        except Exception:
+            pass
+    
+    note_counts = [0] * 13
+    for note in components:
+        note_counts[note_index(note)] += 1
+    
+    return ParsedChord(
+        components=components,
+        pitch_classes=tuple(note_to_pitch_class(note) for note in components),
+        bracket_tensions=bracket_tensions,
+        note_counts=tuple(note_counts),
+        note_mask=sum(1 << index for index, count in enumerate(note_counts) if count)
+    )
+
 def get_chord_components(chord_symbol: str) -> List[str]:
     """コード構成音を取得（括弧記法テンション対応）"""
+    return list(parse_chord(chord_symbol).components)
+
+def _compute_chord_components(chord_symbol: str) -> List[str]:
+    """コード構成音を計算（キャッシュなし）"""
     import re
     
     # 括弧記法の分解: Bm7(13) -> コア部分="Bm7", テンション部分="13"
@@ -298,145 +678,94 @@ def calculate_tension_pitch_class(root_pc: int, interval: int, modifier: str) ->
     tension_pc = (root_pc + base_interval) % 12
     return tension_pc
 
-def optimize_root_octave(root_pc: int, core_notes: List[tuple], base_root_octave: int, base_octave: int) -> int:
-    """ルートオクターブを最適化（実際のボイシング後の音高を考慮）"""
-    if not core_notes:
-        # コア音がない場合は1オクターブ上げて自然なレンジにする
-        return base_root_octave + 1
-    
-    # 各コア音の実際の配置オクターブを予測
+@lru_cache(maxsize=CHORD_CACHE_SIZE)
+def voice_chord(chord_symbol: str, base_octave: int = 3) -> Tuple[Tuple[str, int, int], ...]:
+    """コードを整数（MIDIノート番号）ベースでボイシングする
+
+    戻り値は (音名, オクターブ, MIDIノート番号) のタプル列。(コード, base_octave) ごとにメモ化される。
+    """
+    parsed = parse_chord(chord_symbol)
+    if not parsed.components:
+        return ()
+    
+    symbol_has_11 = '11' in chord_symbol
+    symbol_has_13 = '13' in chord_symbol
+    # MIDI番号は綴りどおりの音名・オクターブに合わせる（E#はF、B#3はC4、Cb3はB2と同じ高さ）
+    semitones = [note_semitone(note) for note in parsed.components]
+    root_semitone = semitones[0]
+    
+    # 音程に基づいて構成音を分類（ルート、コア音、テンション音）: (音程, 音名, Cからの半音数)
+    root_notes = []      # ルート音
+    core_notes = []      # 3rd, 5th, 7th
+    tension_notes = []   # 9th, 11th, 13th
+    
+    for note, pc in zip(parsed.components, semitones):
+        interval = (pc - root_semitone) % 12
+        
+        # 括弧記法で追加された音は強制的にテンション分類
+        if note in parsed.bracket_tensions:
+            tension_notes.append((interval, note, pc))
+        elif interval == 0:  # ルート
+            root_notes.append((interval, note, pc))
+        elif interval in (1, 2):  # 9th (2nd)
+            tension_notes.append((interval, note, pc))
+        elif interval in (5, 6) and symbol_has_11:  # 11th（sus4などは4度をコア音扱い）
+            tension_notes.append((interval, note, pc))
+        elif interval in (8, 9) and symbol_has_13:  # 13th
+            tension_notes.append((interval, note, pc))
+        else:  # 3rd, 4th, 5th, 6th, 7th
+            core_notes.append((interval, note, pc))
+    
+    # 各グループ内で音程順にソート（安定ソート）
+    core_notes.sort(key=lambda x: x[0])
+    tension_notes.sort(key=lambda x: x[0])
+    
+    voiced = []
+    
+    # 1. コア音を中心オクターブ（base_octave）に配置、音が下行する場合はオクターブを上げる
     core_octave = base_octave
-    last_pc = -1
-    actual_core_notes = []
-    
-    for note, interval in sorted(core_notes, key=lambda x: x[1]):
-        pc = note_to_pitch_class(note)
-        if pc < last_pc:  # 音が下行する場合はオクターブを上げる
+    last_core_pc = -1
+    for _, note, pc in core_notes:
+        if pc < last_core_pc:
             core_octave += 1
-        actual_core_notes.append((note, pc, core_octave))
-        last_pc = pc
-    
-    # 最低コア音の実際のMIDI番号を計算
-    lowest_core_midi = min((octave + 1) * 12 + pc for _, pc, octave in actual_core_notes)
-    
-    # ルートを1オクターブ上げた場合のMIDI番号
-    optimized_root_midi = (base_root_octave + 1 + 1) * 12 + root_pc
-    
-    # ルートが最低音を維持できるかチェック
-    if optimized_root_midi < lowest_core_midi:
-        return base_root_octave + 1
-    else:
-        return base_root_octave
+        voiced.append((note, core_octave, (core_octave + 1) * 12 + pc))
+        last_core_pc = pc
+    
+    # 2. ルート音を最適なオクターブに配置
+    if root_notes:
+        _, root_note, root_pc = root_notes[0]
+        root_octave = base_octave - 1 if base_octave > 1 else base_octave
+        if not voiced:
+            # コア音がない場合は1オクターブ上げて自然なレンジにする
+            root_octave += 1
+        elif (root_octave + 2) * 12 + root_pc < min(midi for _, _, midi in voiced):
+            # ルートを1オクターブ上げても最低音を維持できる
+            root_octave += 1
+        voiced.insert(0, (root_note, root_octave, (root_octave + 1) * 12 + root_pc))
+    
+    # 3. テンション音は常にコア音より高いオクターブに配置
+    tension_octave = core_octave + 1
+    for _, note, pc in tension_notes:
+        voiced.append((note, tension_octave, (tension_octave + 1) * 12 + pc))
+    
+    return tuple(voiced)
 
 def get_chord_components_with_voicing(chord_symbol: str, base_octave: int = 3) -> List[str]:
     """コード構成音を、音楽理論に基づいた自然なボイシングで取得する"""
     try:
-        components = get_chord_components(chord_symbol)
-        if not components:
-            return []
-
-        root_note = components[0]
-        root_pc = note_to_pitch_class(root_note)
-
-        # 音程に基づいて構成音を分類（ルート、コア音、テンション音）
-        root_notes = []      # ルート音
-        core_notes = []      # 3rd, 5th, 7th
-        tension_notes = []   # 9th, 11th, 13th
-        
-        # 括弧記法で追加されたテンション音を特定
-        bracket_tensions = []
-        if '(' in chord_symbol and ')' in chord_symbol:
-            # コア部分とテンション部分を分離
-            import re
-            tension_match = re.match(r'^([A-G][#b]?(?:maj|m|dim|aug|sus[24]?)?(?:7|maj7|mM7|M7|6|add\d+)?)\(([^)]+)\)$', chord_symbol)
-            if tension_match:
-                core_chord_str = tension_match.group(1)
-                try:
-                    core_chord = Chord(core_chord_str)
-                    core_components = core_chord.components()
-                    # コア音以外はテンション音
-                    bracket_tensions = [note for note in components if note not in core_components]
-                except:
-                    pass
-        
-        for note in components:
-            pc = note_to_pitch_class(note)
-            interval = (pc - root_pc + 12) % 12
-            
-            # 括弧記法で追加された音は強制的にテンション分類
-            if note in bracket_tensions:
-                tension_notes.append((note, interval))
-            elif interval == 0:  # ルート
-                root_notes.append((note, interval))
-            elif interval in [1, 2]:  # 9th (2nd)
-                tension_notes.append((note, interval))
-            elif interval in [3, 4]:  # 3rd
-                core_notes.append((note, interval))
-            elif interval in [5, 6]:  # 4th/11th
-                if '11' in chord_symbol or 'sus4' in chord_symbol:
-                    if '11' in chord_symbol:
-                        tension_notes.append((note, interval))
-                    else:
-                        core_notes.append((note, interval))
-                else:
-                    core_notes.append((note, interval))
-            elif interval == 7:  # 5th
-                core_notes.append((note, interval))
-            elif interval in [8, 9]:  # 6th/13th
-                if '13' in chord_symbol:
-                    tension_notes.append((note, interval))
-                else:
-                    core_notes.append((note, interval))
-            elif interval in [10, 11]:  # 7th
-                core_notes.append((note, interval))
-            else:
-                core_notes.append((note, interval))
-        
-        # 各グループ内で音程順にソート
-        core_notes.sort(key=lambda x: x[1])
-        tension_notes.sort(key=lambda x: x[1])
-        
-        # 新しいボイシングロジック：コア音中心配置
-        voiced_notes = []
-        
-        # 1. コア音を中心オクターブ（base_octave）に配置
-        core_octave = base_octave
-        last_core_pc = -1
-        
-        for note, interval in core_notes:
-            pc = note_to_pitch_class(note)
-            if pc < last_core_pc:  # 音が下行する場合はオクターブを上げる
-                core_octave += 1
-            voiced_notes.append(f"{note}{core_octave}")
-            last_core_pc = pc
-        
-        # 2. ルート音を最適なオクターブに配置
-        if root_notes:
-            root_note, _ = root_notes[0]
-            root_pc = note_to_pitch_class(root_note)
-            
-            # 基本ルートオクターブ
-            base_root_octave = base_octave - 1 if base_octave > 1 else base_octave
-            
-            # ルートオクターブ最適化: ルートを上げても音列が崩れないかチェック
-            optimized_root_octave = optimize_root_octave(root_pc, core_notes, base_root_octave, base_octave)
-            
-            # ルート音をリストの最初に挿入
-            voiced_notes.insert(0, f"{root_note}{optimized_root_octave}")
-        
-        # 3. テンション音をコア音より高く配置
-        for note, interval in tension_notes:
-            # テンション音は常にコア音より高いオクターブに配置
-            tension_octave = core_octave + 1
-            voiced_notes.append(f"{note}{tension_octave}")
-
-        print(f"Voicing for {chord_symbol}: {voiced_notes}") # DEBUGGING PRINT
-        return voiced_notes
-
+        return [f"{note}{octave}" for note, octave, _ in voice_chord(chord_symbol, base_octave)]
     except Exception as e:
         print(f"Error in voicing {chord_symbol}: {e}")
         return [f"{n}{base_octave}" for n in get_chord_components(chord_symbol)]
 
+def get_chord_midi_voicing(chord_symbol: str, base_octave: int = 3) -> List[int]:
+    """ボイシング済み構成音をMIDIノート番号で取得する"""
+    try:
+        return [midi for _, _, midi in voice_chord(chord_symbol, base_octave)]
+    except Exception as e:
+        print(f"Error in voicing {chord_symbol}: {e}")
+        return [(base_octave + 1) * 12 + note_semitone(note) for note in parse_chord(chord_symbol).components]
+
 def create_pitch_class_vector(chords: List[str]) -> np.ndarray:
     """12次元ピッチクラスベクトルを作成（改良版：重み付けあり）"""
     vector = np.zeros(12)
@@ -486,7 +815,7 @@ def find_best_key(pitch_vector: np.ndarray):
         if enhanced_vector[fifth] > 0:
             enhanced_vector[fifth] *= 1.4
         
-        major_profile = rotate_profile(KRUMHANSL_MAJOR, root)
+        major_profile = KEY_PROFILES[(root, "Major")]
         similarity = cosine_similarity([enhanced_vector], [major_profile])[0][0]
         
         if similarity > best_similarity:
@@ -508,7 +837,7 @@ def find_best_key(pitch_vector: np.ndarray):
         if enhanced_vector[fifth] > 0:
             enhanced_vector[fifth] *= 1.4
         
-        minor_profile = rotate_profile(KRUMHANSL_MINOR, root)
+        minor_profile = KEY_PROFILES[(root, "Minor")]
         similarity = cosine_similarity([enhanced_vector], [minor_profile])[0][0]
         
         if similarity > best_similarity:
@@ -519,38 +848,14 @@ def find_best_key(pitch_vector: np.ndarray):
 
 def find_key_by_borrowed_chord_minimization(chords: List[str]):
     """借用和音が最少になるキーを探す"""
-    all_keys = get_all_keys()
+    table = key_membership_table(tuple(chords))
     best_key = None
     min_borrowed_count = float('inf')
     best_confidence = 0
     
-    for key in all_keys:
-        diatonic_notes = get_diatonic_notes(key)
-        normalized_diatonic_notes = [normalize_note(note) for note in diatonic_notes]
-        
-        borrowed_count = 0
-        total_chord_notes = 0
-        matching_notes = 0
-        
-        for chord_symbol in chords:
-            chord_notes = get_chord_components(chord_symbol)
-            total_chord_notes += len(chord_notes)
-            
-            # このコードが借用和音かどうかをチェック
-            normalized_chord_notes = [normalize_note(note) for note in chord_notes]
-            non_diatonic_notes = [note for note in chord_notes 
-                                if normalize_note(note) not in normalized_diatonic_notes]
-            
-            if non_diatonic_notes:
-                borrowed_count += 1
-            
-            # マッチする音の数もカウント（信頼度計算用）
-            for note in chord_notes:
-                if normalize_note(note) in normalized_diatonic_notes:
-                    matching_notes += 1
-        
+    for key, borrowed_count, matching_notes in zip(get_all_keys(), table.borrowed_counts, table.matching_notes):
         # 信頼度 = ダイアトニック音の割合
-        confidence = matching_notes / total_chord_notes if total_chord_notes > 0 else 0
+        confidence = matching_notes / table.total_notes if table.total_notes > 0 else 0
         
         # より少ない借用和音、同じ借用和音数なら高い信頼度を優先
         if (borrowed_count < min_borrowed_count or 
@@ -629,6 +934,13 @@ HARMONIC_MINOR_INTERVALS = [0, 2, 3, 5, 7, 8, 11]  # W-H-W-W-H-W+H-H (7度が短
 
 def get_diatonic_notes(key: str) -> List[str]:
     """指定されたキーのダイアトニック音を取得"""
+    notes = DIATONIC_NOTES_BY_KEY.get(key)
+    if notes is not None:
+        return list(notes)
+    return _compute_diatonic_notes(key)
+
+def _compute_diatonic_notes(key: str) -> List[str]:
+    """ダイアトニック音を計算（テーブルなし）"""
     parts = key.split()
     if len(parts) < 2:
         return []
@@ -658,11 +970,25 @@ def get_diatonic_notes(key: str) -> List[str]:
     return diatonic_notes
 
 def detect_non_diatonic_notes(chords: List[str], main_key: str) -> List[dict]:
-    """非ダイアトニック音を含むコードを検出"""
+    """非ダイアトニック音を含むコードを検出（indexは進行内の位置）"""
+    key_position = MAIN_KEY_POSITIONS.get(main_key)
+    if key_position is not None:
+        # 24キーのいずれかなら移調で共有される照合表から位置を引き、音名は元のコードから取り出す
+        mask = KEY_PITCH_CLASS_MASKS[main_key]
+        non_diatonic_chords = []
+        for index in np.flatnonzero(key_membership_table(tuple(chords)).non_diatonic[:, key_position]).tolist():
+            chord_notes = get_chord_components(chords[index])
+            non_diatonic_chords.append({
+                'chord': chords[index],
+                'non_diatonic_notes': [note for note in chord_notes if not mask >> note_index(note) & 1],
+                'index': index
+            })
+        return non_diatonic_chords
+    
     diatonic_notes = get_diatonic_notes(main_key)
     non_diatonic_chords = []
     
-    for chord_symbol in chords:
+    for index, chord_symbol in enumerate(chords):
         chord_notes = get_chord_components(chord_symbol)
         # 正規化して比較
         normalized_chord_notes = [normalize_note(note) for note in chord_notes]
@@ -673,7 +999,8 @@ def detect_non_diatonic_notes(chords: List[str], main_key: str) -> List[dict]:
         if non_diatonic_notes:
             non_diatonic_chords.append({
                 'chord': chord_symbol,
-                'non_diatonic_notes': non_diatonic_notes
+                'non_diatonic_notes': non_diatonic_notes,
+                'index': index
             })
     
     return non_diatonic_chords
@@ -695,69 +1022,131 @@ def get_all_keys_for_borrowing() -> List[str]:
         keys.append(f"{note} Harmonic Minor")  # 借用元候補として追加
     return keys
 
-def find_borrowed_sources(non_diatonic_chords: List[dict], main_key: str, all_chords: List[str] = None) -> List[BorrowedChord]:
-    """借用元キー候補を特定（前後のコードコンテキスト考慮）"""
+# 移調で不変なキー照合表
+# 借用和音数・ダイアトニック音数は構成音のピッチクラス（正規化した音名）だけで決まるため、
+# コードをルート相対の形（移調の同値類の代表）に直して一度だけ計算し、移調量だけ回して使い回す。
+# 整数の集計なので回した結果は直接計算と完全に一致する。キャッシュはコード単位（進行単位では巨大な進行の表を保持してしまう）。
+TRANSPOSITION_CACHE_SIZE = int(os.environ.get("TRANSPOSITION_CACHE_SIZE", "1024"))
+
+@dataclass(slots=True, frozen=True)
+class KeyMembershipTable:
+    """24キー（get_all_keysの順）ごとの照合結果"""
+    borrowed_counts: Tuple[int, ...]  # 非ダイアトニック音を含むコードの数
+    matching_notes: Tuple[int, ...]  # ダイアトニックな構成音の数（重複を含む）
+    non_diatonic: np.ndarray  # (コード数, 24) の真偽値：そのキーで非ダイアトニック音を含むコード
+    total_notes: int
+
+def chord_canonical_form(chord_symbol: str) -> Tuple[bytes, int]:
+    """コードを (ルート相対の構成音数のバイト列, 移調量) に分解する
+
+    移調量はルートのピッチクラス。移調しただけのコード（Dm7・Em7・Fm7など）は同じ代表に写る。
+    """
+    parsed = parse_chord(chord_symbol)
+    offset = 0
+    if parsed.components:
+        root = note_index(parsed.components[0])
+        offset = root if root != UNRECOGNIZED_NOTE else 0
+    columns = [(pc + offset) % 12 for pc in range(12)] + [UNRECOGNIZED_NOTE]
+    return bytes(parsed.note_counts[column] for column in columns), offset
+
+@lru_cache(maxsize=TRANSPOSITION_CACHE_SIZE)
+def canonical_key_membership(canonical: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """ルート相対のコードに対する24キーの (ダイアトニック音数, 非ダイアトニック音を含むか)（移調の同値類ごとに一度だけ計算）
+
+    13要素の構成音数と (24 × 13) のキーマスク行列の積で、全キーのダイアトニック音数を一度に求める。
+    ダイアトニック音数がそのコードの構成音数に満たなければ非ダイアトニック音を含む（借用和音）。
+    """
+    counts = np.frombuffer(canonical, dtype=np.uint8).astype(np.int64)
+    matching = KEY_MASK_MATRIX @ counts
+    return matching, matching < counts.sum()
+
+@lru_cache(maxsize=CHORD_CACHE_SIZE)
+def chord_key_membership(chord_symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+    """コードに対する24キー（get_all_keysの順）の (ダイアトニック音数, 非ダイアトニック音を含むか)
+
+    移調の代表の結果を移調量だけ回す。キャッシュはコード単位なので、保持する量は進行の長さに依存しない。
+    """
+    canonical, offset = chord_canonical_form(chord_symbol)
+    matching, borrowed = canonical_key_membership(canonical)
+    # get_all_keysはルートごとに (Major, Minor) の順。元のキーのルートRは代表ではR - offset
+    order = [((index // 2 - offset) % 12) * 2 + index % 2 for index in range(24)]
+    matching, borrowed = matching[order], borrowed[order]
+    matching.flags.writeable = borrowed.flags.writeable = False
+    return matching, borrowed
+
+def key_membership_table(chords: Tuple[str, ...]) -> KeyMembershipTable:
+    """進行に対する24キーの照合表（コードごとにキャッシュした照合結果を積み重ねる）"""
+    rows = [chord_key_membership(chord_symbol) for chord_symbol in chords]
+    matching = np.array([row[0] for row in rows], dtype=np.int64).reshape(-1, 24)
+    borrowed = np.array([row[1] for row in rows], dtype=bool).reshape(-1, 24)
+    return KeyMembershipTable(
+        borrowed_counts=tuple(borrowed.sum(axis=0).tolist()),
+        matching_notes=tuple(matching.sum(axis=0).tolist()),
+        non_diatonic=borrowed,
+        total_notes=sum(sum(parse_chord(chord_symbol).note_counts) for chord_symbol in chords)
+    )
+
+MAX_SOURCE_CANDIDATES = 5  # 借用元の候補数（ハーモニックマイナー含むため拡張）
+SOURCE_CANDIDATE_CACHE_SIZE = 8192
+
+@lru_cache(maxsize=SOURCE_CANDIDATE_CACHE_SIZE)
+def score_source_candidates(chord_notes: Tuple[str, ...], context_notes: FrozenSet[str], main_key: str) -> Tuple[Tuple[str, str, float], ...]:
+    """構成音・前後のコードの構成音（音名の集合）・メインキーに対する借用元候補 (キー, 関係, 信頼度) の上位
+
+    信頼度は音名の綴りで照合するため、ピッチクラスではなく音名をキーにメモ化する。
+    ループする進行では同じ組み合わせが繰り返し現れるので一度だけ計算される。
+    """
+    chord_notes = list(chord_notes)
+    context = list(context_notes) if context_notes else None
+    chord_mask = sum(1 << note_index(note) for note in chord_notes)
+    # 全キーとの照合：構成音がすべてダイアトニックなキーだけを (信頼度, キー) で採点する
+    scored = []
+    for key in get_all_keys_for_borrowing():  # ハーモニックマイナー含む
+        if key == main_key or chord_mask & ~KEY_PITCH_CLASS_MASKS[key]:
+            continue
+        scored.append((float(calculate_key_confidence(chord_notes, key, context, main_key=main_key)), key))
+    # 信頼度順の上位（同点はキー順。ソートして先頭を取るのと同じ結果）だけを候補にする
+    return tuple(
+        (key, analyze_relationship(main_key, key), confidence)
+        for confidence, key in heapq.nlargest(MAX_SOURCE_CANDIDATES, scored, key=itemgetter(0))
+    )
+
+def find_borrowed_sources(non_diatonic_chords: List[dict], main_key: str, all_chords: List[str] = None) -> List[BorrowedChordRecord]:
+    """借用元キー候補を特定（出現ごとに直前・直後のコードをコンテキストとして考慮）
+
+    non_diatonic_chordsの'index'（detect_non_diatonic_notesが付ける進行内の位置）で出現を特定する。
+    'index'が無い場合はall_chords内で前の出現の後ろから同じコードを探す。
+    """
     borrowing_candidates = []
-    all_keys = get_all_keys_for_borrowing()  # ハーモニックマイナー含む
-    
-    # コード進行インデックスマップを作成（コンテキスト取得用）
-    chord_index_map = {}
-    if all_chords:
-        for i, chord in enumerate(all_chords):
-            chord_index_map[chord] = i
+    search_from = 0
     
     for chord_info in non_diatonic_chords:
         chord_symbol = chord_info['chord']
-        chord_notes = get_chord_components(chord_symbol)
         
         # 前後のコードの構成音を取得（コンテキスト）
-        context_notes = []
-        if all_chords and chord_symbol in chord_index_map:
-            current_index = chord_index_map[chord_symbol]
-            
-            # 前のコードの構成音
-            if current_index > 0:
-                prev_chord = all_chords[current_index - 1]
-                prev_notes = get_chord_components(prev_chord)
-                context_notes.extend(prev_notes)
-            
-            # 次のコードの構成音
-            if current_index < len(all_chords) - 1:
-                next_chord = all_chords[current_index + 1]
-                next_notes = get_chord_components(next_chord)
-                context_notes.extend(next_notes)
-        
-        # 重複除去
-        context_notes = list(set(context_notes)) if context_notes else None
-        
-        source_candidates = []
-        
-        # 全24キーとの照合
-        for key in all_keys:
-            if key == main_key:
-                continue
-                
-            key_notes = get_diatonic_notes(key)
-            # このキーですべての構成音がダイアトニックかチェック（正規化して比較）
-            normalized_chord_notes = [normalize_note(note) for note in chord_notes]
-            normalized_key_notes = [normalize_note(note) for note in key_notes]
-            if all(note in normalized_key_notes for note in normalized_chord_notes):
-                relationship = analyze_relationship(main_key, key)
-                confidence = calculate_key_confidence(chord_notes, key, context_notes, main_key=main_key)
-                
-                source_candidates.append(KeyCandidate(
-                    key=key,
-                    relationship=relationship,
-                    confidence=confidence
-                ))
+        context_notes = frozenset()
+        if all_chords:
+            index = chord_info.get('index')
+            if index is None:
+                try:
+                    index = all_chords.index(chord_symbol, search_from)
+                except ValueError:
+                    index = None
+            if index is not None:
+                search_from = index + 1
+                neighbours = all_chords[max(index - 1, 0):index] + all_chords[index + 1:index + 2]
+                context_notes = frozenset(note for neighbour in neighbours for note in get_chord_components(neighbour))
         
-        # 信頼度順にソート
-        source_candidates.sort(key=lambda x: x.confidence, reverse=True)
+        source_candidates = [
+            KeyCandidateRecord(key=key, relationship=relationship, confidence=confidence)
+            for key, relationship, confidence in score_source_candidates(
+                parse_chord(chord_symbol).components, context_notes, main_key)
+        ]
         
-        borrowing_candidates.append(BorrowedChord(
+        borrowing_candidates.append(BorrowedChordRecord(
             chord=chord_symbol,
             non_diatonic_notes=chord_info['non_diatonic_notes'],
-            source_candidates=source_candidates[:5]  # 上位5候補（ハーモニックマイナー含むため拡張）
+            source_candidates=source_candidates
         ))
     
     return borrowing_candidates
@@ -882,117 +1271,380 @@ def calculate_key_confidence(chord_notes: List[str], key: str, context_notes: Li
     total_confidence = basic_confidence + context_bonus + relationship_bonus
     return min(total_confidence, 1.0)
 
+# 理論テーブル（キー・プロファイル・コード語彙）
+# プロセス起動時に一度だけ構築する。プリフォーク運用（gunicorn.conf.py）では親プロセスで
+# 構築されたものをワーカーがcopy-on-writeで共有する。
+DIATONIC_NOTES_BY_KEY = {}  # キー名 -> ダイアトニック音（ハーモニックマイナー含む）
+KEY_PROFILES = {}  # (ルートのピッチクラス, "Major"/"Minor") -> 回転済みKrumhanslプロファイル
+KEY_PITCH_CLASS_MASKS = {}  # キー名 -> ダイアトニック音のピッチクラスのビットマスク
+MAIN_KEY_POSITIONS = {}  # 24キーのキー名 -> get_all_keys()での位置
+KEY_MASK_MATRIX = np.zeros((24, 13), dtype=np.int64)  # 24キー（get_all_keysの順）× ピッチクラス（13列目は常に0）
+
+# 事前解析するコード語彙（ルート表記 × よく使われるコード品質）
+VOCABULARY_ROOTS = ['C', 'C#', 'Db', 'D', 'D#', 'Eb', 'E', 'F', 'F#', 'Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B']
+VOCABULARY_QUALITIES = [
+    '', 'm', '7', 'M7', 'maj7', 'm7', 'mM7', '6', 'm6', 'dim', 'dim7', 'aug', 'sus2', 'sus4', '7sus4',
+    'm7b5', 'add9', '9', 'm9', 'M9', '11', '13', '7(9)', '7(b9)', '7(13)', 'M7(9)', 'm7(9)', 'm7(11)',
+]
+
+def build_theory_tables():
+    """キー・プロファイル表を構築し、コード語彙の解析・ボイシングキャッシュを埋める"""
+    for key in get_all_keys_for_borrowing():
+        DIATONIC_NOTES_BY_KEY[key] = tuple(_compute_diatonic_notes(key))
+        KEY_PITCH_CLASS_MASKS[key] = sum(1 << note_index(note) for note in set(DIATONIC_NOTES_BY_KEY[key]))
+    for position, key in enumerate(get_all_keys()):
+        MAIN_KEY_POSITIONS[key] = position
+        KEY_MASK_MATRIX[position, :12] = [KEY_PITCH_CLASS_MASKS[key] >> pc & 1 for pc in range(12)]
+    for root in range(12):
+        KEY_PROFILES[(root, "Major")] = rotate_profile(KRUMHANSL_MAJOR, root)
+        KEY_PROFILES[(root, "Minor")] = rotate_profile(KRUMHANSL_MINOR, root)
+    for root in VOCABULARY_ROOTS:
+        for quality in VOCABULARY_QUALITIES:
+            voice_chord(root + quality)
+
+build_theory_tables()
+
+# アドミッション制御・入力サイズ制限（過負荷時は全員を遅くするより少数を速く返す）
+MAX_CONCURRENT_ANALYSES = int(os.environ.get("MAX_CONCURRENT_ANALYSES", "4"))
+MAX_QUEUED_ANALYSES = int(os.environ.get("MAX_QUEUED_ANALYSES", "16"))
+ANALYSIS_QUEUE_TIMEOUT = float(os.environ.get("ANALYSIS_QUEUE_TIMEOUT", "5"))  # 秒（フロントエンドのタイムアウトより短く）
+MAX_INPUT_CHARS = int(os.environ.get("MAX_INPUT_CHARS", "20000"))
+# brackets以外の形式（MusicXML・ChordPro・iReal）の上限。マークアップや歌詞を含むため大きくし、分析量はMAX_CHORDSで抑える
+MAX_DOCUMENT_INPUT_CHARS = int(os.environ.get("MAX_DOCUMENT_INPUT_CHARS", "1000000"))
+MAX_CHORDS = int(os.environ.get("MAX_CHORDS", "2000"))
+
+analysis_admission = AdmissionController(MAX_CONCURRENT_ANALYSES, MAX_QUEUED_ANALYSES, ANALYSIS_QUEUE_TIMEOUT)
+
+# 同一分析の同時リクエストを1回の計算にまとめる
+analysis_flights = SingleFlight()
+
+def canonical_request_key(request: ChordAnalysisRequest, chords: List[str]) -> str:
+    """分析結果を一意に決める正規化済みリクエストキー（抽出済みコード＋分析設定）"""
+    return json.dumps([
+        chords,
+        request.algorithm,
+        request.traditional_weight,
+        request.borrowed_chord_weight,
+        request.triad_ratio_weight,
+        request.manual_key,
+        sorted(set(request.fields)) if request.fields else None,
+        request.include_midi,
+    ], ensure_ascii=False, separators=(",", ":"))
+
+def canonical_request_hash(request: ChordAnalysisRequest, chords: List[str]) -> str:
+    return hashlib.sha256(canonical_request_key(request, chords).encode("utf-8")).hexdigest()
+
+async def analyze_with_admission(request: ChordAnalysisRequest, chords: List[str]) -> AnalysisRecord:
+    """アドミッション制御下でスレッドプールで分析を実行する"""
+    async with analysis_admission.admit():
+        # CPU処理はスレッドプールで実行し、イベントループは過負荷時の即時拒否に使う
+        return await run_in_threadpool(run_analysis, request, chords)
+
+# 永続結果ストア（ワーカー間・再起動後も共有。RESULT_STORE_PATHを指定した場合のみ有効）
+# 分析結果が変わる変更を入れたらENGINE_VERSIONを上げる（旧バージョンの結果は参照されず、先に削除される）
+ENGINE_VERSION = "2"
+RESULT_STORE_PATH = os.environ.get("RESULT_STORE_PATH", "")
+RESULT_STORE_MAX_BYTES = int(os.environ.get("RESULT_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))  # プロセス内LRUの件数
+
+result_store = ResultStore(
+    RESULT_STORE_PATH,
+    ENGINE_VERSION,
+    encode=encode_json,
+    decode=json_loads,
+    max_bytes=RESULT_STORE_MAX_BYTES,
+    memory_items=RESULT_CACHE_SIZE,
+) if RESULT_STORE_PATH else None
+
+async def analyze_with_store(request: ChordAnalysisRequest, chords: List[str], request_hash: str):
+    """永続ストアを参照し、無ければ分析して保存する（ストアの障害時は分析結果をそのまま返す）"""
+    if result_store is not None:
+        try:
+            content = await run_in_threadpool(result_store.get, request_hash)
+        except sqlite3.Error as e:
+            print(f"Result store read error: {e}")
+            content = None
+        if content is not None:
+            return content
+    content = select_fields(await analyze_with_admission(request, chords), request.fields)
+    if result_store is not None:
+        try:
+            await run_in_threadpool(result_store.put, request_hash, content)
+        except sqlite3.Error as e:
+            print(f"Result store write error: {e}")
+    return content
+
+# プロファイリング
+# PROFILING_ENABLED=1 のとき、X-Profile: 1 ヘッダまたは ?profile=1 付きのリクエストをcProfileで計測し、
+# PROFILE_DIR/<正規化リクエストハッシュ>.prof に保存する（結果キャッシュを通さず毎回分析する）。
+# PROFILE_SAMPLE_INTERVAL>0 なら、その間隔で全スレッドのスタックを採取し PROFILE_DIR/stacks-<pid>.txt に集計する。
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0"))  # 秒（0で無効）
+PROFILE_FLUSH_INTERVAL = float(os.environ.get("PROFILE_FLUSH_INTERVAL", "60"))  # 秒
+
+request_profiler = RequestProfiler(PROFILE_DIR)
+
+def start_stack_sampler():
+    """常時サンプリングを開始する（preload_appのためワーカープロセスの起動時に呼ぶ）"""
+    if PROFILE_SAMPLE_INTERVAL <= 0:
+        return None
+    sampler = StackSampler(
+        os.path.join(PROFILE_DIR, f"stacks-{os.getpid()}.txt"),
+        interval=PROFILE_SAMPLE_INTERVAL,
+        flush_interval=PROFILE_FLUSH_INTERVAL,
+    )
+    sampler.start()
+    return sampler
+
+def profiling_requested(http_request: Request) -> bool:
+    if not PROFILING_ENABLED or http_request is None:
+        return False
+    flag = http_request.headers.get("x-profile") or http_request.query_params.get("profile")
+    return flag in ("1", "true")
+
+async def analyze_profiled(request: ChordAnalysisRequest, chords: List[str], request_hash: str):
+    """アドミッション制御下でプロファイラ付きで分析する"""
+    async with analysis_admission.admit():
+        record = await run_in_threadpool(request_profiler.profile, request_hash, run_analysis, request, chords)
+    return select_fields(record, request.fields)
+
+def extract_chords_within_limits(chord_input: str, input_format: str = "brackets") -> List[str]:
+    """入力サイズ制限を確認してコードを抽出する（超過時は413、解析できない入力は422）"""
+    max_chars = MAX_INPUT_CHARS if input_format == "brackets" else MAX_DOCUMENT_INPUT_CHARS
+    if len(chord_input) > max_chars:
+        raise HTTPException(status_code=413, detail=f"Input is too long (max {max_chars} characters)")
+    try:
+        chords = extract_chords_for_format(chord_input, input_format)
+    except ChordImportError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if len(chords) > MAX_CHORDS:
+        raise HTTPException(status_code=413, detail=f"Too many chords (max {MAX_CHORDS})")
+    return chords
+
 @app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_chord_progression(request: ChordAnalysisRequest):
-    """コード進行を分析する（複数アルゴリズム対応）"""
-    
+async def analyze_chord_progression(request: ChordAnalysisRequest, http_request: Request = None):
+    """コード進行を分析する（複数アルゴリズム対応）
+
+    Accept: application/msgpack の場合は同じスキーマをMessagePackで返す。
+    """
+    if request.fields:
+        unknown = [name for name in request.fields if name not in RESPONSE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown fields: {unknown}")
+    if request.input_format == "brackets":
+        chords = extract_chords_within_limits(request.chord_input)
+    else:
+        # 大きな文書の解析でイベントループを止めない
+        chords = await run_in_threadpool(extract_chords_within_limits, request.chord_input, request.input_format)
+    request_hash = canonical_request_hash(request, chords)
+    if profiling_requested(http_request):
+        try:
+            content = await analyze_profiled(request, chords, request_hash)
+        except OverloadedError as e:
+            raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+        response = negotiate_response(content, http_request)
+        response.headers["X-Profile-Id"] = request_hash
+        return response
+    content = result_store.peek(request_hash) if result_store is not None else None
+    if content is None:
+        try:
+            # 同じ正規化キーの分析が実行中なら、その結果を共有する
+            content = await analysis_flights.do(
+                request_hash,
+                lambda: analyze_with_store(request, chords, request_hash)
+            )
+        except OverloadedError as e:
+            raise HTTPException(status_code=503, detail="Server is busy", headers={"Retry-After": str(e.retry_after)})
+    # response_modelはOpenAPIスキーマ用。実際のレスポンスは内部構造体から直接エンコードする
+    if http_request is None:
+        return FastJSONResponse(content)
+    return negotiate_response(content, http_request)
+
+@app.get("/profiles/{request_hash}")
+async def get_profile(request_hash: str, format: str = "prof"):
+    """保存済みプロファイルを返す（format=text なら累積時間順の上位をテキストで返す）"""
+    try:
+        path = request_profiler.path_for(request_hash)
+    except ValueError:
+        path = None
+    if not PROFILING_ENABLED or path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(await run_in_threadpool(request_profiler.summary, request_hash))
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{request_hash}.prof")
+
+# 分析パイプラインの段階（依存関係グラフ）
+# コード列 → ピッチクラスベクトル → 各キー推定 → 統合（main_key） → 借用和音検出 / コード詳細
+# run_analysisは要求項目に対応する段階だけを指定し、依存先をたどって必要な段階だけを実行する。
+ANALYSIS_PIPELINE = Pipeline()
+
+@dataclass(slots=True, frozen=True)
+class KeyEstimate:
+    """キー推定段階の結果"""
+    key: str
+    confidence: float
+    hybrid_score: float  # hybridで重みを掛ける前のスコア
+    borrowed_chord_count: int = None  # 推定の過程で数えた場合のみ
+
+# キー推定アルゴリズム名 → hybridの重みを持つリクエストのフィールド名（登録順に候補・hybridで評価する）
+KEY_ESTIMATORS = {}
+
+def register_key_estimator(algorithm: str, inputs: Tuple[str, ...], weight_field: str = None):
+    """キー推定アルゴリズムを登録するデコレータ
+
+    関数は入力段階（"chords", "pitch_vector"など）の値を受け取りKeyEstimateを返す。
+    登録すると key_candidates とアルゴリズム指定に加わり、weight_fieldがあればhybridの比較にも加わる。
+    """
+    def register(func):
+        ANALYSIS_PIPELINE.add(f"estimate:{algorithm}", inputs, func)
+        ANALYSIS_PIPELINE.add(
+            f"candidate:{algorithm}", ("chords", f"estimate:{algorithm}"),
+            lambda chords, estimate: KeyEstimationRecord(
+                key=estimate.key,
+                confidence=float(estimate.confidence),
+                borrowed_chord_count=(estimate.borrowed_chord_count if estimate.borrowed_chord_count is not None
+                                      else len(detect_non_diatonic_notes(chords, estimate.key))),
+                algorithm=algorithm
+            )
+        )
+        ANALYSIS_PIPELINE.add(f"main_key:{algorithm}", (f"estimate:{algorithm}",), lambda estimate: estimate)
+        KEY_ESTIMATORS[algorithm] = weight_field
+        register_fusion_stages()
+        return func
+    return register
+
+def register_fusion_stages():
+    """登録済みの推定アルゴリズムから hybrid と key_candidates の段階を組み直す"""
+    weighted = [algorithm for algorithm, field in KEY_ESTIMATORS.items() if field]
+
+    def hybrid(request, *estimates):
+        # 重み付きスコアが最高のアルゴリズムを選択（同点は登録順で先のもの）
+        scores = [
+            (estimate.hybrid_score * getattr(request, KEY_ESTIMATORS[algorithm]), estimate)
+            for algorithm, estimate in zip(weighted, estimates)
+        ]
+        return max(scores, key=lambda x: x[0])[1]
+
+    def key_candidates(request, chords, *candidates):
+        candidates = list(candidates)
+        if request.algorithm == "manual" and request.manual_key:
+            # 手動指定キーの結果を候補に追加
+            candidates.append(KeyEstimationRecord(
+                key=request.manual_key,
+                confidence=1.0,
+                borrowed_chord_count=len(detect_non_diatonic_notes(chords, request.manual_key)),
+                algorithm="manual"
+            ))
+        return candidates
+
+    ANALYSIS_PIPELINE.add("main_key:hybrid", ("request", *(f"estimate:{algorithm}" for algorithm in weighted)), hybrid)
+    ANALYSIS_PIPELINE.add("key_candidates", ("request", "chords", *(f"candidate:{algorithm}" for algorithm in KEY_ESTIMATORS)), key_candidates)
+
+@ANALYSIS_PIPELINE.stage("pitch_vector", ("chords",))
+def pitch_vector_stage(chords):
+    return create_pitch_class_vector(chords)
+
+@register_key_estimator("traditional", ("pitch_vector",), "traditional_weight")
+def traditional_estimator(pitch_vector):
+    """従来のアルゴリズム（Krumhansl）"""
+    key, confidence = find_best_key(pitch_vector)
+    return KeyEstimate(key, confidence, confidence)
+
+@register_key_estimator("borrowed_chord_minimal", ("chords",), "borrowed_chord_weight")
+def borrowed_chord_minimal_estimator(chords):
+    """借用和音最小化アルゴリズム"""
+    key, confidence, borrowed_count = find_key_by_borrowed_chord_minimization(chords)
+    return KeyEstimate(key, confidence, 1.0 - borrowed_count / len(chords), borrowed_count)
+
+@register_key_estimator("triad_ratio", ("pitch_vector",), "triad_ratio_weight")
+def triad_ratio_estimator(pitch_vector):
+    """トライアド比率分析アルゴリズム"""
+    key, confidence, score = find_key_by_triad_ratio_analysis(pitch_vector)
+    return KeyEstimate(key, confidence, score)
+
+@ANALYSIS_PIPELINE.stage("main_key:manual", ("request",))
+def manual_key_stage(request):
+    # 手動指定なので信頼度は100%
+    return KeyEstimate(request.manual_key, 1.0, 1.0)
+
+@ANALYSIS_PIPELINE.stage("borrowed_chords", ("chords", "main_key"))
+def borrowed_chords_stage(chords, main_key):
+    non_diatonic_chords = detect_non_diatonic_notes(chords, main_key.key)
+    return find_borrowed_sources(non_diatonic_chords, main_key.key, chords)
+
+@ANALYSIS_PIPELINE.stage("progression_details", ("request", "chords"))
+def progression_details_stage(request, chords):
+    if request.include_midi:
+        return [
+            ProgressionDetailMidiRecord(
+                chord_symbol=c,
+                components=get_chord_components_with_voicing(c),
+                midi_notes=get_chord_midi_voicing(c)
+            )
+            for c in chords
+        ]
+    return [
+        ProgressionDetailRecord(chord_symbol=c, components=get_chord_components_with_voicing(c))
+        for c in chords
+    ]
+
+def analysis_plan(request: ChordAnalysisRequest) -> Tuple[List[str], dict]:
+    """要求項目とアルゴリズムから (実行する段階, main_keyの別名) を決める"""
+    wanted = set(request.fields) if request.fields else set(RESPONSE_FIELDS)
+    manual_mode = request.algorithm == "manual" and request.manual_key
+    if manual_mode:
+        mode = "manual"
+    else:
+        mode = request.algorithm if request.algorithm in KEY_ESTIMATORS else "hybrid"
+    targets = []
+    if manual_mode or wanted & {"main_key", "confidence", "borrowed_chords"}:
+        targets.append("main_key")
+    for field, stage in (("pitch_class_vector", "pitch_vector"), ("key_candidates", "key_candidates"),
+                         ("borrowed_chords", "borrowed_chords"), ("progression_details", "progression_details")):
+        if field in wanted:
+            targets.append(stage)
+    return targets, {"main_key": f"main_key:{mode}"}
+
+def run_analysis(request: ChordAnalysisRequest, chords: List[str] = None, pitch_vector: np.ndarray = None) -> AnalysisRecord:
+    """分析パイプライン本体（内部構造体で結果を返す）
+
+    request.fieldsで要求されていない項目の計算段階はスキップし、その項目はNoneのままになる。
+    chordsを渡した場合はrequest.chord_inputからの抽出（request.input_formatに応じた取り込み）を省略する。
+    pitch_vectorを渡した場合はコードからのベクトル化の代わりに使う（MIDIの音価で重み付けしたベクトルなど）。
+    """
     # ① コード抽出
-    chords = extract_chords(request.chord_input)
+    if chords is None:
+        chords = extract_chords_for_format(request.chord_input, request.input_format)
     
     if not chords:
-        return AnalysisResponse(
+        return AnalysisRecord(
             main_key="Unknown",
             confidence=0.0,
             borrowed_chords=[],
             pitch_class_vector=[0.0] * 12,
             key_candidates=[],
-            algorithm_used=request.algorithm
+            algorithm_used=request.algorithm,
+            progression_details=[]
         )
     
-    # ② 構成音抽出・ベクトル化
-    pitch_vector = create_pitch_class_vector(chords)
-    
-    # ③ 各アルゴリズムでキー推定
-    key_candidates = []
-    
-    # 従来のアルゴリズム（Krumhansl）
-    traditional_key, traditional_confidence = find_best_key(pitch_vector)
-    traditional_borrowed_count = len(detect_non_diatonic_notes(chords, traditional_key))
-    key_candidates.append(KeyEstimationResult(
-        key=traditional_key,
-        confidence=traditional_confidence,
-        borrowed_chord_count=traditional_borrowed_count,
-        algorithm="traditional"
-    ))
-    
-    # 借用和音最小化アルゴリズム
-    minimal_key, minimal_confidence, minimal_borrowed_count = find_key_by_borrowed_chord_minimization(chords)
-    key_candidates.append(KeyEstimationResult(
-        key=minimal_key,
-        confidence=minimal_confidence,
-        borrowed_chord_count=minimal_borrowed_count,
-        algorithm="borrowed_chord_minimal"
-    ))
-    
-    # トライアド比率分析アルゴリズム
-    triad_key, triad_confidence, triad_score = find_key_by_triad_ratio_analysis(pitch_vector)
-    triad_borrowed_count = len(detect_non_diatonic_notes(chords, triad_key))
-    key_candidates.append(KeyEstimationResult(
-        key=triad_key,
-        confidence=triad_confidence,
-        borrowed_chord_count=triad_borrowed_count,
-        algorithm="triad_ratio"
-    ))
-    
-    # ④ アルゴリズム選択
-    if request.algorithm == "manual" and request.manual_key:
-        # 手動キー指定モード
-        main_key = request.manual_key
-        final_confidence = 1.0  # 手動指定なので信頼度は100%
-        
-        # 手動指定キーの結果を候補に追加
-        manual_borrowed_count = len(detect_non_diatonic_notes(chords, main_key))
-        key_candidates.append(KeyEstimationResult(
-            key=main_key,
-            confidence=1.0,
-            borrowed_chord_count=manual_borrowed_count,
-            algorithm="manual"
-        ))
-        
-    elif request.algorithm == "traditional":
-        main_key = traditional_key
-        final_confidence = traditional_confidence
-    elif request.algorithm == "borrowed_chord_minimal":
-        main_key = minimal_key
-        final_confidence = minimal_confidence
-    elif request.algorithm == "triad_ratio":
-        main_key = triad_key
-        final_confidence = triad_confidence
-    else:  # hybrid
-        # 3つのアルゴリズムの重み付きスコア計算
-        traditional_score = traditional_confidence * request.traditional_weight
-        minimal_score = (1.0 - minimal_borrowed_count / len(chords)) * request.borrowed_chord_weight
-        triad_score = triad_score * request.triad_ratio_weight
-        
-        # 最高スコアのアルゴリズムを選択
-        scores = [
-            (traditional_score, traditional_key, traditional_confidence),
-            (minimal_score, minimal_key, minimal_confidence),
-            (triad_score, triad_key, triad_confidence)
-        ]
-        
-        best_score, best_key_result, best_confidence_result = max(scores, key=lambda x: x[0])
-        main_key = best_key_result
-        final_confidence = best_confidence_result
-    
-    # ⑤ 借用和音検出
-    non_diatonic_chords = detect_non_diatonic_notes(chords, main_key)
-    borrowed_chords = find_borrowed_sources(non_diatonic_chords, main_key, chords)
-
-    # ⑥ コード詳細の生成
-    progression_details = [
-        ProgressionDetail(chord_symbol=c, components=get_chord_components_with_voicing(c))
-        for c in chords
-    ]
-    
-    return AnalysisResponse(
-        main_key=main_key,
-        confidence=final_confidence,
-        borrowed_chords=borrowed_chords,
-        pitch_class_vector=pitch_vector.tolist(),
-        key_candidates=key_candidates,
+    # ②〜⑥ 要求項目に必要な段階だけを実行
+    targets, aliases = analysis_plan(request)
+    provided = {"request": request, "chords": chords}
+    if pitch_vector is not None:
+        provided["pitch_vector"] = pitch_vector
+    values = ANALYSIS_PIPELINE.run(targets, aliases, **provided)
+    main_key = values.get("main_key")
+    pitch_vector = values.get("pitch_vector")
+    
+    return AnalysisRecord(
+        main_key=main_key.key if main_key is not None else None,
+        confidence=float(main_key.confidence) if main_key is not None else None,
+        borrowed_chords=values.get("borrowed_chords"),
+        pitch_class_vector=pitch_vector.tolist() if pitch_vector is not None else None,
+        key_candidates=values.get("key_candidates"),
         algorithm_used=request.algorithm,
-        progression_details=progression_details
+        progression_details=values.get("progression_details")
     )
 
 @app.get("/keys")
@@ -1008,16 +1660,234 @@ async def get_available_keys():
 async def root():
     return {"message": "Chord Progression Analyzer API"}
 
+# ウォームアップ用のよく使われるコード進行（WARMUP_PROGRESSIONSで";"区切りで上書き可能、空なら無効）
+DEFAULT_WARMUP_PROGRESSIONS = [
+    "[CM7][Am7][Dm7][G7]",
+    "[C][G][Am][F]",
+    "[Am][F][C][G]",
+    "[Dm7][G7][CM7]",
+    "[C][Fm][C][G7]",
+    "[FM7][G7][Em7][Am7]",
+    "[FM7(13)][FmM7][Em7][A7]",
+    "[Bb][Eb][F7][Bb]",
+]
+
+# 準備完了フラグ（ウォームアップ完了でセット）
+READINESS = threading.Event()
+
+def get_warmup_progressions() -> List[str]:
+    value = os.environ.get("WARMUP_PROGRESSIONS")
+    if value is None:
+        return DEFAULT_WARMUP_PROGRESSIONS
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+def warmup():
+    """解析・ボイシングキャッシュを埋め、各推定アルゴリズムを一度ずつ実行する
+
+    ウォームアップはキャッシュを埋めるだけなので、失敗した進行はトレースバックを出力して飛ばし、
+    レディネスは必ず立てる（/readyzが503のままにならないように）。
+    """
+    started = time.perf_counter()
+    failed = 0
+    try:
+        progressions = get_warmup_progressions()
+    except Exception:
+        print("Warmup progressions could not be read:")
+        traceback.print_exc()
+        progressions = []
+    for chord_input in progressions:
+        try:
+            # hybridで3つの推定器・借用元探索・ボイシングを全て通す
+            run_analysis(ChordAnalysisRequest(chord_input=chord_input))
+            run_analysis(ChordAnalysisRequest(chord_input=chord_input, algorithm="manual", manual_key="C Major"))
+        except Exception:
+            failed += 1
+            print(f"Warmup failed for {chord_input[:80]!r}:")
+            traceback.print_exc()
+    READINESS.set()
+    print(f"Warmup finished: {len(progressions)} progressions ({failed} failed) in {time.perf_counter() - started:.2f}s")
+
+@app.get("/healthz")
+async def healthz():
+    """ライブネス：プロセスが応答できればOK"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """レディネス：ウォームアップ完了後のみOK"""
+    if not READINESS.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
 class VoicingDebugRequest(BaseModel):
     chord_input: str
 
 @app.post("/debug-voicing")
 async def debug_voicing(request: VoicingDebugRequest):
     """指定されたコード進行のボイシングをデバッグする"""
-    chords = extract_chords(request.chord_input)
+    chords = extract_chords_within_limits(request.chord_input)
     voicings = {c: get_chord_components_with_voicing(c) for c in chords}
     return voicings
 
+# 非同期ジョブ（巨大な進行・バッチ）。JOB_DB_PATHを指定した場合のみ有効（未指定なら /jobs は503）
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))  # ワーカープロセスごとのジョブ処理スレッド数
+JOB_MAX_ITEMS = int(os.environ.get("JOB_MAX_ITEMS", "10000"))
+JOB_MAX_INPUT_CHARS = int(os.environ.get("JOB_MAX_INPUT_CHARS", "1000000"))  # 1進行あたり
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "1000"))
+JOB_RESULTS_PAGE_LIMIT = 500
+
+class JobSubmitRequest(BaseModel):
+    chord_inputs: List[str]  # 1要素が1つのコード進行（巨大な進行は1要素で投入）
+    algorithm: str = "hybrid"
+    traditional_weight: float = 0.2
+    borrowed_chord_weight: float = 0.3
+    triad_ratio_weight: float = 0.5
+    manual_key: str = None
+    fields: List[str] = None
+    include_midi: bool = False
+    input_format: str = "brackets"
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done", "failed", "cancelled"
+    total: int
+    completed: int
+    progress: float
+    error: str = None
+    created_at: float
+    updated_at: float
+
+class JobResultItem(BaseModel):
+    index: int
+    result: AnalysisResponse
+
+class JobResultsPage(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    offset: int
+    next_offset: int = None  # 次ページの開始位置（未完了分を含め、続きが無ければNone）
+    results: List[JobResultItem]
+
+def find_import_error(chord_inputs: List[str], input_format: str) -> str:
+    """最初に解析できなかった入力のエラーメッセージ（全て解析できればNone）"""
+    for index, chord_input in enumerate(chord_inputs):
+        try:
+            extract_chords_for_format(chord_input, input_format)
+        except ChordImportError as e:
+            return f"chord_inputs[{index}]: {e}"
+    return None
+
+def run_job_item(chord_input: str, params: dict) -> bytes:
+    """ジョブの1アイテムを分析してエンコード済み結果を返す（ジョブワーカースレッドで実行）"""
+    request = ChordAnalysisRequest(chord_input=chord_input, **params)
+    return encode_json(select_fields(run_analysis(request), request.fields))
+
+job_queue = JobQueue(
+    JOB_DB_PATH,
+    run_job_item,
+    workers=JOB_WORKERS,
+    retention_seconds=JOB_RETENTION_SECONDS,
+    max_finished_jobs=JOB_MAX_FINISHED,
+) if JOB_DB_PATH else None
+
+def require_job_queue():
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue is disabled (set JOB_DB_PATH)")
+
+def get_job_or_404(job_id: str) -> dict:
+    require_job_queue()
+    status = job_queue.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobSubmitRequest, http_request: Request = None):
+    """巨大な進行・バッチを非同期ジョブとして投入する"""
+    if not request.chord_inputs:
+        raise HTTPException(status_code=422, detail="chord_inputs is empty")
+    if len(request.chord_inputs) > JOB_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many progressions (max {JOB_MAX_ITEMS})")
+    if any(len(chord_input) > JOB_MAX_INPUT_CHARS for chord_input in request.chord_inputs):
+        raise HTTPException(status_code=413, detail=f"Input is too long (max {JOB_MAX_INPUT_CHARS} characters)")
+    if request.fields:
+        unknown = [name for name in request.fields if name not in RESPONSE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown fields: {unknown}")
+    if request.input_format not in INPUT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown input_format: {request.input_format}")
+    if request.input_format != "brackets":
+        # 解析できない文書はジョブ全体を失敗させる前に投入時に拒否する
+        error = await run_in_threadpool(find_import_error, request.chord_inputs, request.input_format)
+        if error is not None:
+            raise HTTPException(status_code=422, detail=error)
+    require_job_queue()
+    params = request.model_dump(exclude={"chord_inputs"}, exclude_none=True)
+    job_id = await run_in_threadpool(job_queue.submit, request.chord_inputs, params)
+    status = await run_in_threadpool(job_queue.status, job_id)
+    if http_request is None:
+        return FastJSONResponse(status, status_code=202)
+    response = negotiate_response(status, http_request)
+    response.status_code = 202
+    return response
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, http_request: Request = None):
+    """ジョブの状態・進捗を取得する"""
+    status = await run_in_threadpool(get_job_or_404, job_id)
+    if http_request is None:
+        return FastJSONResponse(status)
+    return negotiate_response(status, http_request)
+
+@app.get("/jobs/{job_id}/results", response_model=JobResultsPage)
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 100, http_request: Request = None):
+    """完了済みの結果をページ単位で取得する"""
+    status = await run_in_threadpool(get_job_or_404, job_id)
+    limit = max(1, min(limit, JOB_RESULTS_PAGE_LIMIT))
+    rows = await run_in_threadpool(job_queue.results, job_id, max(offset, 0), limit)
+    last_index = rows[-1][0] if rows else max(offset, 0) - 1
+    page = {
+        "job_id": job_id,
+        "status": status["status"],
+        "total": status["total"],
+        "offset": offset,
+        "next_offset": last_index + 1 if last_index + 1 < status["total"] else None,
+        "results": [{"index": index, "result": json_loads(result)} for index, result in rows],
+    }
+    if http_request is None:
+        return FastJSONResponse(page)
+    return negotiate_response(page, http_request)
+
+def aggregate_job_stats(job_id: str) -> dict:
+    """ジョブの完了済み結果をページ単位で読みながらコーパス統計を集計する（メモリは結果件数に依存しない）"""
+    stats = CorpusStats()
+    offset = 0
+    while True:
+        rows = job_queue.results(job_id, offset, JOB_RESULTS_PAGE_LIMIT)
+        if not rows:
+            return stats.to_dict()
+        stats.add_all(json_loads(result) for _, result in rows)
+        offset = rows[-1][0] + 1
+
+@app.get("/jobs/{job_id}/stats")
+async def get_job_stats(job_id: str, http_request: Request = None):
+    """ジョブ結果のコーパス統計（キー分布・借用和音・借用元の関係）。他の部分集計とマージ可能な形式で返す"""
+    await run_in_threadpool(get_job_or_404, job_id)
+    stats = await run_in_threadpool(aggregate_job_stats, job_id)
+    if http_request is None:
+        return FastJSONResponse(stats)
+    return negotiate_response(stats, http_request)
+
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """未終了のジョブをキャンセルする"""
+    await run_in_threadpool(get_job_or_404, job_id)
+    await run_in_threadpool(job_queue.cancel, job_id)
+    return FastJSONResponse(await run_in_threadpool(job_queue.status, job_id))
+
 if __name__ == "__main__":
     import uvicorn
     import os
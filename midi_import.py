@@ -0,0 +1,369 @@
+"""
+Standard MIDI File（SMF）の取り込み（キー推定・借用和音分析用）
+
+純Pythonのストリーミング読み込みで、トラックを一定サイズのブロック単位で読みながらノートの発音区間を
+拍単位の時間窓に振り分け、音価（拍数）で重み付けしたピッチクラスベクトルを作る。
+
+- 全体のベクトルを従来のアルゴリズム（Krumhansl）・トライアド比率分析に渡してキーを推定する
+- infer_chords=True なら時間窓ごとにコードを推定し、借用和音最小化・借用和音検出にも使う
+- ファイルやフォルダを複数指定するとプロセス並列で処理する（結果はJSON Lines、コーパス分析ツールの入力形式）
+
+使い方:
+    python midi_import.py song.mid midi_folder/ --workers 4 > results.jsonl
+    python midi_import.py song.mid --window-beats 2 --no-chords
+"""
+
+import argparse
+import os
+import sys
+from functools import partial
+from itertools import chain
+from operator import itemgetter
+from typing import List, NamedTuple
+
+import numpy as np
+
+from main import (
+    ANALYSIS_PIPELINE, KEY_ESTIMATORS, NOTES, AnalysisRecord, ChordAnalysisRequest, KeyEstimationRecord, encode_json,
+    run_analysis,
+)
+from parallel import parallel_map
+
+MIDI_EXTENSIONS = (".mid", ".midi", ".smf")
+READ_BLOCK_SIZE = 65536
+DRUM_CHANNEL = 9  # GMのチャンネル10（0始まり）
+MIN_SEGMENT_BEATS = 0.25  # これより発音の少ない時間窓はコードを推定しない
+
+# コード推定のテンプレート（品質, ルートからの音程）。同点なら先のもの（単純なコード）を選ぶ
+CHORD_TEMPLATES = [
+    ("", (0, 4, 7)),
+    ("m", (0, 3, 7)),
+    ("7", (0, 4, 7, 10)),
+    ("M7", (0, 4, 7, 11)),
+    ("m7", (0, 3, 7, 10)),
+    ("dim", (0, 3, 6)),
+    ("m7b5", (0, 3, 6, 10)),
+    ("aug", (0, 4, 8)),
+    ("sus4", (0, 5, 7)),
+]
+MISSING_TONE_PENALTY = 0.1
+
+
+class MidiFormatError(ValueError):
+    """SMFとして読めない、または対応していない形式"""
+
+
+class MidiSegments(NamedTuple):
+    ticks_per_beat: int
+    window_beats: float
+    vectors: np.ndarray  # (時間窓数, 12) 各ピッチクラスの発音拍数
+
+
+def _read_exact(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise MidiFormatError("Unexpected end of file")
+    return data
+
+
+def _blocks(stream, length: int):
+    """チャンクの本体をブロック単位で読む（最後まで読むとストリームは次のチャンクの先頭にある）"""
+    while length > 0:
+        block = stream.read(min(length, READ_BLOCK_SIZE))
+        if not block:
+            raise MidiFormatError("Unexpected end of file in track")
+        length -= len(block)
+        yield block
+
+
+def _varlen(data) -> int:
+    value = 0
+    for _ in range(4):
+        byte = next(data)
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value
+    raise MidiFormatError("Variable-length quantity is too long")
+
+
+def _skip(data, size: int):
+    for _ in range(size):
+        next(data)
+
+
+def iter_note_events(stream, length: int):
+    """トラックチャンク本体から (tick, チャンネル, ノート番号, ノートオンか) を順に返す"""
+    blocks = _blocks(stream, length)
+    data = chain.from_iterable(blocks)
+    tick = 0
+    status = None
+    while True:
+        try:
+            tick += _varlen(data)
+        except StopIteration:
+            return  # End of Trackが無いトラック
+        try:
+            byte = next(data)
+            if byte < 0x80:
+                # ランニングステータス
+                if status is None:
+                    raise MidiFormatError("Data byte without status")
+                first = byte
+            elif byte < 0xF0:
+                status = byte
+                first = next(data)
+            elif byte == 0xFF:
+                status = None
+                meta_type = next(data)
+                _skip(data, _varlen(data))
+                if meta_type == 0x2F:  # End of Track
+                    for _ in blocks:  # 残りを読み捨てて次のチャンクへ
+                        pass
+                    return
+                continue
+            elif byte in (0xF0, 0xF7):
+                status = None
+                _skip(data, _varlen(data))
+                continue
+            else:
+                raise MidiFormatError(f"Unexpected status byte 0x{byte:02X}")
+            kind = status & 0xF0
+            if kind in (0xC0, 0xD0):
+                continue  # データ1バイトのメッセージ
+            second = next(data)
+            if kind == 0x90:
+                yield tick, status & 0x0F, first, second > 0
+            elif kind == 0x80:
+                yield tick, status & 0x0F, first, False
+        except StopIteration:
+            raise MidiFormatError("Truncated event at end of track") from None
+
+
+class _WindowAccumulator:
+    """発音区間を時間窓ごと・ピッチクラスごとの拍数に振り分ける"""
+
+    def __init__(self, ticks_per_beat: int, window_beats: float):
+        self.ticks_per_beat = ticks_per_beat
+        self.window_ticks = max(1, int(round(window_beats * ticks_per_beat)))
+        self.windows = {}
+
+    def add(self, start: int, end: int, pitch_class: int):
+        window = start // self.window_ticks
+        while start < end:
+            stop = min(end, (window + 1) * self.window_ticks)
+            vector = self.windows.get(window)
+            if vector is None:
+                vector = self.windows[window] = [0.0] * 12
+            vector[pitch_class] += (stop - start) / self.ticks_per_beat
+            start = stop
+            window += 1
+
+    def matrix(self) -> np.ndarray:
+        if not self.windows:
+            return np.zeros((0, 12))
+        matrix = np.zeros((max(self.windows) + 1, 12))
+        for window, vector in self.windows.items():
+            matrix[window] = vector
+        return matrix
+
+
+def read_midi_segments(source, window_beats: float = 4.0, include_drums: bool = False) -> MidiSegments:
+    """SMFを読み、時間窓（window_beats拍）ごとのピッチクラス別発音拍数を返す
+
+    sourceはパスまたはバイナリのファイルオブジェクト。トラックは順に1つずつ処理し、
+    保持するのは発音中のノートと時間窓ごとの12要素だけ。
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as stream:
+            return read_midi_segments(stream, window_beats, include_drums)
+    stream = source
+    if _read_exact(stream, 4) != b"MThd":
+        raise MidiFormatError("Not a Standard MIDI File")
+    header_length = int.from_bytes(_read_exact(stream, 4), "big")
+    if header_length < 6:
+        raise MidiFormatError("Invalid header chunk")
+    header = _read_exact(stream, header_length)
+    division = int.from_bytes(header[4:6], "big")
+    if division & 0x8000:
+        raise MidiFormatError("SMPTE time division is not supported")
+    if division == 0:
+        raise MidiFormatError("Invalid time division")
+    accumulator = _WindowAccumulator(division, window_beats)
+
+    while True:
+        chunk_header = stream.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_type, length = chunk_header[:4], int.from_bytes(chunk_header[4:], "big")
+        if chunk_type != b"MTrk":
+            for _ in _blocks(stream, length):  # 未知のチャンクは読み飛ばす
+                pass
+            continue
+        active = {}  # (チャンネル, ノート番号) -> 発音開始tickのリスト（同じ音の重なりは先に鳴った方から止める）
+        last_tick = 0
+        for tick, channel, note, is_on in iter_note_events(stream, length):
+            last_tick = tick
+            if channel == DRUM_CHANNEL and not include_drums:
+                continue
+            if is_on:
+                active.setdefault((channel, note), []).append(tick)
+            else:
+                starts = active.get((channel, note))
+                if starts:
+                    accumulator.add(starts.pop(0), tick, note % 12)
+        # 終わらずに残ったノートはトラックの最後で止める
+        for (_, note), starts in active.items():
+            for start in starts:
+                accumulator.add(start, last_tick, note % 12)
+    return MidiSegments(division, window_beats, accumulator.matrix())
+
+
+def _template_matrix():
+    """(テンプレート数×12ルート, 12) の構成音行列と対応するコード名（テンプレート順、その中でルート順）"""
+    rows, names = [], []
+    for quality, intervals in CHORD_TEMPLATES:
+        for root in range(12):
+            row = np.zeros(12)
+            row[[(root + interval) % 12 for interval in intervals]] = 1.0
+            rows.append(row)
+            names.append(NOTES[root] + quality)
+    return np.array(rows), names
+
+
+TEMPLATE_MATRIX, TEMPLATE_NAMES = _template_matrix()
+
+
+def infer_segment_chords(vectors: np.ndarray, min_beats: float = MIN_SEGMENT_BEATS) -> List[str]:
+    """時間窓ごとに最も当てはまるコード名を返す（発音が min_beats 拍未満の窓はNone）
+
+    スコア = テンプレート内の音の割合 − テンプレート外の音の割合 − 鳴っていない構成音の数 × ペナルティ
+    """
+    totals = vectors.sum(axis=1)
+    shares = np.divide(vectors, totals[:, None], out=np.zeros_like(vectors), where=totals[:, None] > 0)
+    inside = shares @ TEMPLATE_MATRIX.T
+    missing = (shares <= 0.02) @ TEMPLATE_MATRIX.T
+    scores = 2 * inside - 1 - MISSING_TONE_PENALTY * missing
+    best = np.argmax(scores, axis=1)
+    return [TEMPLATE_NAMES[index] if total >= min_beats else None for index, total in zip(best.tolist(), totals.tolist())]
+
+
+def merge_repeated(chords: List[str]) -> List[str]:
+    """無音の窓を除き、連続する同じコードを1つにまとめる"""
+    merged = []
+    for chord in chords:
+        if chord is not None and (not merged or merged[-1] != chord):
+            merged.append(chord)
+    return merged
+
+
+def pitch_only_estimators() -> List[str]:
+    """コード列を使わない（ピッチクラスベクトルだけで推定できる）推定アルゴリズム"""
+    return [algorithm for algorithm in KEY_ESTIMATORS
+            if "chords" not in ANALYSIS_PIPELINE.stages[f"estimate:{algorithm}"].inputs]
+
+
+def analyze_pitch_vector(pitch_vector: np.ndarray, request: ChordAnalysisRequest) -> AnalysisRecord:
+    """コード列が無い場合の分析（ピッチクラスベクトルだけで推定できるアルゴリズムを使う）
+
+    手動指定キー（manual）と、ピッチクラスベクトルだけで推定できるアルゴリズムは指定どおりに使う。
+    それ以外（コード列が必要なborrowed_chord_minimalなど）は、hybridと同じ重み付きスコアで選び、
+    algorithm_usedは実際に使った "hybrid" になる。
+    """
+    algorithms = pitch_only_estimators()
+    manual = request.algorithm == "manual" and request.manual_key
+    targets = [f"candidate:{algorithm}" for algorithm in algorithms] + (["main_key:manual"] if manual else [])
+    values = ANALYSIS_PIPELINE.run(targets, request=request, chords=[], pitch_vector=pitch_vector)
+    estimates = {algorithm: values[f"estimate:{algorithm}"] for algorithm in algorithms}
+    candidates = [values[f"candidate:{algorithm}"] for algorithm in algorithms]
+    if manual:
+        main_key, algorithm_used = values["main_key:manual"], "manual"
+        # コード列が無いので借用和音数は0（run_analysisの手動指定キーの候補と同じ形）
+        candidates.append(KeyEstimationRecord(key=request.manual_key, confidence=1.0, borrowed_chord_count=0,
+                                              algorithm="manual"))
+    elif request.algorithm in estimates:
+        main_key, algorithm_used = estimates[request.algorithm], request.algorithm
+    else:
+        scores = [(estimate.hybrid_score * getattr(request, KEY_ESTIMATORS[algorithm]), estimate)
+                  for algorithm, estimate in estimates.items() if KEY_ESTIMATORS[algorithm]]
+        main_key, algorithm_used = max(scores, key=itemgetter(0))[1], "hybrid"
+    return AnalysisRecord(
+        main_key=main_key.key,
+        confidence=float(main_key.confidence),
+        borrowed_chords=None,
+        pitch_class_vector=pitch_vector.tolist(),
+        key_candidates=candidates,
+        algorithm_used=algorithm_used,
+        progression_details=None
+    )
+
+
+class MidiAnalysis(NamedTuple):
+    segments: int  # 時間窓の数
+    chords: List[str]  # 推定したコード列（infer_chords=False なら空）
+    result: AnalysisRecord
+
+
+def analyze_midi(source, window_beats: float = 4.0, infer_chords: bool = True, include_drums: bool = False,
+                 request: ChordAnalysisRequest = None) -> MidiAnalysis:
+    """SMFを分析する（requestでアルゴリズム・重み・fieldsを指定。chord_inputは使わない）"""
+    request = request or ChordAnalysisRequest(chord_input="")
+    segments = read_midi_segments(source, window_beats, include_drums)
+    totals = segments.vectors.sum(axis=0)
+    if not totals.sum():
+        return MidiAnalysis(len(segments.vectors), [], run_analysis(request, []))
+    pitch_vector = totals / totals.sum()
+    chords = merge_repeated(infer_segment_chords(segments.vectors)) if infer_chords else []
+    if chords:
+        result = run_analysis(request, chords, pitch_vector=pitch_vector)
+    else:
+        result = analyze_pitch_vector(pitch_vector, request)
+    return MidiAnalysis(len(segments.vectors), chords, result)
+
+
+def iter_midi_paths(paths):
+    """ファイルはそのまま、フォルダは配下のMIDIファイルを（名前順に）返す"""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(MIDI_EXTENSIONS):
+                        yield os.path.join(directory, name)
+        else:
+            yield path
+
+
+def analyze_midi_file(path: str, **options) -> bytes:
+    """1ファイルを分析してJSON Lines の1行（{"id", "segments", "chords", "result"} または {"id", "error"}）を返す"""
+    try:
+        analysis = analyze_midi(path, **options)
+    except (OSError, MidiFormatError) as e:
+        return encode_json({"id": path, "error": str(e)})
+    return encode_json({"id": path, "segments": analysis.segments, "chords": analysis.chords, "result": analysis.result})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MIDIファイルのキー推定・借用和音分析")
+    parser.add_argument("paths", nargs="+", help="MIDIファイルまたはフォルダ")
+    parser.add_argument("--window-beats", type=float, default=4.0, help="時間窓の長さ（拍）")
+    parser.add_argument("--no-chords", action="store_true", help="コードを推定しない（ピッチクラス分布だけで推定）")
+    parser.add_argument("--include-drums", action="store_true", help="チャンネル10も含める")
+    parser.add_argument("--algorithm", default="hybrid")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数（既定はCPU数）")
+    args = parser.parse_args(argv)
+
+    analyze = partial(
+        analyze_midi_file,
+        window_beats=args.window_beats,
+        infer_chords=not args.no_chords,
+        include_drums=args.include_drums,
+        request=ChordAnalysisRequest(chord_input="", algorithm=args.algorithm),
+    )
+    output = sys.stdout.buffer
+    for line in parallel_map(analyze, iter_midi_paths(args.paths), args.workers):
+        output.write(line + b"\n")
+    output.flush()
+
+
+if __name__ == "__main__":
+    main()
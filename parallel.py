@@ -0,0 +1,29 @@
+"""
+ファイル単位の並列処理（大量のファイルを一定のメモリで処理する）
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def parallel_map(func, items, workers: int = None, max_pending: int = None):
+    """func(item)をプロセスプールで並列に実行し、入力順に結果をyieldする
+
+    投入済みで未回収の件数を max_pending（既定はワーカー数の4倍）までに抑えるため、
+    items が巨大なイテレータでも結果を溜め込まない。workers=1 ならプロセスを使わず順に実行する。
+    funcと各itemはpickle可能であること（モジュールレベルの関数やfunctools.partial）。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    max_pending = max_pending or workers * 4
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,68 @@
+"""
+依存関係つきの遅延評価パイプライン
+
+各段階（stage）は名前・入力（他の段階の名前）・関数で宣言する。run() は要求された段階から
+入力をたどり、必要な段階だけを1回ずつ実行する（リクエスト内で中間結果を共有する）。
+"""
+
+from typing import Callable, Dict, Iterable, NamedTuple, Tuple
+
+
+class Stage(NamedTuple):
+    name: str
+    inputs: Tuple[str, ...]
+    func: Callable
+
+
+class Pipeline:
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, inputs: Iterable[str], func: Callable):
+        """段階を登録する（同名の段階は置き換える）"""
+        self.stages[name] = Stage(name, tuple(inputs), func)
+
+    def stage(self, name: str, inputs: Iterable[str] = ()):
+        """段階を登録するデコレータ（関数は入力の値を宣言順の位置引数で受け取る）"""
+        def register(func):
+            self.add(name, inputs, func)
+            return func
+        return register
+
+    def plan(self, targets: Iterable[str], provided: Iterable[str] = (), aliases: Dict[str, str] = None) -> list:
+        """targetsに必要な段階を実行順（依存先が先）に返す"""
+        aliases = aliases or {}
+        provided = set(provided)
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            name = aliases.get(name, name)
+            if name in done or name in provided:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle at stage: {name}")
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def run(self, targets: Iterable[str], aliases: Dict[str, str] = None, **provided) -> dict:
+        """必要な段階だけを実行し、{段階名: 値}（与えた入力と別名を含む）を返す"""
+        aliases = aliases or {}
+        targets = list(targets)
+        values = dict(provided)
+        for name in self.plan(targets, provided, aliases):
+            stage = self.stages[name]
+            values[name] = stage.func(*(values[aliases.get(dependency, dependency)] for dependency in stage.inputs))
+        for alias, name in aliases.items():
+            if name in values:
+                values[alias] = values[name]
+        return values
@@ -0,0 +1,159 @@
+"""
+本番環境向けのプロファイリング
+
+- RequestProfiler: 指定したリクエストの分析をcProfileで計測し、正規化リクエストハッシュ名の .prof に保存する
+- StackSampler: 低頻度で全スレッドのスタックを採取し、関数スタックごとの出現回数を定期的にファイルへ追記集計する
+  （flamegraph.pl / speedscope で読める collapsed 形式: "file:function;file:function 回数"）
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# 待機中のスレッド（イベントループ、スレッドプールの待機、ロック待ち）の末端フレーム
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class RequestProfiler:
+    """リクエスト単位の決定論的プロファイラ（cProfileは同時に1つしか動かせないため直列化する）"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, request_hash: str) -> str:
+        if not HASH_PATTERN.match(request_hash):
+            raise ValueError(f"Invalid request hash: {request_hash}")
+        return os.path.join(self.directory, f"{request_hash}.prof")
+
+    def profile(self, request_hash: str, func, *args):
+        """func(*args)を計測して結果を返し、プロファイルを保存する"""
+        path = self.path_for(request_hash)
+        with self._lock:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func, *args)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        profiler.dump_stats(temporary)
+        os.replace(temporary, path)
+        return result
+
+    def summary(self, request_hash: str, limit: int = 40) -> str:
+        """保存済みプロファイルの累積時間順の上位（テキスト）"""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.path_for(request_hash), stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+def frame_stack(frame, max_depth: int = 64) -> tuple:
+    """フレームから根→末端の順の ("file:function", ...) を作る"""
+    stack = []
+    while frame is not None and len(stack) < max_depth:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def read_collapsed(path: str) -> Counter:
+    counts = Counter()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    except FileNotFoundError:
+        pass
+    return counts
+
+
+class StackSampler:
+    """常時稼働の低頻度サンプリングプロファイラ
+
+    interval秒ごとに他スレッドのスタックを採取し（待機中のスレッドは除く）、flush_interval秒ごとに
+    path（collapsed形式）の既存の集計に加算して書き換える。
+    """
+
+    def __init__(self, path: str, interval: float = 0.1, flush_interval: float = 60.0,
+                 max_depth: int = 64, include_idle: bool = False):
+        self.path = path
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self.samples = 0
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def sample_once(self):
+        """全スレッド（自身を除く）のスタックを1回採取する"""
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if not self.include_idle:
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+            stacks.append(";".join(frame_stack(frame, self.max_depth)))
+        with self._lock:
+            self._counts.update(stacks)
+            self.samples += 1
+
+    def flush(self):
+        """集計をファイルの既存の集計に加算して書き換える"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        counts.update(read_collapsed(self.path))
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stop.wait(self.interval):
+            self.sample_once()
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
@@ -0,0 +1,146 @@
+"""
+クライアント単位のインメモリ・レート制限（トークンバケット）
+
+トークンバケットはGCRA（Generic Cell Rate Algorithm）形式で実装し、クライアントごとに
+「理論到着時刻」のfloat 1つだけを保持する。理論到着時刻を過ぎたバケットは満タンと同じなので
+削除しても結果は変わらず、定期的な掃除で自動的に期限切れになる。
+"""
+
+import json
+import math
+import time
+from typing import NamedTuple
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int  # バケットが満タンに戻るまでの秒数
+    retry_after: int  # 拒否時に次のリクエストが通るまでの秒数
+
+
+class TokenBucketLimiter:
+    """毎秒rateトークン補充・容量burstのトークンバケット（キーごと）"""
+
+    def __init__(self, rate: float, burst: int, sweep_interval: float = 60.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._interval = 1.0 / rate  # トークン1個あたりの補充時間
+        self._capacity = burst * self._interval  # 満タンのバケットが許容する先行時間
+        self._tats = {}  # キー -> 理論到着時刻
+        self._next_sweep = clock() + sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def hit(self, key: str) -> RateLimitDecision:
+        """トークンを1つ消費する（足りなければ拒否）"""
+        now = self._clock()
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + self._interval
+        if new_tat - now > self._capacity:
+            retry_after = new_tat - self._capacity - now
+            return RateLimitDecision(False, self.burst, 0, math.ceil(tat - now), max(1, math.ceil(retry_after)))
+
+        self._tats[key] = new_tat
+        remaining = int((self._capacity - (new_tat - now)) / self._interval + 1e-9)
+        return RateLimitDecision(True, self.burst, remaining, math.ceil(new_tat - now), 0)
+
+    def sweep(self, now: float = None):
+        """満タンに戻ったバケット（理論到着時刻を過ぎたもの）を削除する"""
+        now = self._clock() if now is None else now
+        expired = [key for key, tat in self._tats.items() if tat <= now]
+        for key in expired:
+            del self._tats[key]
+        self._next_sweep = now + self.sweep_interval
+
+
+def client_key(scope, trust_forwarded_for: bool = False, api_keys=frozenset(), trusted_proxies=frozenset()) -> str:
+    """レート制限のキー（登録済みのAPIキーならAPIキー、それ以外はクライアントIP）
+
+    未登録のAPIキーは無視する（リクエストごとにキーを変えて制限を回避したり、バケットを増やしたりできないように）。
+    X-Forwarded-For は trust_forwarded_for が有効で、trusted_proxies が空か接続元がそれに含まれる場合だけ使う。
+    """
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key")
+    if api_key and api_key.decode("latin-1") in api_keys:
+        return "key:" + api_key.decode("latin-1")
+    client = scope.get("client")
+    client_ip = client[0] if client else "unknown"
+    forwarded_for = headers.get(b"x-forwarded-for")
+    if trust_forwarded_for and forwarded_for and (not trusted_proxies or client_ip in trusted_proxies):
+        # 信頼できるプロキシ（Railway）が末尾に追加した値を使う（先頭はクライアントが偽装可能）
+        return "ip:" + forwarded_for.decode("latin-1").split(",")[-1].strip()
+    return "ip:" + client_ip
+
+
+class RateLimitMiddleware:
+    """パスごとに安価/高価な予算を使い分けるASGIミドルウェア
+
+    expensive_paths に該当するPOSTは高価な予算、exempt_paths（ヘルスチェック）は対象外、
+    それ以外は安価な予算で制限する。レスポンスには RateLimit-* ヘッダを付与する。
+    """
+
+    def __init__(self, app, cheap: TokenBucketLimiter, expensive: TokenBucketLimiter,
+                 expensive_paths=(), exempt_paths=(), trust_forwarded_for: bool = False, api_keys=(),
+                 trusted_proxies=(), enabled: bool = True):
+        self.app = app
+        self.cheap = cheap
+        self.expensive = expensive
+        self.expensive_paths = tuple(expensive_paths)
+        self.exempt_paths = tuple(exempt_paths)
+        self.trust_forwarded_for = trust_forwarded_for
+        self.api_keys = frozenset(api_keys)
+        self.trusted_proxies = frozenset(trusted_proxies)
+        self.enabled = enabled
+
+    def limiter_for(self, method: str, path: str):
+        if path in self.exempt_paths or method == "OPTIONS":
+            return None
+        if method == "POST" and path.startswith(self.expensive_paths):
+            return self.expensive
+        return self.cheap
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter_for(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        decision = limiter.hit(client_key(scope, self.trust_forwarded_for, self.api_keys, self.trusted_proxies))
+        rate_headers = [
+            (b"ratelimit-limit", str(decision.limit).encode()),
+            (b"ratelimit-remaining", str(decision.remaining).encode()),
+            (b"ratelimit-reset", str(decision.reset).encode()),
+        ]
+
+        if not decision.allowed:
+            body = json.dumps({"detail": "Rate limit exceeded"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(decision.retry_after).encode()),
+                ] + rate_headers,
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + rate_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
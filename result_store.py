@@ -0,0 +1,165 @@
+"""
+永続化された分析結果ストア（SQLite WALモード）
+
+正規化済みリクエストのハッシュと分析エンジンのバージョンをキーに、エンコード済みの結果を保存する。
+複数プロセス（gunicornワーカー）が同じDBファイルを共有でき、再起動・再デプロイ後も結果が残る。
+
+- 前段にプロセス内のLRU（デコード済みの値）を置き、ディスクはそのミス時にだけ参照する
+- 合計サイズが max_bytes を超えたら、旧バージョンの結果 → 最終アクセスが古い結果の順に
+  low_watermark の割合まで削除する
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    request_hash TEXT NOT NULL,
+    engine_version TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (request_hash, engine_version)
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at);
+CREATE TABLE IF NOT EXISTS store_meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (name, value) VALUES ('total_bytes', 0);
+"""
+
+
+class ResultStore:
+    """encode(value) -> bytes / decode(bytes) -> value で値を保存するキャッシュ"""
+
+    def __init__(self, path: str, engine_version: str, encode, decode, max_bytes: int = 256 * 1024 * 1024,
+                 memory_items: int = 1024, low_watermark: float = 0.9):
+        self.path = path
+        self.engine_version = engine_version
+        self.encode = encode
+        self.decode = decode
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.low_watermark = low_watermark
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            connection.executescript(SCHEMA)
+            self._initialized = True
+        return connection
+
+    # --- プロセス内LRU ---
+
+    def peek(self, request_hash: str):
+        """プロセス内LRUだけを参照する（ディスクI/Oなし、無ければNone）"""
+        with self._lock:
+            value = self._memory.get(request_hash)
+            if value is not None:
+                self._memory.move_to_end(request_hash)
+            return value
+
+    def _remember(self, request_hash: str, value):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[request_hash] = value
+            self._memory.move_to_end(request_hash)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # --- 参照・保存 ---
+
+    def get(self, request_hash: str):
+        """LRU → ディスクの順に参照する（無ければNone）"""
+        value = self.peek(request_hash)
+        if value is not None:
+            return value
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT data FROM results WHERE request_hash = ? AND engine_version = ?",
+                (request_hash, self.engine_version),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE results SET accessed_at = ? WHERE request_hash = ? AND engine_version = ?",
+                (time.time(), request_hash, self.engine_version),
+            )
+        finally:
+            connection.close()
+        value = self.decode(row[0])
+        self._remember(request_hash, value)
+        return value
+
+    def put(self, request_hash: str, value):
+        """LRUとディスクに保存し、サイズ上限を超えていれば古い結果を削除する"""
+        self._remember(request_hash, value)
+        data = self.encode(value)
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            previous = connection.execute(
+                "SELECT size FROM results WHERE request_hash = ? AND engine_version = ?",
+                (request_hash, self.engine_version),
+            ).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO results (request_hash, engine_version, data, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (request_hash, self.engine_version, data, len(data), now, now),
+            )
+            total = self._add_total(connection, len(data) - (previous[0] if previous else 0))
+            if total > self.max_bytes:
+                self._evict(connection, total)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def _add_total(self, connection: sqlite3.Connection, delta: int) -> int:
+        connection.execute("UPDATE store_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+        return connection.execute("SELECT value FROM store_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _evict(self, connection: sqlite3.Connection, total: int):
+        """旧バージョン → 最終アクセスが古い順に、合計サイズが low_watermark 以下になるまで削除"""
+        target = self.max_bytes * self.low_watermark
+        victims = []
+        freed = 0
+        rows = connection.execute(
+            "SELECT request_hash, engine_version, size FROM results "
+            "ORDER BY engine_version = ?, accessed_at",
+            (self.engine_version,),
+        ).fetchall()
+        for request_hash, engine_version, size in rows:
+            if total - freed <= target:
+                break
+            victims.append((request_hash, engine_version))
+            freed += size
+        connection.executemany("DELETE FROM results WHERE request_hash = ? AND engine_version = ?", victims)
+        self._add_total(connection, -freed)
+
+    def stats(self) -> dict:
+        connection = self._connect()
+        try:
+            entries, = connection.execute(
+                "SELECT COUNT(*) FROM results WHERE engine_version = ?", (self.engine_version,)
+            ).fetchone()
+            total, = connection.execute("SELECT value FROM store_meta WHERE name = 'total_bytes'").fetchone()
+        finally:
+            connection.close()
+        with self._lock:
+            memory_entries = len(self._memory)
+        return {"entries": entries, "total_bytes": total, "memory_entries": memory_entries}
@@ -0,0 +1,273 @@
+"""
+ピッチクラスベクトルの類似進行検索（コサイン類似度の上位k件）
+
+分析結果の pitch_class_vector（12次元）をL2正規化して連続した float32 行列に持ち、
+ブロック単位の行列積でコサイン類似度の上位k件を求める。
+
+- transpose=True: クエリを12通りに回転した行列との積を取り、回転方向の最大値で比較する（移調不変）
+- 近似モード（train()後）: 球面k-meansのクラスタ（転置リスト）のうちクエリに近い nprobe 個だけを走査する
+
+使い方:
+    python similarity_index.py add INDEX.npz results.jsonl ...
+    python similarity_index.py query INDEX.npz "[C][Am][F][G]" --transpose --top 10
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+from corpus_stats import iter_documents, result_field
+
+DIMENSIONS = 12
+BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """行ごとにL2正規化する（ゼロベクトルはそのまま）"""
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, DIMENSIONS)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def rotations(query: np.ndarray) -> np.ndarray:
+    """クエリを0〜11半音上に移調した12行の行列（行rはr半音上）"""
+    return np.stack([np.roll(query, shift) for shift in range(DIMENSIONS)])
+
+
+def top_k(scores: np.ndarray, numbers: np.ndarray, k: int) -> np.ndarray:
+    """スコア降順（同点は番号の小さい順）の上位k件の位置"""
+    candidates = np.arange(len(scores))
+    if len(scores) > k:
+        # 境界の同点を落とさないよう、k番目のスコア以上をすべて残してから並べる
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    order = np.lexsort((numbers[candidates], -scores[candidates]))[:k]
+    return candidates[order]
+
+
+class SimilarityIndex:
+    """類似進行検索用のベクトルインデックス"""
+
+    def __init__(self):
+        self.doc_ids = []
+        self._chunks = []
+        self._matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        # 近似モード（train()で構築）
+        self.centroids = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._list_order = None
+        self._list_offsets = None
+        self._list_vectors = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # --- 追加 ---
+
+    def add(self, vector, doc_id: str = None):
+        self.add_vectors([vector], None if doc_id is None else [doc_id])
+
+    def add_vectors(self, vectors, doc_ids=None):
+        vectors = normalize_rows(vectors)
+        if doc_ids is None:
+            doc_ids = range(len(self.doc_ids), len(self.doc_ids) + len(vectors))
+        self.doc_ids.extend(str(doc_id) for doc_id in doc_ids)
+        self._chunks.append(vectors)
+        self._list_order = None
+
+    def add_result(self, result, doc_id: str = None):
+        """分析結果の pitch_class_vector を追加する"""
+        self.add(result_field(result, "pitch_class_vector"), doc_id)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """全ベクトルの連続した (N, 12) float32 行列"""
+        if self._chunks:
+            self._matrix = np.ascontiguousarray(np.concatenate([self._matrix, *self._chunks]))
+            self._chunks = []
+        return self._matrix
+
+    # --- 近似モード ---
+
+    def train(self, lists: int = None, iterations: int = 10, sample_size: int = 65536, seed: int = 0):
+        """球面k-meansでクラスタ中心を学習し、全ベクトルを転置リストに割り当てる"""
+        matrix = self.matrix
+        if not len(matrix):
+            raise ValueError("Index is empty")
+        lists = lists or max(1, int(np.sqrt(len(matrix))))
+        lists = min(lists, len(matrix))
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)]
+        centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # 空クラスタは前回の中心を維持
+            centroids = normalize_rows(sums)
+        self.centroids = centroids
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._list_order = None
+        return self
+
+    def _ensure_lists(self):
+        """未割り当てのベクトルをクラスタに割り当て、転置リストを作り直す
+
+        各リストのベクトルはクラスタ順に並べ替えた連続領域に複製し、検索時にギャザーせずに済むようにする。
+        """
+        if self._list_order is not None:
+            return
+        matrix = self.matrix
+        parts = [self._assignments]
+        for start in range(len(self._assignments), len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS]
+            parts.append(np.argmax(block @ self.centroids.T, axis=1).astype(np.int32))
+        self._assignments = np.concatenate(parts)
+        self._list_order = np.argsort(self._assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(self._assignments, minlength=len(self.centroids))
+        self._list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._list_vectors = matrix[self._list_order]
+
+    # --- 検索 ---
+
+    def search(self, vector, k: int = 10, transpose: bool = False, approximate: bool = None, nprobe: int = 8):
+        """コサイン類似度の上位k件を [(曲ID, スコア, 移調量)] で返す
+
+        移調量は、クエリを何半音上に移調したときに最も近いか（transpose=Falseなら常に0）。
+        approximate=None の場合は train() 済みなら近似検索を使う。
+        """
+        query = normalize_rows(vector)[0]
+        queries = rotations(query) if transpose else query[None, :]
+        if approximate is None:
+            approximate = self.centroids is not None
+        if approximate:
+            if self.centroids is None:
+                raise ValueError("Index is not trained")
+            numbers, scores, shifts = self._probe(queries, nprobe, k)
+        else:
+            numbers, scores, shifts = self._scan(queries, k)
+        best = top_k(scores, numbers, k)
+        return [
+            (self.doc_ids[number], float(score), int(shift))
+            for number, score, shift in zip(numbers[best].tolist(), scores[best].tolist(), shifts[best].tolist())
+        ]
+
+    def search_result(self, result, k: int = 10, **kwargs):
+        return self.search(result_field(result, "pitch_class_vector"), k, **kwargs)
+
+    @staticmethod
+    def _score(block: np.ndarray, queries: np.ndarray):
+        """ブロック×回転クエリの積を取り、回転方向の最大値とその移調量を返す"""
+        products = block @ queries.T
+        shifts = np.argmax(products, axis=1)
+        return products[np.arange(len(block)), shifts], shifts
+
+    def _scan(self, queries: np.ndarray, k: int):
+        """全件をブロック単位で走査する（各ブロックの上位kだけを残す）"""
+        matrix = self.matrix
+        numbers = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0, dtype=np.float32)
+        shifts = np.zeros(0, dtype=np.int64)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block_scores, block_shifts = self._score(matrix[start:start + BLOCK_ROWS], queries)
+            block_numbers = np.arange(start, start + len(block_scores))
+            numbers = np.concatenate([numbers, block_numbers])
+            scores = np.concatenate([scores, block_scores])
+            shifts = np.concatenate([shifts, block_shifts])
+            keep = top_k(scores, numbers, k)
+            numbers, scores, shifts = numbers[keep], scores[keep], shifts[keep]
+        return numbers, scores, shifts
+
+    def _probe(self, queries: np.ndarray, nprobe: int, k: int):
+        """クエリの回転ごとに近い nprobe 個のクラスタだけを、その回転で採点する
+
+        同じベクトルが複数の回転で候補になった場合は最大スコア（同点は小さい移調量）を採る。
+        """
+        self._ensure_lists()
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ queries.T), nprobe - 1, axis=0)[:nprobe]
+        numbers, scores, shifts = [], [], []
+        for shift, query in enumerate(queries):
+            for cluster in probes[:, shift]:
+                start, end = self._list_offsets[cluster], self._list_offsets[cluster + 1]
+                numbers.append(self._list_order[start:end])
+                scores.append(self._list_vectors[start:end] @ query)
+                shifts.append(np.full(end - start, shift))
+        numbers, scores, shifts = np.concatenate(numbers), np.concatenate(scores), np.concatenate(shifts)
+        if len(queries) > 1:
+            # 1つのベクトルは高々回転数だけ重複するので、上位 k×回転数 件の中で重複を除けば十分
+            keep = top_k(scores, numbers, k * len(queries))
+            numbers, scores, shifts = numbers[keep], scores[keep], shifts[keep]
+            order = np.lexsort((shifts, -scores, numbers))
+            numbers, scores, shifts = numbers[order], scores[order], shifts[order]
+            first = np.concatenate([[True], numbers[1:] != numbers[:-1]])
+            numbers, scores, shifts = numbers[first], scores[first], shifts[first]
+        return numbers, scores, shifts
+
+    # --- 保存・読み込み ---
+
+    def save(self, path: str):
+        arrays = {
+            "vectors": self.matrix,
+            "doc_ids": np.array(self.doc_ids, dtype=str),
+        }
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityIndex":
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            index._matrix = np.ascontiguousarray(data["vectors"], dtype=np.float32)
+            index.doc_ids = data["doc_ids"].tolist()
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+        return index
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="ピッチクラスベクトルの類似進行検索")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="分析結果（JSON Lines）のベクトルを追加する")
+    add_parser.add_argument("index")
+    add_parser.add_argument("paths", nargs="*", help="入力ファイル（省略時は標準入力）")
+    add_parser.add_argument("--train", action="store_true", help="追加後に近似検索用のクラスタを学習する")
+    query_parser = commands.add_parser("query", help="コード進行に似た進行を検索する")
+    query_parser.add_argument("index")
+    query_parser.add_argument("chord_input")
+    query_parser.add_argument("--top", type=int, default=10)
+    query_parser.add_argument("--transpose", action="store_true", help="移調不変で比較する")
+    query_parser.add_argument("--exact", action="store_true", help="学習済みでも全件走査する")
+    args = parser.parse_args(argv)
+
+    index = SimilarityIndex.load(args.index) if os.path.exists(args.index) else SimilarityIndex()
+    if args.command == "add":
+        skipped = Counter()
+        streams = [open(path, encoding="utf-8") for path in args.paths] or [sys.stdin]
+        for stream in streams:
+            with stream:
+                for doc_id, result in iter_documents(stream, skipped):
+                    index.add_result(result, doc_id)
+        if args.train:
+            index.train()
+        index.save(args.index)
+        print(f"{len(index)} vectors ({sum(skipped.values())} lines without a result skipped)")
+    elif args.command == "query":
+        from main import create_pitch_class_vector, extract_chords
+        vector = create_pitch_class_vector(extract_chords(args.chord_input))
+        for doc_id, score, shift in index.search(vector, args.top, transpose=args.transpose,
+                                                 approximate=False if args.exact else None):
+            print(json.dumps({"id": doc_id, "score": round(score, 6), "transpose": shift}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
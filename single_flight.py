@@ -0,0 +1,25 @@
+"""
+同一キーの同時実行をまとめるシングルフライト
+
+同じキーの処理が実行中なら、新たに実行せずその結果を待つ。計算は独立したタスクとして
+実行するため、最初の呼び出し元が切断（キャンセル）されても他の待機者には結果が届く。
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # キー -> 実行中のタスク
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key, coroutine_function):
+        """keyごとに1回だけcoroutine_function()を実行し、全ての呼び出し元に同じ結果を返す"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
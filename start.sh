@@ -2,8 +2,17 @@
 
 # PORT環境変数が設定されていない場合は8000を使用
 PORT=${PORT:-8000}
+export PORT
 
-echo "Starting server on port $PORT"
+# SERVER_MODE=single で従来の単一プロセス（uvicorn）起動
+SERVER_MODE=${SERVER_MODE:-prefork}
 
-# uvicornでアプリケーションを起動
-python -m uvicorn main:app --host 0.0.0.0 --port $PORT
\ No newline at end of file
+echo "Starting server on port $PORT ($SERVER_MODE)"
+
+if [ "$SERVER_MODE" = "single" ]; then
+    # uvicornでアプリケーションを起動
+    python -m uvicorn main:app --host 0.0.0.0 --port $PORT
+else
+    # gunicornでプリフォーク・マルチワーカー起動（ワーカー数は WEB_CONCURRENCY、既定はCPU数）
+    python -m gunicorn -c gunicorn.conf.py main:app
+fi
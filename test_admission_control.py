@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+アドミッション制御（同時実行数・待ち行列）と入力サイズ制限のテスト
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from admission import AdmissionController, OverloadedError
+from main import ChordAnalysisRequest, analyze_chord_progression
+from fastapi import HTTPException
+
+def test_queue_full_is_rejected_immediately():
+    """実行中1件・待ち1件で満杯なら、3件目は待たずに拒否されること"""
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        results = []
+
+        async def worker(name):
+            try:
+                async with controller.admit():
+                    results.append(f"{name} started")
+                    await release.wait()
+            except OverloadedError as e:
+                results.append(f"{name} rejected (retry after {e.retry_after}s)")
+
+        first = asyncio.create_task(worker("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(worker("second"))
+        await asyncio.sleep(0)
+        await worker("third")
+        release.set()
+        await asyncio.gather(first, second)
+        return results
+
+    results = asyncio.run(scenario())
+    print(results)
+    assert results[0] == "first started"
+    assert results[1].startswith("third rejected")
+    assert results[2] == "second started"
+
+def test_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        async with controller.admit():
+            try:
+                async with controller.admit():
+                    return "admitted"
+            except OverloadedError:
+                return "timed out"
+
+    assert asyncio.run(scenario()) == "timed out"
+
+def test_overload_returns_503_with_retry_after():
+    saved = main.analysis_admission, main.result_store
+    main.analysis_admission = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+    # 永続ストアに過去の結果があるとアドミッション制御を通らずに返るため無効にする
+    main.result_store = None
+
+    async def scenario():
+        async with main.analysis_admission.admit():
+            await analyze_chord_progression(ChordAnalysisRequest(chord_input="[C][G]"))
+
+    try:
+        asyncio.run(scenario())
+    except HTTPException as e:
+        assert e.status_code == 503
+        assert int(e.headers["Retry-After"]) >= 1
+    else:
+        raise AssertionError("overloaded request was accepted")
+    finally:
+        main.analysis_admission, main.result_store = saved
+
+def test_input_limits_return_413():
+    saved = (main.MAX_INPUT_CHARS, main.MAX_CHORDS)
+    main.MAX_INPUT_CHARS, main.MAX_CHORDS = 50, 3
+    try:
+        for chord_input in ["[C]" * 20, "[C][F][G][C]"]:
+            try:
+                asyncio.run(analyze_chord_progression(ChordAnalysisRequest(chord_input=chord_input)))
+            except HTTPException as e:
+                print(f"{chord_input[:12]}...: {e.status_code} {e.detail}")
+                assert e.status_code == 413
+            else:
+                raise AssertionError("oversized input was accepted")
+        response = asyncio.run(analyze_chord_progression(ChordAnalysisRequest(chord_input="[C][F][G]")))
+        assert response.status_code == 200
+    finally:
+        main.MAX_INPUT_CHARS, main.MAX_CHORDS = saved
+
+if __name__ == "__main__":
+    test_queue_full_is_rejected_immediately()
+    test_queue_timeout()
+    test_overload_returns_503_with_retry_after()
+    test_input_limits_return_413()
+    print("\n=== Test completed ===")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+依存関係つき分析パイプライン（必要な段階だけの遅延実行）のテスト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import Pipeline
+from main import (
+    ANALYSIS_PIPELINE, KEY_ESTIMATORS, KeyEstimate, ChordAnalysisRequest,
+    analysis_plan, register_key_estimator, register_fusion_stages, run_analysis,
+)
+
+def planned_stages(**kwargs):
+    targets, aliases = analysis_plan(ChordAnalysisRequest(chord_input="[C][F][G]", **kwargs))
+    return set(ANALYSIS_PIPELINE.plan(targets, ("request", "chords"), aliases))
+
+def test_runs_each_needed_stage_once():
+    calls = []
+    pipeline = Pipeline()
+    pipeline.add("double", ("x",), lambda x: calls.append("double") or x * 2)
+    pipeline.add("square", ("x",), lambda x: calls.append("square") or x * x)
+    pipeline.add("sum", ("double", "double"), lambda a, b: calls.append("sum") or a + b)
+    values = pipeline.run(["sum", "double"], x=3)
+    assert values["sum"] == 12
+    assert calls == ["double", "sum"]  # squareは要求されていないので実行しない
+    print("✅ 必要な段階だけを1回ずつ実行")
+
+def test_aliases_and_cycles():
+    pipeline = Pipeline()
+    pipeline.add("fast", (), lambda: "fast")
+    pipeline.add("slow", (), lambda: "slow")
+    pipeline.add("report", ("result",), lambda result: f"used {result}")
+    values = pipeline.run(["report"], {"result": "fast"})
+    assert values["report"] == "used fast" and values["result"] == "fast" and "slow" not in values
+    pipeline.add("a", ("b",), lambda b: b)
+    pipeline.add("b", ("a",), lambda a: a)
+    try:
+        pipeline.plan(["a"])
+        assert False, "cycle not detected"
+    except ValueError:
+        pass
+
+def test_analysis_plan_skips_unneeded_estimators():
+    assert planned_stages(fields=["pitch_class_vector"]) == {"pitch_vector"}
+    assert planned_stages(algorithm="borrowed_chord_minimal", fields=["main_key"]) == {
+        "estimate:borrowed_chord_minimal", "main_key:borrowed_chord_minimal"}
+    assert planned_stages(algorithm="manual", manual_key="C Major", fields=["borrowed_chords"]) == {
+        "main_key:manual", "borrowed_chords"}
+    hybrid = planned_stages(fields=["main_key"])
+    assert {f"estimate:{algorithm}" for algorithm in KEY_ESTIMATORS} <= hybrid
+    assert "progression_details" not in hybrid and "key_candidates" not in hybrid
+    print("✅ 要求項目に応じて推定段階を省略")
+
+def test_plugged_in_estimator():
+    """入力を宣言して登録した推定アルゴリズムが候補・アルゴリズム指定・hybridに加わること"""
+    @register_key_estimator("always_g", ("chords",), "traditional_weight")
+    def always_g(chords):
+        return KeyEstimate("G Major", 0.5, 10.0)
+    try:
+        result = run_analysis(ChordAnalysisRequest(chord_input="[C][F][G]"))
+        assert result.key_candidates[-1].algorithm == "always_g"
+        assert result.key_candidates[-1].borrowed_chord_count == 1  # F (F natural)
+        assert result.main_key == "G Major" and result.confidence == 0.5  # hybridで最高スコア
+        only = run_analysis(ChordAnalysisRequest(chord_input="[C][F][G]", algorithm="always_g", fields=["main_key"]))
+        assert only.main_key == "G Major" and only.pitch_class_vector is None
+    finally:
+        del KEY_ESTIMATORS["always_g"]
+        for stage in ("estimate:always_g", "candidate:always_g", "main_key:always_g"):
+            del ANALYSIS_PIPELINE.stages[stage]
+        register_fusion_stages()
+    assert [c.algorithm for c in run_analysis(ChordAnalysisRequest(chord_input="[C][F][G]")).key_candidates] == [
+        "traditional", "borrowed_chord_minimal", "triad_ratio"]
+    print("✅ 推定アルゴリズムの追加")
+
+if __name__ == "__main__":
+    test_runs_each_needed_stage_once()
+    test_aliases_and_cycles()
+    test_analysis_plan_skips_unneeded_estimators()
+    test_plugged_in_estimator()
+    print("\n=== Test completed ===")
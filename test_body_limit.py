@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+リクエスト本文のサイズ制限のテスト
+"""
+
+import sys
+import os
+import asyncio
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from body_limit import BodySizeLimitMiddleware
+
+def call_middleware(middleware, method, path, chunks, headers=()):
+    """本文をchunksに分けて送り、(ステータス, アプリが読んだバイト数) を返す"""
+    messages = []
+    read = []
+
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RuntimeError("client disconnected")
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        read.append(len(body))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    pending = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+               for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return pending.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    middleware.app = app
+    scope = {"type": "http", "method": method, "path": path, "headers": list(headers)}
+    asyncio.run(middleware(scope, receive, send))
+    return messages[0]["status"], read, messages
+
+def test_content_length_over_limit_is_rejected_before_reading():
+    middleware = BodySizeLimitMiddleware(None, {"/jobs": 10})
+    status, read, messages = call_middleware(middleware, "POST", "/jobs", [b"x" * 20], [(b"content-length", b"20")])
+    assert status == 413 and read == []
+    assert json.loads(messages[1]["body"]) == {"detail": "Request body is too large (max 10 bytes)"}
+    print("✅ Content-Lengthで拒否")
+
+def test_streamed_body_is_cut_off():
+    middleware = BodySizeLimitMiddleware(None, {"/jobs": 10})
+    status, read, messages = call_middleware(middleware, "POST", "/jobs", [b"x" * 6, b"x" * 6, b"x" * 6])
+    assert status == 413 and read == []
+    assert len(messages) == 2  # アプリ側の応答は送られない
+
+def test_other_requests_pass():
+    middleware = BodySizeLimitMiddleware(None, {"/jobs": 10})
+    assert call_middleware(middleware, "POST", "/jobs", [b"x" * 5, b"x" * 5])[:2] == (200, [10])
+    assert call_middleware(middleware, "POST", "/analyze", [b"x" * 20])[:2] == (200, [20])
+    assert call_middleware(middleware, "GET", "/jobs/abc", [b"x" * 20])[:2] == (200, [20])
+
+if __name__ == "__main__":
+    test_content_length_over_limit_is_rejected_before_reading()
+    test_streamed_body_is_cut_off()
+    test_other_requests_pass()
+    print("\n=== Test completed ===")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+借用和音最小化（構成音数行列 × キーマスク行列）のテスト
+"""
+
+import sys
+import os
+import time
+import random
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import (
+    KEY_MASK_MATRIX, get_all_keys, get_diatonic_notes, note_index,
+    canonical_key_membership, chord_key_membership, key_membership_table, find_key_by_borrowed_chord_minimization,
+)
+from test_transposition_cache import reference_minimization
+
+def test_key_mask_matrix():
+    assert KEY_MASK_MATRIX.shape == (24, 13)
+    assert not KEY_MASK_MATRIX[:, 12].any()  # 正規化できない音名はどのキーにも含まれない
+    for position, key in enumerate(get_all_keys()):
+        expected = sorted(note_index(note) for note in get_diatonic_notes(key))
+        assert np.flatnonzero(KEY_MASK_MATRIX[position]).tolist() == expected
+
+def test_long_progression_matches_reference():
+    rng = random.Random(0)
+    vocabulary = ['C', 'Am', 'F', 'G', 'E7', 'Dm7', 'G7', 'CM7', 'Fm', 'Bb7', 'Ab', 'Db', 'Cb', 'E#m', 'F#m7(11)']
+    chords = [rng.choice(vocabulary) for _ in range(2000)]
+    expected = reference_minimization(chords)
+    chord_key_membership.cache_clear()
+    canonical_key_membership.cache_clear()
+    start = time.perf_counter()
+    result = find_key_by_borrowed_chord_minimization(chords)
+    elapsed = time.perf_counter() - start
+    assert result == expected
+    print(f"✅ 2000コード: {result} ({elapsed * 1000:.1f}ms)")
+
+def test_table_counts():
+    table = key_membership_table(("C", "Fm", "G7"))
+    c_major = get_all_keys().index("C Major")
+    assert table.total_notes == 3 + 3 + 4
+    assert table.borrowed_counts[c_major] == 1  # Fm (Ab)
+    assert table.matching_notes[c_major] == 9
+    assert np.flatnonzero(table.non_diatonic[:, c_major]).tolist() == [1]
+
+if __name__ == "__main__":
+    test_key_mask_matrix()
+    test_long_progression_matches_reference()
+    test_table_counts()
+    print("\n=== Test completed ===")
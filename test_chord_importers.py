@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+ChordPro・MusicXML・iRealの取り込みと input_format 指定での分析のテスト
+"""
+
+import sys
+import os
+import io
+import asyncio
+import json
+import tempfile
+import zipfile
+from contextlib import redirect_stdout
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import chord_importers
+from chord_importers import (
+    ChordImportError, iter_chordpro_chords, iter_ireal_chords, iter_musicxml_chords, ireal_symbol,
+)
+import main
+from fastapi import HTTPException
+from main import (
+    ChordAnalysisRequest, JobSubmitRequest, analyze_chord_progression, extract_chords, extract_chords_within_limits,
+    get_chord_components, run_analysis, submit_job,
+)
+
+CHORDPRO = """{title: Test Song}
+{subtitle: Example}
+# コメント行 [Dm]
+[C]Twinkle twinkle [Am]little [*Riff]star
+{comment: Chorus [E7]}
+How I [Fm]wonder [G7]what you [N.C.]are
+{start_of_tab}
+e|--[Bb]--|
+{end_of_tab}
+{start_of_grid}
+| C . . . | G7 . . . |
+{end_of_grid}
+"""
+
+def harmony(step, kind, alter=None, bass=None, degrees=()):
+    root = f"<root-step>{step}</root-step>" + (f"<root-alter>{alter}</root-alter>" if alter is not None else "")
+    xml = f"<harmony><root>{root}</root><kind text=\"\">{kind}</kind>"
+    if bass:
+        xml += f"<bass><bass-step>{bass}</bass-step></bass>"
+    for value, degree_alter, degree_type in degrees:
+        xml += (f"<degree><degree-value>{value}</degree-value><degree-alter>{degree_alter}</degree-alter>"
+                f"<degree-type>{degree_type}</degree-type></degree>")
+    return xml + "</harmony>"
+
+def musicxml(*measures, parts=1, namespace=""):
+    xmlns = f' xmlns="{namespace}"' if namespace else ""
+    body = "".join(f'<measure number="{i + 1}">{m}<note><pitch><step>C</step><octave>4</octave></pitch></note></measure>'
+                   for i, m in enumerate(measures))
+    part_list = "".join(f'<score-part id="P{p}"><part-name>Part {p}</part-name></score-part>' for p in range(1, parts + 1))
+    score_parts = "".join(f'<part id="P{p}">{body}</part>' for p in range(1, parts + 1))
+    return (f'<?xml version="1.0" encoding="UTF-8"?><score-partwise version="4.0"{xmlns}>'
+            f'<part-list>{part_list}</part-list>{score_parts}</score-partwise>')
+
+SCORE = musicxml(
+    harmony("C", "major"),
+    harmony("A", "minor-seventh") + harmony("B", "major", alter=-1, bass="D"),
+    harmony("G", "dominant", degrees=[(9, -1, "add"), (13, 0, "add"), (5, 0, "subtract")]),
+    harmony("F", "minor") + "<harmony><kind>none</kind></harmony>" + harmony("C", "major-seventh"),
+)
+SCORE_CHORDS = ["C", "Am7", "Bb/D", "G7(b9,13)", "Fm", "CM7"]
+
+def test_chordpro():
+    chords = list(iter_chordpro_chords(io.StringIO(CHORDPRO)))
+    assert chords == ["C", "Am", "Fm", "G7", "N.C.", "C", "G7"]
+    print(f"✅ ChordPro: {chords}")
+
+def test_musicxml_harmony():
+    assert list(iter_musicxml_chords(io.BytesIO(SCORE.encode()))) == SCORE_CHORDS
+    # 名前空間付き・複数パート（同じコード記号を重複させない）
+    duplicated = musicxml(harmony("D", "minor"), harmony("G", "dominant"), parts=2, namespace="http://www.musicxml.org")
+    assert list(iter_musicxml_chords(io.BytesIO(duplicated.encode()))) == ["Dm", "G7"]
+    for chord in SCORE_CHORDS:
+        assert get_chord_components(chord), chord
+    assert get_chord_components("G7(b9,13)") == ["G", "B", "D", "F", "G#", "E"]
+    print(f"✅ MusicXML: {SCORE_CHORDS}")
+
+def test_compressed_musicxml():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("META-INF/container.xml",
+                         '<container><rootfiles><rootfile full-path="score/song.xml"/></rootfiles></container>')
+        archive.writestr("score/song.xml", SCORE)
+    assert list(iter_musicxml_chords(io.BytesIO(data.getvalue()))) == SCORE_CHORDS
+    print("✅ 圧縮MusicXML（.mxl）")
+
+def test_musicxml_is_streamed():
+    """処理済みの小節は解放され、木全体を保持しないこと"""
+    measures = [harmony("C", "major") + "<note/>" * 50] * 2000
+    source = io.BytesIO(musicxml(*measures).encode())
+    chords = iter_musicxml_chords(source)
+    assert next(chords) == "C"
+    assert source.tell() < len(source.getvalue())  # 最初のコードは全体を読む前に返る
+    assert sum(1 for _ in chords) == 1999
+    try:
+        list(iter_musicxml_chords(io.BytesIO(b"<score-partwise><part>")))
+        assert False, "broken XML accepted"
+    except ChordImportError:
+        pass
+
+def test_ireal_symbols():
+    cases = {
+        "C^7": "CM7", "D-7": "Dm7", "G7": "G7", "Bh7": "Bm7b5", "C#o7": "C#dim7", "Eb-^7": "EbmM7",
+        "F^7#11": "FM7(#11)", "A7b9": "A7(b9)", "E7alt": "E7(b9,#9,b13)", "Bb7sus": "Bb7sus4",
+        "G7b9sus": "Gsus4(7,b9)", "C69": "C6(9)", "D-69": "Dm6(9)", "Ab+": "Abaug", "C7#5": "C7+5",
+        "Gsus": "Gsus4", "F2": "Fadd9", "D/F#": "D/F#", "C-7/Bb": "Cm7/Bb", "Db13#11": "Db7(9,13,#11)",
+    }
+    for token, expected in cases.items():
+        assert ireal_symbol(token) == expected, (token, ireal_symbol(token))
+        assert get_chord_components(expected), expected
+    assert ireal_symbol("W/C") is None
+    # テンション・7度・変化した5度を落とさずに解析できる記法にすること
+    components = {
+        "Bb7b9sus": ("Bbsus4(7,b9)", ["Bb", "Eb", "F", "G#", "B"]),
+        "C13sus": ("Csus4(7,9,13)", ["C", "F", "G", "A#", "D", "A"]),
+        "C^7b5": ("CM7(#11)", ["C", "E", "G", "B", "F#"]),
+        "Ch9": ("Cdim(7,9)", ["C", "Eb", "Gb", "A#", "D"]),
+        "C7#9#5": ("Caug(7,#9)", ["C", "E", "G#", "A#", "D#"]),
+    }
+    for token, (expected, notes) in components.items():
+        assert ireal_symbol(token) == expected, (token, ireal_symbol(token))
+        assert get_chord_components(expected) == notes, expected
+    print("✅ iRealのコード記号")
+
+def test_ireal_chart():
+    chart = "[T44*AC^7 A-7 |D-7 G7 |x |r| n |<D.C. al Coda>C^7(A7b9) p Z"
+    assert list(iter_ireal_chords(chart)) == [
+        "CM7", "Am7", "Dm7", "G7", "Dm7", "G7", "Dm7", "G7", "Dm7", "G7", "CM7",
+    ]
+    url = "irealbook://Song A=Composer=Swing=C=n=[T44C^7 |F^7 Z=Song B=Composer=Bossa=A-=n=[A-7 |E7 Z"
+    assert list(iter_ireal_chords(url)) == ["CM7", "FM7", "Am7", "E7"]
+    try:
+        list(iter_ireal_chords("irealb://%3D%3D%3D"))
+        assert False, "obfuscated chart accepted"
+    except ChordImportError:
+        pass
+    print("✅ iRealのチャート")
+
+def test_analyze_with_input_format():
+    bracket = run_analysis(ChordAnalysisRequest(chord_input="[C][Am][Fm][G7][C]"))
+    sources = {
+        "chordpro": "[C]Line [Am]one\n[Fm]Line [G7]two [C]",
+        "musicxml": musicxml(harmony("C", "major"), harmony("A", "minor"), harmony("F", "minor"),
+                             harmony("G", "dominant"), harmony("C", "major")),
+        "ireal": "irealbook://Song=Composer=Pop=C=n=[T44C |A- |F- |G7 |C Z",
+    }
+    for input_format, chord_input in sources.items():
+        request = ChordAnalysisRequest(chord_input=chord_input, input_format=input_format)
+        assert extract_chords_within_limits(request.chord_input, request.input_format) == ["C", "Am", "Fm", "G7", "C"]
+        assert run_analysis(request) == bracket, input_format
+    assert extract_chords_within_limits("[C][G]") == extract_chords("[C][G]")
+    for chord_input, input_format in (("[C]", "abc"), ("<score-partwise>", "musicxml")):
+        try:
+            extract_chords_within_limits(chord_input, input_format)
+            assert False, "invalid input accepted"
+        except HTTPException as e:
+            assert e.status_code == 422
+    print("✅ input_format指定での分析")
+
+def test_full_musicxml_scores_fit_the_document_limit():
+    """実際の楽譜程度の大きさのMusicXMLは/analyzeで受け付け、brackets形式の上限は変わらないこと"""
+    score = musicxml(*[harmony(step, "major") + "<note><pitch><step>C</step><octave>4</octave></pitch></note>" * 8
+                       for step in "CFGC" * 25])
+    assert main.MAX_INPUT_CHARS < len(score) < main.MAX_DOCUMENT_INPUT_CHARS
+    response = asyncio.run(analyze_chord_progression(
+        ChordAnalysisRequest(chord_input=score, input_format="musicxml", fields=["main_key"])))
+    assert response.status_code == 200 and json.loads(response.body) == {"main_key": "C Major"}
+    try:
+        extract_chords_within_limits("[C]" * (main.MAX_INPUT_CHARS // 3 + 1))
+        assert False, "oversized bracket input accepted"
+    except HTTPException as e:
+        assert e.status_code == 413
+
+def test_job_rejects_unparseable_documents_at_submit():
+    request = JobSubmitRequest(chord_inputs=[musicxml(harmony("C", "major")), "<score-partwise>"], input_format="musicxml")
+    try:
+        asyncio.run(submit_job(request))
+        assert False, "unparseable document accepted"
+    except HTTPException as e:
+        assert e.status_code == 422 and e.detail.startswith("chord_inputs[1]: Invalid MusicXML")
+
+def test_cli_imports_folders_in_parallel():
+    with tempfile.TemporaryDirectory() as directory:
+        files = {
+            "a.cho": "{title: A}\n[C]one [F]two [G]three [C]four\n",
+            "b.musicxml": musicxml(harmony("D", "major"), harmony("G", "major"), harmony("A", "major"), harmony("D", "major")),
+            "c.ireal": "[T44A- |D- |E7 |A- Z",
+            "d.xml": "<score-partwise>",
+            "notes.txt": "ignored",
+        }
+        for name, content in files.items():
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        output = io.BytesIO()
+
+        class Stdout:
+            buffer = output
+
+        with redirect_stdout(Stdout()):
+            chord_importers.main([directory, "--workers", "2"])
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [os.path.basename(line["id"]) for line in lines] == ["a.cho", "b.musicxml", "c.ireal", "d.xml"]
+    assert [line["result"]["main_key"] for line in lines[:3]] == ["C Major", "D Major", "A Minor"]
+    assert lines[2]["chords"] == ["Am", "Dm", "E7", "Am"]
+    assert "error" in lines[3]
+    print("✅ フォルダの並列取り込み")
+
+if __name__ == "__main__":
+    test_chordpro()
+    test_musicxml_harmony()
+    test_compressed_musicxml()
+    test_musicxml_is_streamed()
+    test_ireal_symbols()
+    test_ireal_chart()
+    test_analyze_with_input_format()
+    test_full_musicxml_scores_fit_the_document_limit()
+    test_job_rejects_unparseable_documents_at_submit()
+    test_cli_imports_folders_in_parallel()
+    print("\n=== Test completed ===")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+分析結果の列指向エクスポートのテスト
+"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+from contextlib import redirect_stdout
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import columnar_export
+from columnar_export import ColumnarResults, ColumnarWriter, export_results
+from differential_harness import compare
+from main import ChordAnalysisRequest, encode_json, json_loads, run_analysis, select_fields
+
+PROGRESSIONS = [
+    "[C][Am][Fm][G7][C]",
+    "[Am][Dm][E7][Am]",
+    "",
+    "[C][Fm][C][Fm][G7][C]",
+    "[CM7][Am7][Fm][G7]",
+    "[Dm7][G7][CM7]",
+]
+
+def analyze(chord_input, **params):
+    request = ChordAnalysisRequest(chord_input=chord_input, **params)
+    return json_loads(encode_json(select_fields(run_analysis(request), request.fields)))
+
+def expected_record(result):
+    return {name: value for name, value in result.items() if name != "progression_details"}
+
+def test_round_trip():
+    results = [analyze(chord_input) for chord_input in PROGRESSIONS]
+    with tempfile.TemporaryDirectory() as directory:
+        # 小さなchunk_rowsで列ファイルへの追記を複数回行う
+        manifest = export_results(((f"song-{i}", r) for i, r in enumerate(results)), directory, chunk_rows=2)
+        assert manifest["rows"] == len(results)
+        columns = ColumnarResults(directory)
+        assert len(columns) == len(results)
+        assert isinstance(columns["pitch_class_vector"], np.memmap)
+        assert columns["pitch_class_vector"].shape == (len(results), 12) and columns["pitch_class_vector"].dtype == np.float32
+        assert columns["main_key"].dtype == np.int32 and columns["confidence"].dtype == np.float32
+        assert columns["borrowed_offsets"].tolist()[-1] == len(columns["borrowed_chord"])
+        for row, result in enumerate(results):
+            assert columns.doc_id(row) == f"song-{row}"
+            assert compare(expected_record(result), columns.record(row), tolerance=1e-6) == [], row
+        # JSONを解析せずに列だけで集計できる
+        minor = columns["main_key"] == columns.code("key", "A Minor")
+        assert minor.tolist() == [False, True, False, False, False, False]
+        assert columns.code("key", "Db Dorian") == -1
+        counts = np.diff(columns["borrowed_offsets"])
+        assert counts.tolist() == [len(r["borrowed_chords"]) for r in results]
+    print(f"✅ {len(results)}件の往復（float32の許容誤差内）")
+
+def test_records_and_missing_fields():
+    request = ChordAnalysisRequest(chord_input="[C][Fm][G7][C]")
+    record = run_analysis(request)
+    partial = analyze("[Am][Dm][E7][Am]", fields=["main_key"])
+    with tempfile.TemporaryDirectory() as directory:
+        with ColumnarWriter(directory) as writer:
+            writer.add(record, "record")
+            writer.add(partial)
+        columns = ColumnarResults(directory, mmap=False)
+        assert compare(expected_record(json_loads(encode_json(record))), columns.record(0), tolerance=1e-6) == []
+        missing = columns.record(1)
+        assert missing["main_key"] == "A Minor" and missing["algorithm_used"] is None
+        assert np.isnan(missing["confidence"]) and all(np.isnan(missing["pitch_class_vector"]))
+        assert missing["borrowed_chords"] == [] and missing["key_candidates"] == []
+        assert columns.doc_id(1) == ""
+
+def test_incomplete_or_existing_directory():
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ColumnarWriter(directory)
+        writer.add(analyze("[C][G]"))
+        try:
+            ColumnarResults(directory)  # manifest.json は close() まで書かれない
+            assert False, "incomplete export accepted"
+        except FileNotFoundError:
+            pass
+        writer.close()
+        assert len(ColumnarResults(directory)) == 1
+        try:
+            ColumnarWriter(directory)
+            assert False, "non-empty directory accepted"
+        except FileExistsError:
+            pass
+
+def test_cli_exports_json_lines():
+    lines = [
+        json.dumps({"id": "a.mid", "result": analyze("[C][F][G][C]")}),
+        json.dumps({"id": "broken.mid", "error": "not midi"}),
+        json.dumps(analyze("[Am][Dm][E7][Am]")),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        output = os.path.join(directory, "columns")
+        with redirect_stdout(io.StringIO()):
+            columnar_export.main([output, path])
+        columns = ColumnarResults(output)
+        assert len(columns) == 2
+        assert [columns.doc_id(0), columns.doc_id(1)] == ["a.mid", ""]
+        assert columns.decode("key", columns["main_key"]) == ["C Major", "A Minor"]
+    print("✅ JSON Linesからのエクスポート")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_records_and_missing_fields()
+    test_incomplete_or_existing_directory()
+    test_cli_exports_json_lines()
+    print("\n=== Test completed ===")
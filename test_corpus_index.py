@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+コーパスインデックス（ブール検索）のテスト
+"""
+
+import sys
+import os
+import io
+import json
+import random
+import tempfile
+import contextlib
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus_index import CorpusIndex, QuerySyntaxError, extract_terms, main as corpus_index_main
+from main import ChordAnalysisRequest, run_analysis, encode_json, json_loads
+
+PROGRESSIONS = [
+    "[C][Am][F][G]",
+    "[C][Fm][G][C]",
+    "[Am][Dm][E7][Am]",
+    "[Am][F][C][G][E7][D]",
+    "[Dm7][G7][CM7][Ab][Bb][C]",
+    "[Cm][Ab][Bb][C]",
+    "[Em][C][G][D][A]",
+]
+
+def analyze(progression):
+    return json_loads(encode_json(run_analysis(ChordAnalysisRequest(chord_input=progression))))
+
+RESULTS = [analyze(p) for p in PROGRESSIONS]
+
+def brute_force(results, predicate):
+    return [i for i, result in enumerate(results) if predicate(extract_terms(result))]
+
+def test_extract_terms():
+    terms = extract_terms(analyze("[C][Fm][G][C]"))
+    assert "borrowed:Fm" in terms and "chord:G" in terms
+    assert "relationship:Parallel Minor/Major" in terms
+    assert "mode:Major" in terms
+
+def test_queries_match_brute_force():
+    rng = random.Random(0)
+    results = [rng.choice(RESULTS) for _ in range(2000)]
+    index = CorpusIndex().add_all(results)
+    cases = {
+        'mode:Minor AND relationship:"Parallel Minor/Major"':
+            lambda t: "mode:Minor" in t and "relationship:Parallel Minor/Major" in t,
+        "NOT agree:triad_ratio+traditional":
+            lambda t: "agree:traditional+triad_ratio" not in t,
+        '(key:"C Major" OR key:"A Minor") chord:G NOT borrowed:Fm':
+            lambda t: ("key:C Major" in t or "key:A Minor" in t) and "chord:G" in t and "borrowed:Fm" not in t,
+        "borrowed:E7 OR borrowed:Ab":
+            lambda t: "borrowed:E7" in t or "borrowed:Ab" in t,
+        "chord:Unknown":
+            lambda t: False,
+    }
+    for query, predicate in cases.items():
+        assert index.query_numbers(query).tolist() == brute_force(results, predicate), query
+        print(f"✅ {query}: {index.count(query)}件")
+
+def test_incremental_segments_persist():
+    """追記はセグメントとして保存され、再読み込み・compact後も同じ検索結果になること"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = CorpusIndex(directory)
+        for i, result in enumerate(RESULTS):
+            index.add(result, doc_id=f"song-{i}")
+            if i % 3 == 2:
+                index.commit()
+        index.commit()
+        assert len(index.segments) == 3
+        reopened = CorpusIndex(directory)
+        assert len(reopened) == len(RESULTS)
+        expected = [f"song-{i}" for i in brute_force(RESULTS, lambda t: "mode:Minor" in t)]
+        assert reopened.search("mode:Minor") == expected
+        reopened.compact()
+        assert CorpusIndex(directory).search("mode:Minor") == expected
+        assert len(CorpusIndex(directory).segments) == 1
+
+def test_interrupted_writes_are_ignored():
+    """書き込み途中の一時ファイルや、中断したcompactの古いセグメントを読み込まないこと"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = CorpusIndex(directory)
+        for i, result in enumerate(RESULTS):
+            index.add(result, doc_id=f"song-{i}")
+            if i % 3 == 2:
+                index.commit()
+        index.commit()
+        with open(os.path.join(directory, "segment-0000000099.npz.tmp"), "wb") as f:
+            f.write(b"PK\x03\x04partial")
+        expected = CorpusIndex(directory).search("mode:Minor")
+        # compactが統合セグメントを置いた直後に中断した状態（base>0の古いセグメントが残る）
+        stale = [path for path in sorted(os.listdir(directory)) if path.endswith(".npz")][1:]
+        saved = {name: open(os.path.join(directory, name), "rb").read() for name in stale}
+        CorpusIndex(directory).compact()
+        for name, data in saved.items():
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+        reopened = CorpusIndex(directory)
+        assert len(reopened) == len(RESULTS) and len(reopened.segments) == 1
+        assert reopened.search("mode:Minor") == expected
+        assert sorted(name for name in os.listdir(directory) if name.endswith(".npz")) == ["segment-0000000000.npz"]
+
+def test_query_syntax_errors():
+    index = CorpusIndex().add_all(RESULTS)
+    for query in ("(mode:Minor", "mode:Minor )", "", "mode:Minor OR", "Minor"):
+        try:
+            index.query_numbers(query)
+            assert False, f"should fail: {query}"
+        except QuerySyntaxError:
+            pass
+
+def test_command_line():
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "results.jsonl")
+        with open(source, "w", encoding="utf-8") as f:
+            for i, result in enumerate(RESULTS):
+                f.write(json.dumps({"id": f"song-{i}", "result": result}) + "\n")
+        index_dir = os.path.join(directory, "index")
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus_index_main(["add", index_dir, source])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            corpus_index_main(["query", index_dir, "borrowed:Fm"])
+    assert output.getvalue().split() == ["song-1"]
+
+if __name__ == "__main__":
+    test_extract_terms()
+    test_queries_match_brute_force()
+    test_incremental_segments_persist()
+    test_interrupted_writes_are_ignored()
+    test_query_syntax_errors()
+    test_command_line()
+    print("\n=== Test completed ===")
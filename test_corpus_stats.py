@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+コーパス統計（マージ可能な部分集計）のテスト
+"""
+
+import sys
+import os
+import io
+import json
+import random
+import tempfile
+import contextlib
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from corpus_stats import CorpusStats, FixedHistogram, main as corpus_stats_main
+from main import ChordAnalysisRequest, run_analysis, encode_json, json_loads
+
+PROGRESSIONS = [
+    "[C][Am][F][G]",
+    "[C][Fm][G][C]",
+    "[Am][Dm][E7][Am]",
+    "[CM7][Am7][Dm7][G7][Fm][C]",
+    "[C][Bb][F][C]",
+    "[Dm7][G7][CM7][Ab][Bb][C]",
+]
+
+def analyze(progression):
+    return run_analysis(ChordAnalysisRequest(chord_input=progression))
+
+def test_add_counts_keys_and_borrowed_chords():
+    record = analyze("[C][Fm][G][C]")
+    stats = CorpusStats().add_all([record])
+    assert stats.songs == 1
+    assert stats.main_keys[record.main_key] == 1
+    assert stats.borrowed_chords["Fm"] == 1
+    top = record.borrowed_chords[0].source_candidates[0]
+    assert stats.relationships[top.relationship] == 1
+    assert stats.borrowed_relationships["Fm"][top.relationship] == 1
+    print(f"✅ 集計: {stats.summary()}")
+
+def test_record_and_json_results_aggregate_identically():
+    """内部構造体とJSONレスポンスのどちらを取り込んでも同じ集計になること"""
+    records = [analyze(p) for p in PROGRESSIONS]
+    from_records = CorpusStats().add_all(records)
+    from_json = CorpusStats().add_all(json_loads(encode_json(r)) for r in records)
+    assert from_records == from_json
+
+def test_merge_is_exact_in_any_order():
+    results = [json_loads(encode_json(analyze(p))) for p in PROGRESSIONS] * 5
+    whole = CorpusStats().add_all(results)
+    rng = random.Random(0)
+    for _ in range(5):
+        shuffled = results[:]
+        rng.shuffle(shuffled)
+        cut = rng.randrange(1, len(shuffled))
+        left = CorpusStats().add_all(shuffled[:cut])
+        right = CorpusStats().add_all(shuffled[cut:])
+        # JSON経由で受け渡してから合算しても一致すること
+        merged = CorpusStats.from_dict(json.loads(json.dumps(right.to_dict()))).merge(left)
+        assert merged == whole
+    print("✅ 部分集計の合算が一括集計と一致")
+
+def test_sparse_results_are_accepted():
+    stats = CorpusStats().add_all([{"main_key": "C Major"}])
+    assert stats.songs == 1 and stats.main_keys["C Major"] == 1
+    assert sum(stats.histograms["confidence"].counts) == 0
+
+def test_histogram_bins():
+    histogram = FixedHistogram(0.0, 1.0, 10)
+    for value in (-0.1, 0.0, 0.05, 0.55, 0.999, 1.0):
+        histogram.add(value)
+    assert histogram.underflow == 1 and histogram.overflow == 1
+    assert histogram.counts[0] == 2 and histogram.counts[5] == 1 and histogram.counts[9] == 1
+    try:
+        histogram.merge(FixedHistogram(0.0, 2.0, 10))
+        assert False, "bin edges mismatch should raise"
+    except ValueError:
+        pass
+
+def test_command_line_merge():
+    results = [encode_json(analyze(p)).decode() for p in PROGRESSIONS]
+    with tempfile.TemporaryDirectory() as directory:
+        partials = []
+        for i, chunk in enumerate((results[:3], results[3:])):
+            source = os.path.join(directory, f"results{i}.jsonl")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write("\n".join(chunk) + "\n")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                corpus_stats_main([source])
+            partial = os.path.join(directory, f"partial{i}.json")
+            with open(partial, "w", encoding="utf-8") as f:
+                f.write(output.getvalue())
+            partials.append(partial)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            corpus_stats_main(["--merge", *partials])
+    merged = CorpusStats.from_dict(json.loads(output.getvalue()))
+    assert merged == CorpusStats().add_all(json.loads(r) for r in results)
+
+def test_lines_without_a_result_are_skipped_by_every_tool():
+    """取り込みに失敗した行・--chords-only の行を、どのコーパスツールも曲として扱わないこと"""
+    import corpus_index
+    import similarity_index
+    import columnar_export
+    lines = [
+        json.dumps({"id": "a.cho", "chords": ["Am", "Dm", "E7", "Am"], "result": json_loads(encode_json(analyze("[Am][Dm][E7][Am]")))}),
+        json.dumps({"id": "broken.mid", "error": "not midi"}),
+        json.dumps({"id": "b.cho", "chords": ["C", "G"]}),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "results.jsonl")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        def run(tool, *args):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                tool(list(args))
+            return output.getvalue()
+
+        stats = json.loads(run(corpus_stats_main, source))
+        assert stats["songs"] == 1 and stats["skipped"] == 2
+        index_dir = os.path.join(directory, "index")
+        assert "1 documents (2 lines without a result skipped)" in run(corpus_index.main, "add", index_dir, source)
+        assert run(corpus_index.main, "query", index_dir, "NOT mode:Major").split() == ["a.cho"]
+        vectors = os.path.join(directory, "vectors.npz")
+        assert "1 vectors (2 lines" in run(similarity_index.main, "add", vectors, source)
+        columns = os.path.join(directory, "columns")
+        assert "1 rows (2 lines" in run(columnar_export.main, columns, source)
+    print("✅ 結果の無い行はすべてのツールで除外")
+
+def test_job_stats_pages_through_results():
+    """ジョブ結果のページ送りで集計した統計が一括集計と一致すること"""
+    import main
+    from job_queue import JobQueue
+    original_queue, original_page = main.job_queue, main.JOB_RESULTS_PAGE_LIMIT
+    with tempfile.TemporaryDirectory() as directory:
+        main.job_queue = JobQueue(os.path.join(directory, "jobs.db"), main.run_job_item)
+        main.JOB_RESULTS_PAGE_LIMIT = 4
+        try:
+            job_id = main.job_queue.submit(PROGRESSIONS * 2, {})
+            assert main.job_queue.run_once()
+            stats = CorpusStats.from_dict(main.aggregate_job_stats(job_id))
+        finally:
+            main.job_queue, main.JOB_RESULTS_PAGE_LIMIT = original_queue, original_page
+    assert stats == CorpusStats().add_all(json_loads(encode_json(analyze(p))) for p in PROGRESSIONS * 2)
+
+if __name__ == "__main__":
+    test_add_counts_keys_and_borrowed_chords()
+    test_record_and_json_results_aggregate_identically()
+    test_merge_is_exact_in_any_order()
+    test_sparse_results_are_accepted()
+    test_histogram_bins()
+    test_command_line_merge()
+    test_lines_without_a_result_are_skipped_by_every_tool()
+    test_job_stats_pages_through_results()
+    print("\n=== Test completed ===")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+最適化エンジンと参照実装（最適化前のエンジン）の差分テスト
+
+全アルゴリズム×全進行の組み合わせは python differential_harness.py で実行する。
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from differential_harness import (
+    CURATED_PROGRESSIONS, Case, compare, random_corpus, run_cases,
+)
+
+def report(divergences):
+    return "\n".join(f"{d.case} {d.path}: {d.reference!r} != {d.optimized!r}" for d in divergences[:10])
+
+def test_curated_progressions():
+    cases = []
+    for chord_input in CURATED_PROGRESSIONS:
+        cases.append(Case(chord_input, {"include_midi": True}))
+        cases.append(Case(chord_input, {"algorithm": "manual", "manual_key": "C Major"}))
+    divergences = run_cases(cases)
+    assert not divergences, report(divergences)
+    print(f"✅ キュレーションした{len(cases)}ケースで一致")
+
+def test_random_progressions():
+    cases = random_corpus(50, seed=1, max_length=8)
+    divergences = run_cases(cases)
+    assert not divergences, report(divergences)
+    print(f"✅ ランダムな{len(cases)}ケースで一致")
+
+def test_compare_reports_divergences():
+    reference = {"main_key": "C Major", "confidence": 0.5, "borrowed_chords": [{"chord": "Fm", "source_candidates": [{"key": "C Minor"}]}]}
+    assert compare(reference, reference) == []
+    assert compare(reference, {**reference, "confidence": 0.5 + 1e-12}) == []
+    assert compare(reference, {**reference, "confidence": 0.51}) == [(".confidence", 0.5, 0.51)]
+    assert compare(reference, {**reference, "main_key": "A Minor"}) == [(".main_key", "C Major", "A Minor")]
+    changed = {**reference, "borrowed_chords": [{"chord": "Fm", "source_candidates": []}]}
+    assert compare(reference, changed) == [(".borrowed_chords[0].source_candidates[len]", 1, 0)]
+    assert compare(reference, {k: v for k, v in reference.items() if k != "confidence"}) == [(".confidence", 0.5, None)]
+
+if __name__ == "__main__":
+    test_curated_progressions()
+    test_random_progressions()
+    test_compare_reports_divergences()
+    print("\n=== Test completed ===")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+高速レスポンスシリアライズ（内部構造体 → JSONバイト列）のテスト
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import (
+    ChordAnalysisRequest, AnalysisResponse, run_analysis, encode_json
+)
+
+def canonical(data: bytes) -> str:
+    """解析した値をキー順のまま再エンコードする（浮動小数点の表記の違いを除いて比較するため）"""
+    return json.dumps(json.loads(data), ensure_ascii=False, separators=(",", ":"))
+
+def test_wire_format_matches_pydantic():
+    """直接エンコードした結果がpydantic経由のシリアライズと一致すること"""
+    print("=== Wire format compatibility test ===")
+    for chord_input in ["[CM7][Am7][FM7][G7]", "[C][Fm][Ab][G7(b9)]", "[FM7(13)][FmM7][Em7][A7]"]:
+        record = run_analysis(ChordAnalysisRequest(chord_input=chord_input))
+        fast = encode_json(record)
+        # FastAPIのresponse_model経由と同じ形式（コンパクトなJSON）
+        reference = json.dumps(
+            AnalysisResponse.model_validate(json.loads(fast)).model_dump(exclude_unset=True),
+            ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        print(f"{chord_input}: {'✓' if canonical(fast) == canonical(reference) else '✗'}")
+        assert canonical(fast) == canonical(reference)
+
+def test_stdlib_fallback_is_equivalent():
+    """orjsonが無い場合もキー・順序・値が同じになること（浮動小数点の表記は異なり得る）"""
+    record = run_analysis(ChordAnalysisRequest(chord_input="[C][Ab][Bb][C]"))
+    payloads = [record, {"small": 0.00001, "large": 1e20, "tiny": 1e-7, "record": record}]
+    saved = main.orjson
+    try:
+        fast = [encode_json(payload) for payload in payloads]
+        main.orjson = None
+        fallback = [encode_json(payload) for payload in payloads]
+    finally:
+        main.orjson = saved
+    for expected, actual in zip(fast, fallback):
+        assert canonical(expected) == canonical(actual)
+    assert json.loads(fallback[1])["small"] == 0.00001
+
+def test_empty_input():
+    """コードが無い入力でも全フィールドを返すこと"""
+    payload = json.loads(encode_json(run_analysis(ChordAnalysisRequest(chord_input="no chords"))))
+    assert payload["main_key"] == "Unknown"
+    assert payload["progression_details"] == []
+    assert list(payload.keys()) == list(AnalysisResponse.model_fields.keys())
+
+if __name__ == "__main__":
+    test_wire_format_matches_pydantic()
+    test_stdlib_fallback_is_equivalent()
+    test_empty_input()
+    print("\n=== Test completed ===")
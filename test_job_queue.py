@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+SQLiteベースの非同期ジョブキューのテスト
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_queue import JobQueue, DONE, CANCELLED, RUNNING, QUEUED
+from main import run_job_item, run_analysis, ChordAnalysisRequest
+
+def make_queue(path, handler=None, **kwargs):
+    return JobQueue(path, handler or (lambda item, params: item.upper().encode()), **kwargs)
+
+def test_job_lifecycle_and_paging():
+    with tempfile.TemporaryDirectory() as directory:
+        queue = make_queue(os.path.join(directory, "jobs.db"))
+        job_id = queue.submit([f"item{i}" for i in range(5)], {"algorithm": "hybrid"})
+        assert queue.status(job_id)["status"] == QUEUED
+        assert queue.run_once()
+        status = queue.status(job_id)
+        print(status)
+        assert status["status"] == DONE and status["completed"] == 5 and status["progress"] == 1.0
+        page = queue.results(job_id, offset=2, limit=2)
+        assert page == [(2, b"ITEM2"), (3, b"ITEM3")]
+        assert not queue.run_once()  # 処理するジョブは残っていない
+
+def test_cancellation_between_items():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jobs.db")
+        holder = {}
+
+        def handler(item, params):
+            if item == "b":
+                holder["queue"].cancel(holder["job_id"])
+            return item.encode()
+
+        queue = make_queue(path, handler)
+        holder["queue"] = queue
+        holder["job_id"] = queue.submit(["a", "b", "c", "d"], {})
+        queue.run_once()
+        status = queue.status(holder["job_id"])
+        assert status["status"] == CANCELLED
+        assert status["completed"] == 1  # "b"の結果はキャンセル後なので保存されない
+
+def test_restart_resumes_from_unfinished_items():
+    """処理中に停止したジョブはリース切れ後に別のキューが未完了分から再開すること"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jobs.db")
+        processed = []
+
+        def crashing_handler(item, params):
+            if item == "c":
+                raise KeyboardInterrupt  # プロセス停止を模擬
+            processed.append(item)
+            return item.encode()
+
+        first = make_queue(path, crashing_handler, lease_seconds=0.05)
+        job_id = first.submit(["a", "b", "c", "d"], {})
+        try:
+            first.run_once()
+        except KeyboardInterrupt:
+            pass
+        assert first.status(job_id)["status"] == RUNNING
+        assert first.status(job_id)["completed"] == 2
+
+        time.sleep(0.1)  # リース切れ
+        second = make_queue(path, lambda item, params: (processed.append(item), item.encode())[1])
+        assert second.run_once()
+        assert second.status(job_id)["status"] == DONE
+        assert processed == ["a", "b", "c", "d"]
+        assert [index for index, _ in second.results(job_id)] == [0, 1, 2, 3]
+
+def test_long_item_keeps_its_lease():
+    """リース期間より長くかかるアイテムの処理中も、別のキューがジョブを奪わないこと"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "jobs.db")
+        calls = []
+        other = make_queue(path)
+        stolen = []
+
+        def slow_handler(item, params):
+            calls.append(item)
+            deadline = time.time() + 0.6
+            while time.time() < deadline:
+                stolen.append(other.run_once())  # 別プロセスのワーカーを模擬
+                time.sleep(0.05)
+            return item.encode()
+
+        queue = make_queue(path, slow_handler, lease_seconds=0.2, heartbeat_interval=0.05)
+        job_id = queue.submit(["long"], {})
+        assert queue.run_once()
+        assert calls == ["long"] and not any(stolen)
+        assert queue.status(job_id)["status"] == DONE
+
+def test_retention_limits():
+    with tempfile.TemporaryDirectory() as directory:
+        queue = make_queue(os.path.join(directory, "jobs.db"), retention_seconds=3600, max_finished_jobs=2)
+        job_ids = [queue.submit(["x"], {}) for _ in range(4)]
+        for _ in job_ids:
+            queue.run_once()
+        assert queue.purge() == 2  # 保持数超過分（古い方から）
+        assert [queue.status(job_id) is None for job_id in job_ids] == [True, True, False, False]
+        assert queue.purge(now=time.time() + 7200) == 2  # 保持期限切れ
+
+def test_run_job_item_uses_analysis_pipeline():
+    result = json.loads(run_job_item("[Dm7][G7][CM7]", {"fields": ["main_key"]}))
+    expected = run_analysis(ChordAnalysisRequest(chord_input="[Dm7][G7][CM7]")).main_key
+    assert result == {"main_key": expected}
+
+def test_jobs_are_disabled_without_a_db_path():
+    """JOB_DB_PATH未指定ではジョブキューを作らず（作業ディレクトリにファイルを書かない）、/jobs は503を返すこと"""
+    import asyncio
+    import main
+    from fastapi import HTTPException
+    assert main.JOB_DB_PATH == "" and main.job_queue is None
+    assert not os.path.exists("jobs.db")
+    for call in (main.submit_job(main.JobSubmitRequest(chord_inputs=["[C][G]"])), main.get_job("missing")):
+        try:
+            asyncio.run(call)
+            assert False, "disabled job queue accepted a request"
+        except HTTPException as e:
+            assert e.status_code == 503
+
+if __name__ == "__main__":
+    test_job_lifecycle_and_paging()
+    test_cancellation_between_items()
+    test_restart_resumes_from_unfinished_items()
+    test_long_item_keeps_its_lease()
+    test_retention_limits()
+    test_run_job_item_uses_analysis_pipeline()
+    test_jobs_are_disabled_without_a_db_path()
+    print("\n=== Test completed ===")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+SMFのストリーミング読み込みとMIDIからのキー推定・借用和音分析のテスト
+"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+from contextlib import redirect_stdout
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import midi_import
+from midi_import import MidiFormatError, analyze_midi, infer_segment_chords, read_midi_segments
+from main import ChordAnalysisRequest, NOTES
+
+TICKS_PER_BEAT = 480
+CHORD_TONES = {"": (0, 4, 7), "m": (0, 3, 7), "7": (0, 4, 7, 10)}
+
+def varlen(value):
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(data)
+
+def track(events):
+    """(差分tick, イベントのバイト列) の列からトラックチャンクを作る"""
+    body = b"".join(varlen(delta) + data for delta, data in events) + b"\x00\xff\x2f\x00"
+    return b"MTrk" + len(body).to_bytes(4, "big") + body
+
+def smf(*tracks):
+    header = b"MThd" + (6).to_bytes(4, "big") + (1).to_bytes(2, "big") + len(tracks).to_bytes(2, "big") + TICKS_PER_BEAT.to_bytes(2, "big")
+    return header + b"".join(tracks)
+
+def chord_track(chord_names, beats=4, channel=0):
+    """1コード beats 拍の全音符トラック（ランニングステータスとベロシティ0のノートオフを使う）"""
+    events = [(0, b"\xff\x51\x03\x07\xa1\x20"), (0, b"\xf0\x03\x7e\x09\xf7")]  # テンポ・SysEx
+    for name in chord_names:
+        root = NOTES.index(name.rstrip("m7"))
+        notes = [48 + root + interval for interval in CHORD_TONES[name[len(name.rstrip("m7")):]]]
+        events.append((0, bytes([0x90 | channel, notes[0], 100])))
+        events.extend((0, bytes([note, 100])) for note in notes[1:])
+        events.append((beats * TICKS_PER_BEAT, bytes([notes[0], 0])))
+        events.extend((0, bytes([note, 0])) for note in notes[1:])
+    return track(events)
+
+def test_segments_are_duration_weighted():
+    data = smf(chord_track(["C", "F", "G7", "C"]))
+    segments = read_midi_segments(io.BytesIO(data), window_beats=4)
+    assert segments.vectors.shape == (4, 12)
+    assert segments.vectors[0].tolist() == [4.0, 0, 0, 0, 4.0, 0, 0, 4.0, 0, 0, 0, 0]
+    # 2拍の窓では1コードが2つの窓に分かれる
+    half = read_midi_segments(io.BytesIO(data), window_beats=2)
+    assert half.vectors.shape == (8, 12) and half.vectors.sum() == segments.vectors.sum()
+    print("✅ 音価で重み付けした時間窓")
+
+def test_chord_inference_and_analysis():
+    data = smf(chord_track(["C", "Am", "Fm", "G7", "C"]), track([(0, b"\xc0\x05"), (0, b"\x99\x24\x64"), (960, b"\x89\x24\x00")]))
+    analysis = analyze_midi(io.BytesIO(data))
+    assert analysis.chords == ["C", "Am", "Fm", "G7", "C"]
+    assert analysis.result.main_key == "C Major"
+    assert [b.chord for b in analysis.result.borrowed_chords] == ["Fm"]
+    assert analysis.result.borrowed_chords[0].source_candidates[0].key == "C Minor"
+    assert abs(sum(analysis.result.pitch_class_vector) - 1.0) < 1e-9
+    print(f"✅ MIDIからの分析: {analysis.chords} -> {analysis.result.main_key}")
+
+def test_pitch_only_analysis():
+    data = smf(chord_track(["Am", "Dm", "E7", "Am"]))
+    analysis = analyze_midi(io.BytesIO(data), infer_chords=False)
+    assert analysis.chords == [] and analysis.result.borrowed_chords is None
+    assert [c.algorithm for c in analysis.result.key_candidates] == ["traditional", "triad_ratio"]
+    assert analysis.result.main_key in {c.key for c in analysis.result.key_candidates}
+    only = analyze_midi(io.BytesIO(data), infer_chords=False,
+                        request=ChordAnalysisRequest(chord_input="", algorithm="triad_ratio"))
+    assert only.result.main_key == only.result.key_candidates[1].key
+    assert only.result.algorithm_used == "triad_ratio"
+    # コード列が必要なアルゴリズムは実行できないので、実際に使ったhybridを報告する
+    fallback = analyze_midi(io.BytesIO(data), infer_chords=False,
+                            request=ChordAnalysisRequest(chord_input="", algorithm="borrowed_chord_minimal"))
+    assert fallback.result.algorithm_used == "hybrid" and fallback.result.main_key == analysis.result.main_key
+    assert analysis.result.algorithm_used == "hybrid"
+    manual = analyze_midi(io.BytesIO(data), infer_chords=False,
+                          request=ChordAnalysisRequest(chord_input="", algorithm="manual", manual_key="C Major"))
+    assert manual.result.main_key == "C Major" and manual.result.algorithm_used == "manual"
+    assert manual.result.key_candidates[-1].algorithm == "manual"
+
+def test_inferred_chord_templates():
+    vectors = np.zeros((3, 12))
+    vectors[0, [7, 11, 2, 5]] = 1.0  # G7
+    vectors[1, [9, 0, 4]] = [2.0, 1.0, 1.0]  # Am
+    vectors[2, 0] = 0.1  # ほぼ無音
+    assert infer_segment_chords(vectors) == ["G7", "Am", None]
+
+def test_streams_in_blocks():
+    """トラックはブロック単位で読み、一度に大きく読み込まないこと"""
+    data = smf(chord_track(["C", "F", "G", "C"] * 500))
+
+    class CountingReader(io.BytesIO):
+        largest = 0
+
+        def read(self, size=-1):
+            chunk = super().read(size)
+            CountingReader.largest = max(CountingReader.largest, len(chunk))
+            return chunk
+
+    original = midi_import.READ_BLOCK_SIZE
+    midi_import.READ_BLOCK_SIZE = 1024
+    try:
+        segments = read_midi_segments(CountingReader(data))
+    finally:
+        midi_import.READ_BLOCK_SIZE = original
+    assert len(data) > 20000 and CountingReader.largest <= 1024
+    assert segments.vectors.shape == (2000, 12)
+
+def test_invalid_files():
+    for data in (b"RIFF....", smf(chord_track(["C"]))[:-10]):
+        try:
+            read_midi_segments(io.BytesIO(data))
+            assert False, "invalid file accepted"
+        except MidiFormatError:
+            pass
+
+def test_cli_processes_folders_in_parallel():
+    with tempfile.TemporaryDirectory() as directory:
+        for name, chords in (("a.mid", ["C", "F", "G", "C"]), ("b.mid", ["D", "G", "A", "D"])):
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(smf(chord_track(chords)))
+        with open(os.path.join(directory, "broken.mid"), "wb") as f:
+            f.write(b"not midi")
+        output = io.BytesIO()
+
+        class Stdout:
+            buffer = output
+
+        with redirect_stdout(Stdout()):
+            midi_import.main([directory, "--workers", "2"])
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [os.path.basename(line["id"]) for line in lines] == ["a.mid", "b.mid", "broken.mid"]
+    assert lines[0]["result"]["main_key"] == "C Major" and lines[1]["result"]["main_key"] == "D Major"
+    assert "error" in lines[2]
+    print("✅ フォルダの並列処理")
+
+if __name__ == "__main__":
+    test_segments_are_duration_weighted()
+    test_chord_inference_and_analysis()
+    test_pitch_only_analysis()
+    test_inferred_chord_templates()
+    test_streams_in_blocks()
+    test_invalid_files()
+    test_cli_processes_folders_in_parallel()
+    print("\n=== Test completed ===")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+整数（MIDIノート番号）ベースのボイシングエンジンのテスト
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import (
+    ChordAnalysisRequest, run_analysis, voice_chord,
+    get_chord_components_with_voicing, get_chord_midi_voicing
+)
+from reference_engine import reference_midi_notes
+
+def test_expected_voicings():
+    """代表的なコードのボイシング（音名とMIDI番号）"""
+    print("=== Voicing test ===")
+    test_cases = [
+        ("CM7", ["C3", "E3", "G3", "B3"], [48, 52, 55, 59]),
+        ("Am7", ["A2", "C3", "E3", "G3"], [45, 48, 52, 55]),
+        ("FM7(13)", ["F3", "A3", "C4", "E4", "D5"], [53, 57, 60, 64, 74]),
+        ("C", ["C3", "E3", "G3"], [48, 52, 55]),
+    ]
+    for chord, expected_names, expected_midi in test_cases:
+        names = get_chord_components_with_voicing(chord)
+        midi = get_chord_midi_voicing(chord)
+        print(f"{chord}: {names} {midi}")
+        assert names == expected_names
+        assert midi == expected_midi
+
+def test_spelled_notes():
+    """E#・B#・Cb・ダブルシャープは綴りどおりの音名・オクターブのMIDI番号になること"""
+    test_cases = [
+        ("C#", ["C#3", "E#3", "G#3"], [49, 53, 56]),
+        ("G#7", ["G#3", "B#3", "D#4", "F#4"], [56, 60, 63, 66]),
+        ("Abm", ["Ab2", "Cb3", "Eb3"], [44, 47, 51]),
+        ("D#7", ["D#3", "F##3", "A#3", "C#4"], [51, 55, 58, 61]),
+        ("E#m", ["E#3", "G#3", "B#3"], [53, 56, 60]),
+    ]
+    for chord, expected_names, expected_midi in test_cases:
+        assert get_chord_components_with_voicing(chord) == expected_names, chord
+        assert get_chord_midi_voicing(chord) == expected_midi, chord
+    assert reference_midi_notes(["E#4", "B#3", "Cb3", "F##4", "Fb4"]) == [65, 60, 47, 67, 64]
+
+def test_midi_matches_note_names():
+    """MIDI番号が音名・オクターブと一致すること（参照実装の変換で確認）"""
+    chords = ["Bb7", "F#m7b5", "Ebmaj7", "G7(b9, #11)", "Dsus4", "Am9", "C#", "G#7", "Abm", "D#7", "E#m", "Cb", "B#7", "Cbdim7"]
+    for chord in chords:
+        for base_octave in (2, 3, 4):
+            voiced = voice_chord(chord, base_octave)
+            assert [midi for _, _, midi in voiced] == reference_midi_notes([f"{note}{octave}" for note, octave, _ in voiced])
+
+def test_voicing_is_memoized():
+    """同じ(コード, base_octave)は一度だけ計算されること"""
+    voice_chord.cache_clear()
+    for _ in range(10):
+        get_chord_components_with_voicing("Dm7(9)")
+        get_chord_midi_voicing("Dm7(9)")
+    info = voice_chord.cache_info()
+    assert info.misses == 1
+    assert info.hits == 19
+
+def test_include_midi_in_response():
+    record = run_analysis(ChordAnalysisRequest(chord_input="[CM7][Am7]", include_midi=True))
+    assert record.progression_details[0].midi_notes == [48, 52, 55, 59]
+    record = run_analysis(ChordAnalysisRequest(chord_input="[CM7][Am7]"))
+    assert not hasattr(record.progression_details[0], "midi_notes")
+
+if __name__ == "__main__":
+    test_expected_voicings()
+    test_spelled_notes()
+    test_midi_matches_note_names()
+    test_voicing_is_memoized()
+    test_include_midi_in_response()
+    print("\n=== Test completed ===")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+MessagePackのコンテンツネゴシエーションのテスト
+"""
+
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import msgpack
+from main import app, prefers_msgpack
+
+def call_app(method: str, path: str, body: bytes = b"", headers: dict = None):
+    """ASGIアプリを直接呼び出して (status, headers, body) を返す"""
+    messages = []
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    asyncio.run(app(scope, receive, send))
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    response_body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, response_body
+
+def test_accept_header_parsing():
+    print("=== Accept header test ===")
+    test_cases = [
+        ("application/msgpack", True),
+        ("application/x-msgpack", True),
+        ("application/json", False),
+        ("*/*", False),
+        (None, False),
+        ("application/json, application/msgpack", False),  # 同順位ならJSON
+        ("application/json;q=0.5, application/msgpack", True),
+        ("text/html,application/xhtml+xml,*/*;q=0.8", False),
+    ]
+    for accept, expected in test_cases:
+        result = prefers_msgpack(accept)
+        print(f"{'✓' if result == expected else '✗'} {accept} -> {result}")
+        assert result == expected
+
+def test_msgpack_round_trip():
+    """MessagePackリクエスト/レスポンスがJSONと同じ内容になること"""
+    request = {"chord_input": "[CM7][Am7][Fm][G7]"}
+    status, headers, json_body = call_app(
+        "POST", "/analyze", json.dumps(request).encode(), {"content-type": "application/json"}
+    )
+    assert status == 200 and headers["content-type"] == "application/json"
+
+    status, headers, msgpack_body = call_app(
+        "POST", "/analyze", msgpack.packb(request),
+        {"content-type": "application/msgpack", "accept": "application/msgpack"}
+    )
+    assert status == 200 and headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(msgpack_body) == json.loads(json_body)
+
+def test_invalid_msgpack_body():
+    status, _, _ = call_app("POST", "/analyze", b"\xc1", {"content-type": "application/msgpack"})
+    assert status == 400
+
+if __name__ == "__main__":
+    test_accept_header_parsing()
+    test_msgpack_round_trip()
+    test_invalid_msgpack_body()
+    print("\n=== Test completed ===")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+プリフォーク構成（gunicorn.conf.py）と事前構築される理論テーブルのテスト
+"""
+
+import sys
+import os
+import runpy
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import (
+    DIATONIC_NOTES_BY_KEY, KEY_PROFILES, KRUMHANSL_MAJOR, KRUMHANSL_MINOR,
+    get_all_keys_for_borrowing, get_diatonic_notes, _compute_diatonic_notes,
+    rotate_profile, voice_chord
+)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+def load_config(env: dict) -> dict:
+    saved = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        return runpy.run_path(CONFIG_PATH)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def test_config_respects_port_and_worker_count():
+    config = load_config({"PORT": "9123", "WEB_CONCURRENCY": "3"})
+    print(f"bind={config['bind']} workers={config['workers']}")
+    assert config["bind"] == "0.0.0.0:9123"
+    assert config["workers"] == 3
+    assert config["preload_app"] is True
+
+def test_default_worker_count_uses_cpus():
+    config = load_config({"PORT": "8000"})
+    if "WEB_CONCURRENCY" not in os.environ:
+        assert config["workers"] == config["default_worker_count"]() >= 1
+
+def test_theory_tables_are_prebuilt():
+    """テーブルが親プロセス（import時）で構築済みで、計算結果と一致すること"""
+    for key in get_all_keys_for_borrowing():
+        assert list(DIATONIC_NOTES_BY_KEY[key]) == _compute_diatonic_notes(key)
+        assert get_diatonic_notes(key) == _compute_diatonic_notes(key)
+    for root in range(12):
+        assert KEY_PROFILES[(root, "Major")] == rotate_profile(KRUMHANSL_MAJOR, root)
+        assert KEY_PROFILES[(root, "Minor")] == rotate_profile(KRUMHANSL_MINOR, root)
+    # コード語彙はボイシングキャッシュに載っている
+    assert voice_chord.cache_info().currsize > 0
+
+if __name__ == "__main__":
+    test_config_respects_port_and_worker_count()
+    test_default_worker_count_uses_cpus()
+    test_theory_tables_are_prebuilt()
+    print("\n=== Test completed ===")
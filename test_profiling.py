@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+リクエスト単位のプロファイリングと常時サンプリングのテスト
+"""
+
+import sys
+import os
+import asyncio
+import pstats
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.requests import Request
+import main
+from profiling import RequestProfiler, StackSampler, read_collapsed
+from main import ChordAnalysisRequest, analyze_chord_progression, canonical_request_hash, extract_chords
+
+def make_request(headers=(), query=b""):
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/analyze",
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+        "query_string": query,
+    })
+
+def test_profiled_request_writes_profile():
+    request = ChordAnalysisRequest(chord_input="[Dm7][G7][CM7][Fm]")
+    request_hash = canonical_request_hash(request, extract_chords(request.chord_input))
+    enabled, profiler = main.PROFILING_ENABLED, main.request_profiler
+    with tempfile.TemporaryDirectory() as directory:
+        main.PROFILING_ENABLED = True
+        main.request_profiler = RequestProfiler(directory)
+        try:
+            response = asyncio.run(analyze_chord_progression(request, make_request(query=b"profile=1")))
+            assert response.headers["X-Profile-Id"] == request_hash
+            path = main.request_profiler.path_for(request_hash)
+            functions = {name for _, _, name in pstats.Stats(path).stats}
+            assert "run_analysis" in functions and "find_best_key" in functions
+            assert "run_analysis" in main.request_profiler.summary(request_hash)
+            # ヘッダ指定でも同じ
+            os.remove(path)
+            asyncio.run(analyze_chord_progression(request, make_request(headers=[("x-profile", "1")])))
+            assert os.path.exists(path)
+            # フラグが無いリクエストは計測しない
+            os.remove(path)
+            plain = asyncio.run(analyze_chord_progression(request, make_request()))
+            assert "X-Profile-Id" not in plain.headers and not os.path.exists(path)
+            assert plain.body == response.body
+        finally:
+            main.PROFILING_ENABLED, main.request_profiler = enabled, profiler
+    print("✅ プロファイルを正規化ハッシュ名で保存")
+
+def test_disabled_by_default():
+    request = ChordAnalysisRequest(chord_input="[C][G]")
+    enabled = main.PROFILING_ENABLED
+    main.PROFILING_ENABLED = False
+    try:
+        response = asyncio.run(analyze_chord_progression(request, make_request(query=b"profile=1")))
+    finally:
+        main.PROFILING_ENABLED = enabled
+    assert "X-Profile-Id" not in response.headers
+
+def test_invalid_hash_is_rejected():
+    try:
+        RequestProfiler("profiles").path_for("../main")
+        assert False, "path traversal accepted"
+    except ValueError:
+        pass
+
+def busy_analysis(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+def test_sampler_aggregates_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_analysis, args=(stop,))
+    worker.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stacks.txt")
+            sampler = StackSampler(path)
+            for _ in range(5):
+                sampler.sample_once()
+            sampler.flush()
+            for _ in range(5):
+                sampler.sample_once()
+            sampler.flush()
+            counts = read_collapsed(path)
+    finally:
+        stop.set()
+        worker.join()
+    busy = sum(count for stack, count in counts.items() if "test_profiling.py:busy_analysis" in stack)
+    assert busy == 10, counts  # 2回の書き出しが加算される
+    # 待機中のスレッド（スレッドの join 待ちなど）は数えない
+    assert not any(stack.endswith("threading.py:wait") for stack in counts)
+    print(f"✅ サンプリング: {len(counts)}種類のスタック")
+
+def test_sampler_thread_flushes_on_stop():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stacks.txt")
+        sampler = StackSampler(path, interval=0.005)
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_analysis, args=(stop,))
+        worker.start()
+        sampler.start()
+        try:
+            while sampler.samples < 5:
+                stop.wait(0.01)
+        finally:
+            sampler.stop()
+            stop.set()
+            worker.join()
+        assert sum(read_collapsed(path).values()) >= 5
+
+if __name__ == "__main__":
+    test_profiled_request_writes_profile()
+    test_disabled_by_default()
+    test_invalid_hash_is_rejected()
+    test_sampler_aggregates_stacks()
+    test_sampler_thread_flushes_on_stop()
+    print("\n=== Test completed ===")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+クライアント単位のトークンバケット・レート制限のテスト
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limit import TokenBucketLimiter, RateLimitMiddleware, client_key
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=1, burst=3, clock=clock)
+    decisions = [limiter.hit("client") for _ in range(4)]
+    print([(d.allowed, d.remaining) for d in decisions])
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after == 1
+
+    clock.now += 1.0  # 1トークン補充
+    assert limiter.hit("client").allowed
+    assert not limiter.hit("client").allowed
+    # 他のクライアントは独立
+    assert limiter.hit("other").allowed
+
+def test_idle_buckets_expire():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=2, burst=4, sweep_interval=10, clock=clock)
+    for i in range(100):
+        limiter.hit(f"client-{i}")
+    assert len(limiter) == 100
+    clock.now += 10  # 全バケットが満タンに戻り、掃除の時刻も過ぎた
+    limiter.hit("active")
+    assert len(limiter) == 1
+
+def test_client_key():
+    scope = {"headers": [(b"x-forwarded-for", b"1.1.1.1, 10.0.0.2")], "client": ("10.0.0.1", 1234)}
+    assert client_key(scope) == "ip:10.0.0.1"  # 既定ではX-Forwarded-Forを信頼しない
+    assert client_key(scope, trust_forwarded_for=True) == "ip:10.0.0.2"
+    assert client_key(scope, trust_forwarded_for=True, trusted_proxies={"10.0.0.1"}) == "ip:10.0.0.2"
+    assert client_key(scope, trust_forwarded_for=True, trusted_proxies={"10.0.0.9"}) == "ip:10.0.0.1"
+    scope["headers"].append((b"x-api-key", b"abc"))
+    assert client_key(scope, api_keys={"abc"}) == "key:abc"
+    # 未登録のキーはIP単位（キーを変えても同じバケット）
+    assert client_key(scope) == "ip:10.0.0.1"
+    assert client_key(scope, api_keys={"other"}) == "ip:10.0.0.1"
+
+def test_random_api_keys_share_the_ip_budget():
+    clock = FakeClock()
+    middleware = RateLimitMiddleware(
+        None,
+        cheap=TokenBucketLimiter(rate=1, burst=3, clock=clock),
+        expensive=TokenBucketLimiter(rate=1, burst=3, clock=clock),
+        api_keys=["registered"],
+    )
+    statuses = [call_middleware(middleware, "GET", "/keys", [(b"x-api-key", f"random-{i}".encode())])[0] for i in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+    assert len(middleware.cheap) == 1
+    assert call_middleware(middleware, "GET", "/keys", [(b"x-api-key", b"registered")])[0] == 200
+
+def call_middleware(middleware, method, path, headers=()):
+    messages = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    middleware.app = app
+    scope = {"type": "http", "method": method, "path": path, "headers": list(headers), "client": ("127.0.0.1", 1)}
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+def test_middleware_budgets_and_headers():
+    clock = FakeClock()
+    middleware = RateLimitMiddleware(
+        None,
+        cheap=TokenBucketLimiter(rate=1, burst=5, clock=clock),
+        expensive=TokenBucketLimiter(rate=1, burst=1, clock=clock),
+        expensive_paths=("/analyze",),
+        exempt_paths=("/healthz",),
+    )
+    status, headers = call_middleware(middleware, "POST", "/analyze")
+    assert status == 200 and headers[b"ratelimit-remaining"] == b"0"
+    status, headers = call_middleware(middleware, "POST", "/analyze")
+    print(f"second /analyze: {status} retry-after={headers.get(b'retry-after')}")
+    assert status == 429 and headers[b"retry-after"] == b"1"
+    # 安価なエンドポイントは別予算
+    status, headers = call_middleware(middleware, "GET", "/keys")
+    assert status == 200 and headers[b"ratelimit-limit"] == b"5"
+    # ヘルスチェックは対象外
+    for _ in range(10):
+        status, headers = call_middleware(middleware, "GET", "/healthz")
+        assert status == 200 and b"ratelimit-limit" not in headers
+
+if __name__ == "__main__":
+    test_burst_then_refill()
+    test_idle_buckets_expire()
+    test_client_key()
+    test_random_api_keys_share_the_ip_budget()
+    test_middleware_budgets_and_headers()
+    print("\n=== Test completed ===")
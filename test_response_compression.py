@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+レスポンス圧縮（閾値付きgzip/brotli）とgzipリクエストボディのテスト
+"""
+
+import sys
+import os
+import gzip
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import app, choose_content_encoding
+
+def call_app(method: str, path: str, body: bytes = b"", headers: dict = None):
+    """ASGIアプリを直接呼び出して (status, headers, body) を返す"""
+    messages = []
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    asyncio.run(app(scope, receive, send))
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    response_body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, response_body
+
+LARGE_INPUT = json.dumps({"chord_input": "[CM7][Am7][Fm7][G7(b9)][Dm7(9)][Db7]" * 40}).encode()
+SMALL_INPUT = json.dumps({"chord_input": "[C][G]"}).encode()
+
+def test_encoding_selection():
+    print("=== Accept-Encoding test ===")
+    test_cases = [
+        ("gzip, deflate, br", "br" if main.brotli is not None else "gzip"),
+        ("gzip", "gzip"),
+        ("br;q=0, gzip", "gzip"),
+        ("identity", None),
+        (None, None),
+    ]
+    for accept_encoding, expected in test_cases:
+        result = choose_content_encoding(accept_encoding)
+        print(f"{'✓' if result == expected else '✗'} {accept_encoding} -> {result}")
+        assert result == expected
+
+def test_large_response_is_compressed():
+    _, _, plain = call_app("POST", "/analyze", LARGE_INPUT, {"content-type": "application/json"})
+    status, headers, body = call_app(
+        "POST", "/analyze", LARGE_INPUT, {"content-type": "application/json", "accept-encoding": "gzip"}
+    )
+    print(f"gzip: {len(plain)} -> {len(body)} bytes")
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(body)
+    assert gzip.decompress(body) == plain
+
+def test_small_response_is_not_compressed():
+    status, headers, body = call_app(
+        "POST", "/analyze", SMALL_INPUT, {"content-type": "application/json", "accept-encoding": "gzip"}
+    )
+    assert status == 200
+    assert "content-encoding" not in headers
+    assert json.loads(body)["main_key"]
+
+def test_gzip_request_body():
+    headers = {"content-type": "application/json", "content-encoding": "gzip"}
+    status, _, body = call_app("POST", "/analyze", gzip.compress(SMALL_INPUT), headers)
+    assert status == 200
+    _, _, plain = call_app("POST", "/analyze", SMALL_INPUT, {"content-type": "application/json"})
+    assert body == plain
+
+def test_oversized_gzip_request_body():
+    saved = main.MAX_DECOMPRESSED_BODY_SIZE
+    main.MAX_DECOMPRESSED_BODY_SIZE = 1024
+    try:
+        headers = {"content-type": "application/json", "content-encoding": "gzip"}
+        status, _, _ = call_app("POST", "/analyze", gzip.compress(LARGE_INPUT), headers)
+        assert status == 413
+    finally:
+        main.MAX_DECOMPRESSED_BODY_SIZE = saved
+
+if __name__ == "__main__":
+    test_encoding_selection()
+    test_large_response_is_compressed()
+    test_small_response_is_not_compressed()
+    test_gzip_request_body()
+    test_oversized_gzip_request_body()
+    print("\n=== Test completed ===")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+永続結果ストア（SQLite WAL）のテスト
+"""
+
+import sys
+import os
+import json
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from result_store import ResultStore
+from main import ChordAnalysisRequest, analyze_chord_progression, canonical_request_hash, extract_chords
+
+def make_store(path, **kwargs):
+    return ResultStore(path, kwargs.pop("engine_version", "1"), encode=lambda v: json.dumps(v).encode(),
+                       decode=json.loads, **kwargs)
+
+def test_survives_restart():
+    """別インスタンス（再起動・別ワーカー）からもディスク上の結果が読めること"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.db")
+        make_store(path).put("a", {"main_key": "C Major"})
+        restarted = make_store(path)
+        assert restarted.peek("a") is None
+        assert restarted.get("a") == {"main_key": "C Major"}
+        assert restarted.peek("a") == {"main_key": "C Major"}
+        print(f"✅ 再起動後も取得: {restarted.stats()}")
+
+def test_engine_version_separates_results():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.db")
+        make_store(path, engine_version="1").put("a", {"v": 1})
+        assert make_store(path, engine_version="2").get("a") is None
+        assert make_store(path, engine_version="1").get("a") == {"v": 1}
+
+def test_size_based_eviction():
+    """上限超過時は古い結果・旧バージョンから削除されること"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.db")
+        make_store(path, engine_version="0").put("old-version", "x" * 100)
+        store = make_store(path, max_bytes=1000, memory_items=0)
+        for i in range(20):
+            store.put(f"k{i}", "x" * 100)
+            assert store.stats()["total_bytes"] <= 1000
+        assert make_store(path, engine_version="0").get("old-version") is None
+        assert store.get("k19") is not None
+        assert store.get("k0") is None
+        # 同じキーの上書きで合計サイズが二重計上されないこと
+        before = store.stats()["total_bytes"]
+        store.put("k19", "x" * 100)
+        assert store.stats()["total_bytes"] == before
+
+def test_memory_lru_bound():
+    with tempfile.TemporaryDirectory() as directory:
+        store = make_store(os.path.join(directory, "results.db"), memory_items=2)
+        for key in ("a", "b", "c"):
+            store.put(key, key)
+        assert store.peek("a") is None
+        assert store.peek("c") == "c"
+
+def test_analyze_reuses_stored_result():
+    """/analyzeは保存済みの結果を再計算せずに同じバイト列で返すこと"""
+    calls = []
+    original = main.run_analysis
+    store = main.result_store
+
+    def counting_run_analysis(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    request = ChordAnalysisRequest(chord_input="[Em7][A7][Dm7][G7][CM7]")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.db")
+        main.run_analysis = counting_run_analysis
+        try:
+            main.result_store = ResultStore(path, main.ENGINE_VERSION, main.encode_json, main.json_loads)
+            first = asyncio.run(analyze_chord_progression(request))
+            # 再起動を模してプロセス内LRUを持たない新しいストアに差し替える
+            main.result_store = ResultStore(path, main.ENGINE_VERSION, main.encode_json, main.json_loads)
+            second = asyncio.run(analyze_chord_progression(request))
+            request_hash = canonical_request_hash(request, extract_chords(request.chord_input))
+            assert main.result_store.peek(request_hash) is not None
+        finally:
+            main.run_analysis = original
+            main.result_store = store
+    assert len(calls) == 1
+    assert first.body == second.body
+    print("✅ 保存済み結果を再利用")
+
+if __name__ == "__main__":
+    test_survives_restart()
+    test_engine_version_separates_results()
+    test_size_based_eviction()
+    test_memory_lru_bound()
+    test_analyze_reuses_stored_result()
+    print("\n=== Test completed ===")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+ピッチクラスベクトルの類似進行検索のテスト
+"""
+
+import sys
+import os
+import tempfile
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import similarity_index
+from similarity_index import SimilarityIndex
+from main import create_pitch_class_vector, extract_chords
+
+def progression_vector(chord_input):
+    return create_pitch_class_vector(extract_chords(chord_input))
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).random((count, 12)).astype(np.float32) ** 4
+
+def test_exact_search_matches_brute_force():
+    """ブロック分割しても全件のコサイン類似度の上位kと一致すること"""
+    vectors = random_vectors(5000)
+    index = SimilarityIndex()
+    index.add_vectors(vectors[:3000])
+    index.add_vectors(vectors[3000:])
+    original_block = similarity_index.BLOCK_ROWS
+    similarity_index.BLOCK_ROWS = 700
+    try:
+        for query in vectors[:5]:
+            expected = np.argsort(-cosine_similarity([query], vectors)[0], kind="stable")[:10]
+            found = index.search(query, k=10)
+            assert [int(doc_id) for doc_id, _, _ in found] == expected.tolist()
+    finally:
+        similarity_index.BLOCK_ROWS = original_block
+
+def test_transposition_invariant_search():
+    """移調した進行が移調量付きで最上位に見つかること"""
+    index = SimilarityIndex()
+    index.add(progression_vector("[D][Bm][G][A]"), "D major pop")
+    index.add(progression_vector("[Am][Dm][E7][Am]"), "A minor cadence")
+    index.add(progression_vector("[C][C7][F][Fm]"), "C with minor iv")
+    query = progression_vector("[C][Am][F][G]")
+    assert index.search(query, k=1)[0][0] != "D major pop"
+    doc_id, score, shift = index.search(query, k=1, transpose=True)[0]
+    assert doc_id == "D major pop"
+    assert abs(score - 1.0) < 1e-5
+    assert shift == 2
+    print(f"✅ 移調不変検索: {doc_id} (+{shift}半音, score={score:.4f})")
+
+def test_ties_are_ordered_by_insertion():
+    index = SimilarityIndex()
+    vector = progression_vector("[C][F][G]")
+    for i in range(5):
+        index.add(vector, f"same-{i}")
+    assert [doc_id for doc_id, _, _ in index.search(vector, k=3)] == ["same-0", "same-1", "same-2"]
+
+def test_approximate_search_recall():
+    vectors = random_vectors(20000, seed=1)
+    index = SimilarityIndex()
+    index.add_vectors(vectors)
+    index.train(lists=64)
+    for transpose in (False, True):
+        recalls = []
+        for query in vectors[:20]:
+            exact = {doc_id for doc_id, _, _ in index.search(query, k=10, transpose=transpose, approximate=False)}
+            approximate = {doc_id for doc_id, _, _ in index.search(query, k=10, transpose=transpose)}
+            recalls.append(len(exact & approximate) / 10)
+        assert np.mean(recalls) >= 0.9, (transpose, np.mean(recalls))
+        print(f"✅ 近似検索 transpose={transpose}: recall@10={np.mean(recalls):.3f}")
+
+def test_vectors_added_after_training_are_searchable():
+    vectors = random_vectors(2000, seed=2)
+    index = SimilarityIndex()
+    index.add_vectors(vectors)
+    index.train(lists=16)
+    index.add(vectors[7] * 3, "late")
+    found = [doc_id for doc_id, _, _ in index.search(vectors[7], k=2, nprobe=16)]
+    assert found == ["7", "late"]
+
+def test_save_and_load():
+    vectors = random_vectors(500, seed=3)
+    index = SimilarityIndex()
+    index.add_vectors(vectors, [f"song-{i}" for i in range(500)])
+    index.train(lists=8)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "similarity.npz")
+        index.save(path)
+        loaded = SimilarityIndex.load(path)
+    assert loaded.matrix.dtype == np.float32 and loaded.matrix.flags["C_CONTIGUOUS"]
+    assert loaded.search(vectors[0], k=5) == index.search(vectors[0], k=5)
+
+if __name__ == "__main__":
+    test_exact_search_matches_brute_force()
+    test_transposition_invariant_search()
+    test_ties_are_ordered_by_insertion()
+    test_approximate_search_recall()
+    test_vectors_added_after_training_are_searchable()
+    test_save_and_load()
+    print("\n=== Test completed ===")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+同一分析の同時リクエストをまとめるシングルフライトのテスト
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from single_flight import SingleFlight
+from main import ChordAnalysisRequest, analyze_chord_progression, canonical_request_key, extract_chords
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def scenario():
+        flights = SingleFlight()
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*[flights.do("key", compute) for _ in range(50)])
+        assert len(flights) == 0
+        # 完了後は再計算される
+        await flights.do("key", compute)
+        return results
+
+    results = asyncio.run(scenario())
+    print(f"{len(results)} callers, {len(calls)} computations")
+    assert results == ["result"] * 50
+    assert len(calls) == 2
+
+def test_leader_cancellation_does_not_cancel_followers():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.02)
+            return 42
+
+        leader = asyncio.create_task(flights.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == 42
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*[flights.do("key", compute) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(scenario()))
+
+def test_identical_analyses_run_once():
+    """同じ正規化キーの/analyzeは1回だけ分析されること"""
+    calls = []
+    original = main.run_analysis
+
+    def counting_run_analysis(*args, **kwargs):
+        calls.append(1)
+        return original(*args, **kwargs)
+
+    async def scenario():
+        requests = [ChordAnalysisRequest(chord_input=f"[Dm7] [G7]{' ' * i}[CM7]") for i in range(10)]
+        return await asyncio.gather(*[analyze_chord_progression(r) for r in requests])
+
+    # 永続ストアに過去の結果があると分析自体が行われないため無効にする
+    store = main.result_store
+    main.run_analysis = counting_run_analysis
+    main.result_store = None
+    try:
+        responses = asyncio.run(scenario())
+    finally:
+        main.run_analysis = original
+        main.result_store = store
+    assert len(calls) == 1
+    assert len({response.body for response in responses}) == 1
+
+def test_canonical_key():
+    request = ChordAnalysisRequest(chord_input="[C] [G]")
+    chords = extract_chords(request.chord_input)
+    assert canonical_request_key(request, chords) == canonical_request_key(ChordAnalysisRequest(chord_input="[C][G][|]"), chords)
+    assert canonical_request_key(request, chords) != canonical_request_key(ChordAnalysisRequest(chord_input="[C][G]", algorithm="traditional"), chords)
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_one_computation()
+    test_leader_cancellation_does_not_cancel_followers()
+    test_errors_reach_every_caller()
+    test_identical_analyses_run_once()
+    test_canonical_key()
+    print("\n=== Test completed ===")
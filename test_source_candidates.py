@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+借用元候補の上位k選択（全候補をソートしてから先頭5件を取る実装との一致）のテスト
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import (
+    MAX_SOURCE_CANDIDATES, get_all_keys, get_all_keys_for_borrowing, get_chord_components, get_diatonic_notes,
+    normalize_note, analyze_relationship, calculate_key_confidence, detect_non_diatonic_notes,
+    find_borrowed_sources, is_valid_chord, score_source_candidates,
+)
+
+def reference_candidates(chord_symbol, main_key, context_notes):
+    """上位k選択導入前の実装（全候補を作ってソート）"""
+    chord_notes = get_chord_components(chord_symbol)
+    candidates = []
+    for key in get_all_keys_for_borrowing():
+        if key == main_key:
+            continue
+        normalized_key_notes = [normalize_note(note) for note in get_diatonic_notes(key)]
+        if all(normalize_note(note) in normalized_key_notes for note in chord_notes):
+            confidence = calculate_key_confidence(chord_notes, key, context_notes, main_key=main_key)
+            candidates.append((key, analyze_relationship(main_key, key), float(confidence)))
+    candidates.sort(key=lambda x: x[2], reverse=True)
+    return candidates[:MAX_SOURCE_CANDIDATES]
+
+def occurrence_context(chords, index):
+    """その出現の直前・直後のコードの構成音"""
+    neighbours = chords[max(index - 1, 0):index] + chords[index + 1:index + 2]
+    notes = {note for chord in neighbours for note in get_chord_components(chord)}
+    return list(notes) or None
+
+def as_tuples(record):
+    return [(c.key, c.relationship, c.confidence) for c in record.source_candidates]
+
+def test_matches_full_sort():
+    roots = ['C', 'C#', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B', 'Cb', 'E#']
+    qualities = ['', 'm', '7', 'M7', 'm7', 'dim', 'aug', 'sus4', '7(b9)', 'm7b5', '9', 'add9', 'dim7']
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(300):
+        chords = [c for c in (rng.choice(roots) + rng.choice(qualities) for _ in range(rng.randint(1, 8))) if is_valid_chord(c)]
+        main_key = rng.choice(get_all_keys() + ["C Harmonic Minor"])
+        for record in find_borrowed_sources(detect_non_diatonic_notes(chords, main_key), main_key):
+            assert as_tuples(record) == reference_candidates(record.chord, main_key, None), (record.chord, main_key)
+            checked += 1
+    print(f"✅ {checked}件の借用和音で一致")
+
+def test_ties_keep_key_order():
+    """同じ信頼度の候補はキー一覧の順で残ること"""
+    record = find_borrowed_sources([{'chord': 'Bb', 'non_diatonic_notes': ['A#']}], "C Major")[0]
+    assert as_tuples(record) == reference_candidates('Bb', "C Major", None)
+    assert len(record.source_candidates) == MAX_SOURCE_CANDIDATES
+
+def test_each_occurrence_uses_its_own_context():
+    """繰り返し現れる借用和音は出現ごとに前後のコードで採点されること"""
+    chords = ["C", "Fm", "C", "G7", "Fm", "Bb", "Eb", "Fm", "C"]
+    main_key = "C Major"
+    records = find_borrowed_sources(detect_non_diatonic_notes(chords, main_key), main_key, chords)
+    occurrences = [i for i, chord in enumerate(chords) if chord == "Fm"]
+    fm_records = [record for record in records if record.chord == "Fm"]
+    assert len(fm_records) == len(occurrences) == 3
+    for index, record in zip(occurrences, fm_records):
+        assert as_tuples(record) == reference_candidates("Fm", main_key, occurrence_context(chords, index))
+    # 前後が異なる出現は信頼度も異なる（以前は全て最後の出現のコンテキストだった）
+    assert as_tuples(fm_records[0]) != as_tuples(fm_records[1])
+    print("✅ 出現ごとのコンテキスト")
+
+def test_occurrences_without_index():
+    """'index'の無い入力は進行内の出現を順にたどる"""
+    chords = ["C", "Fm", "C", "G7", "Fm", "Bb"]
+    detected = detect_non_diatonic_notes(chords, "C Major")
+    without_index = [{'chord': info['chord'], 'non_diatonic_notes': info['non_diatonic_notes']} for info in detected]
+    assert ([as_tuples(r) for r in find_borrowed_sources(without_index, "C Major", chords)]
+            == [as_tuples(r) for r in find_borrowed_sources(detected, "C Major", chords)])
+
+def test_looping_progression_is_scored_once_per_situation():
+    chords = ["Am7", "D7", "Fm6", "C"] * 200
+    score_source_candidates.cache_clear()
+    records = find_borrowed_sources(detect_non_diatonic_notes(chords, "C Major"), "C Major", chords)
+    info = score_source_candidates.cache_info()
+    assert len(records) == 400
+    assert info.misses == 2, info  # D7とFm6（前後が同じなので以降は全てキャッシュ）
+    print(f"✅ ループする進行: {len(records)}件の借用和音を{info.misses}回の計算で採点")
+
+if __name__ == "__main__":
+    test_matches_full_sort()
+    test_ties_keep_key_order()
+    test_each_occurrence_uses_its_own_context()
+    test_occurrences_without_index()
+    test_looping_progression_is_scored_once_per_situation()
+    print("\n=== Test completed ===")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+fields指定（スパースフィールドセット）と段階スキップのテスト
+"""
+
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import ChordAnalysisRequest, run_analysis, select_fields, encode_json, analyze_chord_progression
+from fastapi import HTTPException
+
+PROGRESSIONS = ["[CM7][Am7][FM7][G7]", "[C][Fm][Ab][G7(b9)]", "[Am][F][C][G]"]
+ALGORITHMS = ["hybrid", "traditional", "borrowed_chord_minimal", "triad_ratio"]
+
+def test_main_key_only_matches_full_analysis():
+    """main_keyのみ要求しても、全項目分析と同じキーになること"""
+    print("=== main_key only ===")
+    for chord_input in PROGRESSIONS:
+        for algorithm in ALGORITHMS:
+            full = run_analysis(ChordAnalysisRequest(chord_input=chord_input, algorithm=algorithm))
+            sparse = run_analysis(ChordAnalysisRequest(chord_input=chord_input, algorithm=algorithm, fields=["main_key", "confidence"]))
+            print(f"{chord_input} ({algorithm}): {sparse.main_key}")
+            assert sparse.main_key == full.main_key
+            assert sparse.confidence == full.confidence
+
+def test_skipped_stages_are_not_run():
+    """要求されていない段階（ボイシング・借用元探索）が実行されないこと"""
+    calls = {"voicing": 0, "borrowed": 0}
+    original_voicing = main.get_chord_components_with_voicing
+    original_borrowed = main.find_borrowed_sources
+
+    def counting_voicing(*args, **kwargs):
+        calls["voicing"] += 1
+        return original_voicing(*args, **kwargs)
+
+    def counting_borrowed(*args, **kwargs):
+        calls["borrowed"] += 1
+        return original_borrowed(*args, **kwargs)
+
+    main.get_chord_components_with_voicing = counting_voicing
+    main.find_borrowed_sources = counting_borrowed
+    try:
+        run_analysis(ChordAnalysisRequest(chord_input="[C][Fm][C]", fields=["main_key"]))
+        assert calls == {"voicing": 0, "borrowed": 0}
+        run_analysis(ChordAnalysisRequest(chord_input="[C][Fm][C]"))
+        assert calls["voicing"] == 3 and calls["borrowed"] == 1
+    finally:
+        main.get_chord_components_with_voicing = original_voicing
+        main.find_borrowed_sources = original_borrowed
+
+def test_sparse_payload_contains_only_requested_fields():
+    request = ChordAnalysisRequest(chord_input="[C][Fm][C]", fields=["progression_details", "main_key"])
+    payload = json.loads(encode_json(select_fields(run_analysis(request), request.fields)))
+    # 順序はレスポンススキーマの順
+    assert list(payload.keys()) == ["main_key", "progression_details"]
+
+def test_unknown_field_is_rejected():
+    try:
+        asyncio.run(analyze_chord_progression(ChordAnalysisRequest(chord_input="[C]", fields=["nope"])))
+    except HTTPException as e:
+        assert e.status_code == 422
+    else:
+        raise AssertionError("unknown field was accepted")
+
+if __name__ == "__main__":
+    test_main_key_only_matches_full_analysis()
+    test_skipped_stages_are_not_run()
+    test_sparse_payload_contains_only_requested_fields()
+    test_unknown_field_is_rejected()
+    print("\n=== Test completed ===")
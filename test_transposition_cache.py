@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+移調で共有するキー照合結果（コードごとのルート相対の代表 + 移調量）のテスト
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main import (
+    get_all_keys, get_chord_components, note_index, get_diatonic_notes, normalize_note, is_valid_chord,
+    chord_canonical_form, canonical_key_membership, chord_key_membership,
+    find_key_by_borrowed_chord_minimization, detect_non_diatonic_notes,
+)
+
+def reference_minimization(chords):
+    """照合表導入前の実装（キーごとに構成音を音名で照合）"""
+    best_key, min_borrowed_count, best_confidence = None, float('inf'), 0
+    for key in get_all_keys():
+        diatonic = [normalize_note(note) for note in get_diatonic_notes(key)]
+        borrowed_count = total = matching = 0
+        for chord_symbol in chords:
+            notes = get_chord_components(chord_symbol)
+            total += len(notes)
+            if any(normalize_note(note) not in diatonic for note in notes):
+                borrowed_count += 1
+            matching += sum(1 for note in notes if normalize_note(note) in diatonic)
+        confidence = matching / total if total > 0 else 0
+        if borrowed_count < min_borrowed_count or (borrowed_count == min_borrowed_count and confidence > best_confidence):
+            best_key, min_borrowed_count, best_confidence = key, borrowed_count, confidence
+    return best_key, best_confidence, min_borrowed_count
+
+def reference_non_diatonic(chords, key):
+    diatonic = [normalize_note(note) for note in get_diatonic_notes(key)]
+    result = []
+    for index, chord_symbol in enumerate(chords):
+        notes = [note for note in get_chord_components(chord_symbol) if normalize_note(note) not in diatonic]
+        if notes:
+            result.append({'chord': chord_symbol, 'non_diatonic_notes': notes, 'index': index})
+    return result
+
+def test_transpositions_share_canonical_form():
+    canonical, offset = chord_canonical_form("Dm7")
+    transposed, transposed_offset = chord_canonical_form("Em7")
+    flat_spelled, flat_offset = chord_canonical_form("Fm7")
+    assert canonical == transposed == flat_spelled != chord_canonical_form("D7")[0]
+    assert (transposed_offset - offset) % 12 == 2
+    assert (flat_offset - offset) % 12 == 3
+    print(f"✅ 移調の代表が一致（移調量 {offset}, {transposed_offset}, {flat_offset}）")
+
+def test_cached_table_is_reused_across_transpositions():
+    progression = ["Am7(9)", "D7(13)", "GM7", "Cm6"]
+    roots = ["C", "Db", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+    canonical_key_membership.cache_clear()
+    chord_key_membership.cache_clear()
+    classes = set()
+    for shift in range(12):
+        # 各コードのルートをshift半音移調する
+        chords = []
+        for chord in progression:
+            root = chord[:2] if len(chord) > 1 and chord[1] in "#b" else chord[:1]
+            chords.append(roots[(note_index(root) + shift) % 12] + chord[len(root):])
+        assert find_key_by_borrowed_chord_minimization(chords) == reference_minimization(chords)
+        classes.update(chord_canonical_form(chord)[0] for chord in chords)
+    # Cb・Fb・E#のように綴られる移調（どのキーでもダイアトニックにならない音名を含む）は別の代表になる
+    info = canonical_key_membership.cache_info()
+    assert info.misses == len(classes) < 12 and info.hits == 48 - len(classes), info
+    print(f"✅ 12移調（48コード）で照合結果の計算は{info.misses}回")
+
+def test_cache_does_not_grow_with_progression_length():
+    """キャッシュはコード単位で、長い進行を多数分析しても保持する量は語彙の大きさで決まること"""
+    vocabulary = ["C", "Am", "F", "G7", "Fm", "Bb7", "E7", "Dm7"]
+    rng = random.Random(1)
+    chord_key_membership.cache_clear()
+    for _ in range(5):
+        chords = [rng.choice(vocabulary) for _ in range(500)]
+        assert find_key_by_borrowed_chord_minimization(chords) == reference_minimization(chords)
+    assert chord_key_membership.cache_info().currsize == len(vocabulary)
+
+def test_matches_reference_on_random_progressions():
+    """異名同音・正規化できない音名（Cb, E#など）を含む進行でも直接計算と完全に一致すること"""
+    roots = ['C', 'C#', 'Db', 'D', 'D#', 'Eb', 'E', 'Fb', 'E#', 'F', 'F#', 'Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B', 'Cb', 'B#']
+    qualities = ['', 'm', '7', 'M7', 'm7', 'dim', 'aug', 'sus4', '7(b9)', 'm7b5', '9', '13', 'add9', 'M7(13)', 'dim7', 'mM7']
+    rng = random.Random(0)
+    for _ in range(500):
+        chords = [c for c in (rng.choice(roots) + rng.choice(qualities) for _ in range(rng.randint(1, 10))) if is_valid_chord(c)]
+        assert find_key_by_borrowed_chord_minimization(chords) == reference_minimization(chords), chords
+        for key in get_all_keys() + ["Db Major", "C Harmonic Minor"]:
+            assert detect_non_diatonic_notes(chords, key) == reference_non_diatonic(chords, key), (chords, key)
+    print("✅ ランダムな進行で直接計算と一致")
+
+def test_tie_break_follows_key_order():
+    """同数・同信頼度の平行調はget_all_keysの順（先に現れるキー）が選ばれること"""
+    assert find_key_by_borrowed_chord_minimization(["Fm7", "Bb7", "EbM7"]) == reference_minimization(["Fm7", "Bb7", "EbM7"])
+    assert find_key_by_borrowed_chord_minimization(["Fm7", "Bb7", "EbM7"])[0] == "C Minor"
+
+if __name__ == "__main__":
+    test_transpositions_share_canonical_form()
+    test_cached_table_is_reused_across_transpositions()
+    test_cache_does_not_grow_with_progression_length()
+    test_matches_reference_on_random_progressions()
+    test_tie_break_follows_key_order()
+    print("\n=== Test completed ===")
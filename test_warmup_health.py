@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+起動時ウォームアップとライブネス/レディネスエンドポイントのテスト
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from main import READINESS, healthz, readyz, warmup, get_warmup_progressions, parse_chord
+
+def test_readiness_follows_warmup():
+    READINESS.clear()
+    assert asyncio.run(healthz()) == {"status": "ok"}
+    response = asyncio.run(readyz())
+    print(f"before warmup: {response.status_code}")
+    assert response.status_code == 503
+
+    warmup()
+    print(f"after warmup: {asyncio.run(readyz())}")
+    assert asyncio.run(readyz()) == {"status": "ready"}
+
+def test_failed_warmup_still_sets_readiness():
+    """ウォームアップ中の例外は記録して続行し、/readyzが503のまま残らないこと"""
+    original = main.run_analysis
+    analyzed = []
+
+    def failing_run_analysis(request, *args, **kwargs):
+        if request.chord_input == "[C][G]":
+            raise RuntimeError("broken progression")
+        analyzed.append(request.chord_input)
+        return original(request, *args, **kwargs)
+
+    saved = os.environ.get("WARMUP_PROGRESSIONS")
+    READINESS.clear()
+    main.run_analysis = failing_run_analysis
+    os.environ["WARMUP_PROGRESSIONS"] = "[C][G]; [Am][Dm]"
+    try:
+        warmup()
+    finally:
+        main.run_analysis = original
+        if saved is None:
+            del os.environ["WARMUP_PROGRESSIONS"]
+        else:
+            os.environ["WARMUP_PROGRESSIONS"] = saved
+    assert "[Am][Dm]" in analyzed
+    assert asyncio.run(readyz()) == {"status": "ready"}
+
+def test_warmup_primes_parse_cache():
+    parse_chord.cache_clear()
+    warmup()
+    assert parse_chord.cache_info().currsize > 0
+    hits = parse_chord.cache_info().hits
+    parse_chord("G7")
+    assert parse_chord.cache_info().hits == hits + 1
+
+def test_warmup_progressions_from_environment():
+    saved = os.environ.get("WARMUP_PROGRESSIONS")
+    try:
+        os.environ["WARMUP_PROGRESSIONS"] = "[C][G]; [Am][Dm]"
+        assert get_warmup_progressions() == ["[C][G]", "[Am][Dm]"]
+        os.environ["WARMUP_PROGRESSIONS"] = ""
+        assert get_warmup_progressions() == []
+        del os.environ["WARMUP_PROGRESSIONS"]
+        assert get_warmup_progressions() == main.DEFAULT_WARMUP_PROGRESSIONS
+    finally:
+        if saved is not None:
+            os.environ["WARMUP_PROGRESSIONS"] = saved
+
+if __name__ == "__main__":
+    test_readiness_follows_warmup()
+    test_failed_warmup_still_sets_readiness()
+    test_warmup_primes_parse_cache()
+    test_warmup_progressions_from_environment()
+    print("\n=== Test completed ===")